@@ -27,37 +27,39 @@ fi
 # Step 1: Fetch data (or restore from S3 if skipping)
 if test "$SKIP_GET" = 1; then
     echo "Skipping data fetch, restoring from S3..."
+    aws s3 cp "$S3BASE"/endpoints.json web/zola/static/endpoints.json
     aws s3 cp "$S3BASE"/endpoints.text web/zola/static/endpoints.text
 else
     scripts/fetch-data.sh $LIVE_ARG
 fi
 
-# Step 2: Generate changes file
+# Step 2: Detect changes against the previous run; the changes store is
+# also written as the public text file `changes`
+changes_db="web/zola/static/changes.sqlite"
 changes_output="web/zola/static/changes"
-changes_prev=$(mktemp /tmp/awsipv6-changes_prev.XXXXXX)
-changes_today=$(mktemp /tmp/awsipv6-changes_today.XXXXXX)
-endpoints_text_prev=$(mktemp /tmp/awsipv6-text_prev.XXXXXX)
-trap "rm -f $changes_today $changes_prev $endpoints_text_prev" INT TERM EXIT
+changes_legacy=$(mktemp /tmp/awsipv6-changes_legacy.XXXXXX)
+endpoints_json_prev=$(mktemp /tmp/awsipv6-json_prev.XXXXXX)
+trap "rm -f $changes_legacy $endpoints_json_prev" INT TERM EXIT
 
-today=$(date +%Y-%m-%d)
+aws s3 cp "$S3BASE"/endpoints.json "$endpoints_json_prev"
 
-aws s3 cp "$S3BASE"/changes "$changes_prev"
-aws s3 cp "$S3BASE"/endpoints.text "$endpoints_text_prev"
+# Only a missing changes store means this is the first run with it. `aws s3
+# ls` exits with 1 if nothing matches; any other failure (credentials,
+# network) aborts here, so a new store is never uploaded over the real one.
+changes_db_listing=$(aws s3 ls "$S3BASE"/changes.sqlite) || test $? = 1
 
-diff -wu0 "$endpoints_text_prev" web/zola/static/endpoints.text \
-    | sed 1,2d \
-    | grep -v 'amazonwebservices.com.cn ' \
-    | grep -v 'amazonaws.com.cn ' \
-    | grep '^[-+]' \
-    > "$changes_today" \
-    || true
-
-: > "$changes_output"
-if test -s "$changes_today"; then
-    echo "$today" >> "$changes_output"
-    cat "$changes_today" >> "$changes_output"
+legacy_arg=""
+if echo "$changes_db_listing" | grep -q ' changes\.sqlite$'; then
+    aws s3 cp "$S3BASE"/changes.sqlite "$changes_db"
+else
+    # First run with the changes store: take over the old text changes file
+    rm -f "$changes_db"
+    aws s3 cp "$S3BASE"/changes "$changes_legacy"
+    legacy_arg="--import-legacy $changes_legacy"
 fi
-cat "$changes_prev" >> "$changes_output"
+
+python3 update-data/awsipv6-changes.py $legacy_arg --write-text "$changes_output" \
+    "$endpoints_json_prev" web/zola/static/endpoints.json "$changes_db"
 
 # Step 3: Generate static files
 scripts/generate.sh
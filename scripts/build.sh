@@ -11,18 +11,13 @@ npx tailwindcss -i web/misc/uglyshit.tailwind -o web/zola/static/assets/uglyshit
 # Copy HTMX
 cp node_modules/htmx.org/dist/htmx.min.js web/zola/static/assets/htmx.min.js
 
-# Copy SQLite with workaround for CloudFront compression
-cp web/zola/static/endpoints.sqlite web/zola/static/endpoints-matrix/assets/endpoints.sqlite--but.cloudfront.does.not.want.to.compress.binary.data.so.lets.just.call.it.xml
-
-# Copy sql.js
-rsync -a --delete node_modules/sql.js/dist/ web/zola/static/endpoints-matrix/assets/sql.js/
-
 # Copy static assets
 rsync -a web/misc/static/ web/zola/static/
 
-# Gzip JSON and SQLite for smaller downloads
-gzip --best --keep --force web/zola/static/endpoints.sqlite
-gzip --best --keep --force web/zola/static/endpoints.json
+# Compress downloads and tooltips, skipping unchanged files. Only gzip: the
+# S3 deploy doesn't set Content-Encoding, so .br files wouldn't be served
+# as brotli-encoded anyway.
+python3 web/build/compress-assets.py --no-brotli
 
 # Build Zola site
 zola --root web/zola build --base-url "$URLBASE" --force
@@ -6,6 +6,16 @@ set -e
 BOTOCORE_REPO=~/environment/botocore
 LIVE_ARG="${1:-}"
 
+# Files kept between runs (see the cache step of the deploy workflow), one
+# set per mode, as test and live runs cover different services:
+# - region table and availability index: rebuilt when botocore's version changes
+# - incremental state: only cells whose botocore data changed are looked up
+#   via botocore again (all cells are still resolved via DNS)
+# The DNS cache stays off: runs are a day apart, longer than its TTL.
+STATE_DIR=~/environment/awsipv6-state
+STATE_MODE="${LIVE_ARG:+live}"
+STATE_PREFIX="$STATE_DIR/${STATE_MODE:-test}"
+
 if ! test -d "$BOTOCORE_REPO"; then
     git clone -b master https://github.com/boto/botocore.git "$BOTOCORE_REPO"
     sed -i.orig "s/^__version__ = '/__version__ = 'awsipv6-git-/" "$BOTOCORE_REPO/botocore/__init__.py"
@@ -13,4 +23,9 @@ else
     ( cd "$BOTOCORE_REPO" && git pull )
 fi
 
-python3 -u update-data/awsipv6-get.py "$BOTOCORE_REPO" $LIVE_ARG
+mkdir -p "$STATE_DIR"
+
+python3 -u update-data/awsipv6-get.py "$BOTOCORE_REPO" $LIVE_ARG \
+    --region-table "$STATE_PREFIX-regions.pickle" \
+    --availability-index "$STATE_PREFIX-availability.pickle" \
+    --incremental "$STATE_PREFIX-incremental.json"
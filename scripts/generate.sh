@@ -16,6 +16,4 @@ for dir in \
 done
 
 # Run all generate-*.py scripts
-for f in web/build/generate*py; do
-    python3 $f
-done
+python3 web/build/build-pages.py
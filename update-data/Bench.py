@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Benchmark helpers
+
+Measures pipeline stages (see awsipv6-bench.py) and compares the results
+with a stored baseline.
+
+Each stage runs in a forked child process, so that its peak RSS isn't
+hidden by earlier stages, and state it leaves behind (caches, open files)
+doesn't affect later ones. In the child, the stage runs `repeat` times for
+timing (best run counts), then once more under tracemalloc for memory:
+
+- seconds: wall time of the best run
+- throughput: items per second of the best run
+- peak_rss_kb: peak resident set size of the child (ru_maxrss), before the
+  tracemalloc run; includes what the child inherited from the parent
+- peak_alloc_bytes: peak of memory allocated by Python during the stage
+- alloc_blocks: number of memory blocks allocated during the stage that
+  were still alive at its end
+
+Functions:
+- synthetic_endpoint_records: Full-size endpoint matrix with made-up DNS results
+- run_stage: Measure one stage
+- compare_results: Compare results with a baseline
+- load_results / save_results: Read / write results as JSON
+"""
+
+import gc
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import time
+import tracemalloc
+import traceback
+
+from Endpoints import EndpointRecord, EndpointResult, NOT_AVAILABLE
+
+
+# Share of cells with an endpoint, of those with an IPv6 default endpoint,
+# and of those with a dualstack endpoint (roughly the real proportions)
+SYNTHETIC_ENDPOINT_SHARE = 0.7
+SYNTHETIC_IPV6_DEFAULT_SHARE = 0.15
+SYNTHETIC_DUALSTACK_SHARE = 0.35
+
+# A stage is a regression if it is slower / allocates more than its
+# baseline by this share
+REGRESSION_THRESHOLD = 0.25
+
+# Metrics compared with the baseline, and whether higher is worse
+COMPARED_METRICS = {
+    'seconds': True,
+    'peak_alloc_bytes': True,
+}
+
+
+def synthetic_endpoint_records(service_names, all_regions, seed=0):
+    """
+    Build a full (service, region) matrix of endpoint records with made-up
+    hostnames and DNS results. Same arguments give the same records.
+
+    Args:
+        service_names: Iterable of service names
+        all_regions: Dict mapping region_name -> {description, partition}
+        seed: Random seed
+
+    Returns:
+        List of EndpointRecords, ordered by service and region
+    """
+    rng = random.Random(seed)
+    records = []
+
+    for service_name in sorted(service_names):
+        for region_name, region_data in sorted(all_regions.items()):
+            partition_name = region_data['partition']
+            suffix = "amazonaws.com.cn" if partition_name == "aws-cn" else "amazonaws.com"
+
+            endpoint_default = NOT_AVAILABLE
+            endpoint_dualstack = NOT_AVAILABLE
+            if rng.random() < SYNTHETIC_ENDPOINT_SHARE:
+                endpoint_default = EndpointResult(
+                    f"{service_name}.{region_name}.{suffix}",
+                    True,
+                    rng.random() < SYNTHETIC_IPV6_DEFAULT_SHARE,
+                )
+                if not endpoint_default.has_ipv6 and rng.random() < SYNTHETIC_DUALSTACK_SHARE:
+                    endpoint_dualstack = EndpointResult(f"{service_name}.{region_name}.api.aws", True, True)
+
+            records.append(EndpointRecord.create(
+                service_name, partition_name, region_name, endpoint_default, endpoint_dualstack
+            ))
+
+    return records
+
+
+def _measure(fn, repeat):
+    """Measure fn() in this process; see the module docstring."""
+    items = None
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        items = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        fn()
+        _current, peak_alloc_bytes = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    alloc_blocks = sum(
+        stat.count_diff
+        for stat in after.compare_to(before, 'filename')
+        if stat.count_diff > 0
+    )
+
+    return {
+        'seconds': best,
+        'items': items,
+        'throughput': items / best if items and best else None,
+        'peak_rss_kb': peak_rss_kb,
+        'peak_alloc_bytes': peak_alloc_bytes,
+        'alloc_blocks': alloc_blocks,
+    }
+
+
+def _stage_child(fn, repeat, conn):
+    try:
+        result = _measure(fn, repeat)
+    except Exception:
+        result = {'error': traceback.format_exc(limit=3).strip().splitlines()[-1]}
+    conn.send(result)
+    conn.close()
+
+
+def run_stage(fn, repeat=3):
+    """
+    Measure one stage in a forked child process.
+
+    Args:
+        fn: Function running the stage once; returns the number of items
+            it processed (for throughput), or None
+        repeat: Number of timed runs
+
+    Returns:
+        dict with seconds, items, throughput, peak_rss_kb, peak_alloc_bytes,
+        alloc_blocks (see module docstring); or with `error` if the stage
+        raised an exception
+    """
+    ctx = multiprocessing.get_context('fork')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_stage_child, args=(fn, repeat, child_conn))
+    process.start()
+    child_conn.close()
+
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        result = {'error': f"stage process died (exit code {process.exitcode})"}
+    process.join()
+
+    return result
+
+
+def environment():
+    """Get a description of where the benchmark ran, stored with results."""
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': multiprocessing.cpu_count(),
+    }
+
+
+def compare_results(stages, baseline_stages, threshold=REGRESSION_THRESHOLD):
+    """
+    Compare stage results with a baseline.
+
+    Args:
+        stages: Dict mapping stage name -> result of run_stage()
+        baseline_stages: Same, from the baseline
+        threshold: See REGRESSION_THRESHOLD
+
+    Returns:
+        Dict mapping stage name -> {metric: ratio new / baseline}, for
+        stages and metrics present in both; and a list of regressions as
+        (stage name, metric, ratio)
+    """
+    ratios = {}
+    regressions = []
+
+    for stage_name, result in stages.items():
+        baseline = baseline_stages.get(stage_name)
+        if baseline is None or 'error' in result or 'error' in baseline:
+            continue
+
+        ratios[stage_name] = {}
+        for metric, higher_is_worse in COMPARED_METRICS.items():
+            if not baseline.get(metric) or result.get(metric) is None:
+                continue
+
+            ratio = result[metric] / baseline[metric]
+            ratios[stage_name][metric] = ratio
+
+            if (ratio > 1 + threshold) if higher_is_worse else (ratio < 1 - threshold):
+                regressions.append((stage_name, metric, ratio))
+
+    return ratios, regressions
+
+
+def save_results(results, json_file):
+    with open(json_file, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+
+def load_results(json_file):
+    with open(json_file) as f:
+        return json.load(f)
+
+
+# =============================================================================
+__all__ = [
+    'synthetic_endpoint_records',
+    'run_stage',
+    'compare_results',
+    'environment',
+    'save_results',
+    'load_results',
+    'REGRESSION_THRESHOLD',
+]
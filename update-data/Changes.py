@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Change detection for endpoint data
+
+Compares two endpoint datasets cell by cell, keyed by (service, partition,
+region), and describes the differences as typed change events. Events are
+kept in a SQLite changes store, which the changes page is rendered from.
+
+Change kinds, per cell and endpoint variant (default / dualstack):
+- added / removed: default endpoint appeared / disappeared
+- dualstack_added / dualstack_removed: same for the dualstack endpoint
+- ipv6_gained / ipv6_lost: endpoint got / lost IPv6
+- changed: anything else (e.g. different hostname, IPv4 gained or lost)
+
+Functions / classes:
+- diff_endpoints: Compare two endpoint datasets
+- ChangeEvent: One change
+- ChangesStore: SQLite file with change events by date
+- event_text_lines: Events as diff lines of endpoints.text
+"""
+
+import os
+import pathlib
+import re
+import sqlite3
+import typing
+
+
+ADDED = 'added'
+REMOVED = 'removed'
+DUALSTACK_ADDED = 'dualstack_added'
+DUALSTACK_REMOVED = 'dualstack_removed'
+IPV6_GAINED = 'ipv6_gained'
+IPV6_LOST = 'ipv6_lost'
+CHANGED = 'changed'
+
+CHANGE_KINDS = [ADDED, REMOVED, DUALSTACK_ADDED, DUALSTACK_REMOVED, IPV6_GAINED, IPV6_LOST, CHANGED]
+
+# (hostname, has_ipv4, has_ipv6) of an endpoint that doesn't exist
+_NO_ENDPOINT = (None, False, False)
+
+CHANGE_EVENT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS change_event (
+        change_date TEXT,
+        kind TEXT,
+        service_name TEXT,
+        partition_name TEXT,
+        region_name TEXT,
+        variant TEXT,
+        old_hostname TEXT,
+        old_has_ipv4 INTEGER,
+        old_has_ipv6 INTEGER,
+        new_hostname TEXT,
+        new_has_ipv4 INTEGER,
+        new_has_ipv6 INTEGER
+    )
+"""
+
+# Lines of the text changes file used before this store, by date
+LEGACY_CHANGE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS legacy_change (
+        change_date TEXT,
+        line_number INTEGER,
+        line TEXT,
+        PRIMARY KEY (change_date, line_number)
+    )
+    WITHOUT ROWID
+"""
+
+CHANGES_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS change_event_date ON change_event (change_date)",
+]
+
+
+class ChangeEvent(typing.NamedTuple):
+    """
+    One change of one endpoint (see diff_endpoints).
+
+    `old` and `new` are (hostname, has_ipv4, has_ipv6) of the endpoint
+    before and after; (None, False, False) if it didn't / doesn't exist.
+    """
+
+    kind: str
+    service: str
+    partition: str
+    region: str
+    variant: str
+    old: tuple
+    new: tuple
+
+
+def _endpoint_tuple(endpoint):
+    """(hostname, has_ipv4, has_ipv6) of an endpoint dict or EndpointResult."""
+    if endpoint is None:
+        return _NO_ENDPOINT
+    if not isinstance(endpoint, dict):
+        endpoint = endpoint.to_dict()
+
+    hostname = endpoint.get('hostname')
+    if not hostname:
+        return _NO_ENDPOINT
+
+    return (hostname, bool(endpoint.get('has_ipv4')), bool(endpoint.get('has_ipv6')))
+
+
+def _cells(endpoints):
+    """
+    Index endpoints by cell.
+
+    Returns:
+        Dict mapping (service, partition, region) -> (default, dualstack),
+        each as (hostname, has_ipv4, has_ipv6)
+    """
+    cells = {}
+    for ep in endpoints:
+        # EndpointRecords (see Endpoints) have the same data as to_dict()
+        if not isinstance(ep, dict):
+            ep = ep.to_dict()
+
+        cells[(ep['service'], ep['partition'], ep['region'])] = (
+            _endpoint_tuple(ep.get('endpoint_default')),
+            _endpoint_tuple(ep.get('endpoint_dualstack')),
+        )
+
+    return cells
+
+
+def _variant_changes(variant, old, new):
+    """Get the change kinds for one endpoint variant of a cell."""
+    if old == new:
+        return []
+
+    old_exists = old[0] is not None
+    new_exists = new[0] is not None
+
+    if not old_exists:
+        return [ADDED if variant == 'default' else DUALSTACK_ADDED]
+    if not new_exists:
+        return [REMOVED if variant == 'default' else DUALSTACK_REMOVED]
+
+    kinds = []
+    if not old[2] and new[2]:
+        kinds.append(IPV6_GAINED)
+    elif old[2] and not new[2]:
+        kinds.append(IPV6_LOST)
+
+    if old[:2] != new[:2]:
+        kinds.append(CHANGED)
+
+    return kinds
+
+
+def _endpoint_text(endpoint, variant):
+    """An endpoint as line of endpoints.text (see Sinks.endpoint_text_lines)."""
+    (hostname, has_ipv4, has_ipv6) = endpoint
+    tags = [tag for tag, has_tag in [('ipv4', has_ipv4), ('ipv6', has_ipv6)] if has_tag]
+    tags_str = " [" + ", ".join(tags) + "]" if tags else ""
+    return f"{hostname}{tags_str} ({variant})"
+
+
+def event_text_lines(events):
+    """
+    Get events as diff lines of endpoints.text, like the old text changes file.
+
+    Args:
+        events: Iterable of ChangeEvents
+
+    Returns:
+        List of '-<old endpoint line>' / '+<new endpoint line>' strings;
+        an endpoint change with several kinds (e.g. ipv6_gained and
+        changed) gives one pair of lines
+    """
+    lines = []
+    seen = set()
+    for e in events:
+        if (e.service, e.partition, e.region, e.variant) in seen:
+            continue
+        seen.add((e.service, e.partition, e.region, e.variant))
+
+        if e.old[0] is not None:
+            lines.append("-" + _endpoint_text(e.old, e.variant))
+        if e.new[0] is not None:
+            lines.append("+" + _endpoint_text(e.new, e.variant))
+
+    return lines
+
+
+def diff_endpoints(old_endpoints, new_endpoints):
+    """
+    Compare two endpoint datasets.
+
+    Both datasets are indexed by cell once, and each cell is compared
+    once, so the comparison is linear in the number of cells. Cells
+    missing from a dataset count as having no endpoints.
+
+    Args:
+        old_endpoints: Iterable of endpoint dicts or EndpointRecords (previous run)
+        new_endpoints: Iterable of endpoint dicts or EndpointRecords (current run)
+
+    Returns:
+        List of ChangeEvents, ordered by service, partition, region and
+        variant (default first)
+    """
+    old_cells = _cells(old_endpoints)
+    new_cells = _cells(new_endpoints)
+
+    events = []
+    for key in sorted(old_cells.keys() | new_cells.keys()):
+        old_default, old_dualstack = old_cells.get(key, (_NO_ENDPOINT, _NO_ENDPOINT))
+        new_default, new_dualstack = new_cells.get(key, (_NO_ENDPOINT, _NO_ENDPOINT))
+
+        for variant, old, new in [
+            ('default', old_default, new_default),
+            ('dualstack', old_dualstack, new_dualstack),
+        ]:
+            for kind in _variant_changes(variant, old, new):
+                events.append(ChangeEvent(kind, *key, variant, old, new))
+
+    return events
+
+
+class ChangesStore:
+    """SQLite file with change events, by date."""
+
+    def __init__(self, path, read_only=False):
+        """
+        Args:
+            path: Path to the SQLite file (created if missing, unless read_only)
+            read_only: Open an existing file read-only, e.g. for rendering
+
+        Raises:
+            sqlite3.OperationalError: read_only and the file doesn't exist
+        """
+        self.path = path
+        if read_only:
+            uri = pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True)
+            return
+
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute(CHANGE_EVENT_SCHEMA)
+            self._conn.execute(LEGACY_CHANGE_SCHEMA)
+            for index_sql in CHANGES_INDEXES:
+                self._conn.execute(index_sql)
+
+    def add(self, change_date, events):
+        """
+        Add the events of one date to those already stored for it.
+
+        Several runs on one day each add their changes. An event of the same
+        cell, variant and kind as a stored one replaces it, so adding the
+        same events again doesn't duplicate them, and adding no events
+        changes nothing.
+
+        Args:
+            change_date: Date as 'YYYY-MM-DD'
+            events: Iterable of ChangeEvents
+        """
+        events = list(events)
+        if not events:
+            return
+
+        with self._conn:
+            self._conn.executemany("""
+                DELETE FROM change_event
+                WHERE change_date = ?
+                AND service_name = ? AND partition_name = ? AND region_name = ?
+                AND variant = ? AND kind = ?
+            """, (
+                (change_date, e.service, e.partition, e.region, e.variant, e.kind)
+                for e in events
+            ))
+            self._conn.executemany("""
+                INSERT INTO change_event (
+                    change_date, kind, service_name, partition_name, region_name, variant,
+                    old_hostname, old_has_ipv4, old_has_ipv6,
+                    new_hostname, new_has_ipv4, new_has_ipv6
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                (change_date, e.kind, e.service, e.partition, e.region, e.variant, *e.old, *e.new)
+                for e in events
+            ))
+
+    def import_legacy(self, changes_file):
+        """
+        Import the text changes file used before this store.
+
+        That file has date lines ('YYYY-MM-DD'), each followed by the
+        diff lines ('+hostname ...' / '-hostname ...') of that date.
+        Importing the same file again replaces the lines of its dates.
+
+        Args:
+            changes_file: Path to the text file
+
+        Returns:
+            Number of lines imported
+        """
+        rows = []
+        change_date = None
+        with open(changes_file) as f:
+            for line in f:
+                line = line.strip()
+                if re.match(r'^\d{4}-\d{2}-\d{2}$', line):
+                    change_date = line
+                    line_number = 0
+                elif line and change_date is not None:
+                    rows.append((change_date, line_number, line))
+                    line_number += 1
+
+        with self._conn:
+            self._conn.executemany("""
+                INSERT OR REPLACE INTO legacy_change (change_date, line_number, line)
+                VALUES (?, ?, ?)
+            """, rows)
+
+        return len(rows)
+
+    def dates(self, exclude_partitions=(), limit=None):
+        """
+        Get the dates that have changes, newest first.
+
+        Args:
+            exclude_partitions: Partition names whose changes don't count
+            limit: Maximum number of dates
+
+        Returns:
+            List of 'YYYY-MM-DD'
+        """
+        sql = f"""
+            SELECT change_date FROM change_event
+            WHERE partition_name NOT IN ({", ".join("?" * len(exclude_partitions))})
+            UNION
+            SELECT change_date FROM legacy_change
+            ORDER BY change_date DESC
+        """
+        params = list(exclude_partitions)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        return [change_date for (change_date,) in self._conn.execute(sql, params)]
+
+    def events(self, change_date, exclude_partitions=(), kinds=None):
+        """
+        Get the events of one date.
+
+        Args:
+            change_date: Date as 'YYYY-MM-DD'
+            exclude_partitions: Partition names to leave out
+            kinds: Change kinds to include (default: all)
+
+        Returns:
+            List of ChangeEvents, ordered by service, partition, region and variant
+        """
+        kinds = CHANGE_KINDS if kinds is None else list(kinds)
+        cur = self._conn.execute(f"""
+            SELECT
+                kind, service_name, partition_name, region_name, variant,
+                old_hostname, old_has_ipv4, old_has_ipv6,
+                new_hostname, new_has_ipv4, new_has_ipv6
+            FROM change_event
+            WHERE change_date = ?
+            AND partition_name NOT IN ({", ".join("?" * len(exclude_partitions))})
+            AND kind IN ({", ".join("?" * len(kinds))})
+            ORDER BY service_name, partition_name, region_name, variant
+        """, (change_date, *exclude_partitions, *kinds))
+
+        return [
+            ChangeEvent(*row[:5], (row[5], bool(row[6]), bool(row[7])), (row[8], bool(row[9]), bool(row[10])))
+            for row in cur
+        ]
+
+    def legacy_lines(self, change_date):
+        """
+        Get the imported text changes of one date.
+
+        Returns:
+            List of diff lines, in file order
+        """
+        return [
+            line
+            for (line,) in self._conn.execute(
+                "SELECT line FROM legacy_change WHERE change_date = ? ORDER BY line_number",
+                (change_date,),
+            )
+        ]
+
+    def write_text(self, path, exclude_partitions=()):
+        """
+        Write all changes as text file, in the format of the old text
+        changes file (see import_legacy()): dates newest first, each
+        followed by its diff lines.
+
+        Args:
+            path: Path to the text file
+            exclude_partitions: Partition names to leave out (legacy lines
+                are written as imported)
+        """
+        with open(f"{path}.tmp", "w") as f:
+            for change_date in self.dates(exclude_partitions):
+                lines = event_text_lines(self.events(change_date, exclude_partitions))
+                lines += self.legacy_lines(change_date)
+                if lines:
+                    print(change_date, file=f)
+                    for line in lines:
+                        print(line, file=f)
+        os.replace(f"{path}.tmp", path)
+
+    def close(self):
+        self._conn.close()
+
+
+# =============================================================================
+__all__ = [
+    'diff_endpoints',
+    'ChangeEvent',
+    'ChangesStore',
+    'event_text_lines',
+    'CHANGE_KINDS',
+    'ADDED',
+    'REMOVED',
+    'DUALSTACK_ADDED',
+    'DUALSTACK_REMOVED',
+    'IPV6_GAINED',
+    'IPV6_LOST',
+    'CHANGED',
+]
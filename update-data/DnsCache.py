@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Persistent DNS result cache
+
+Keeps the results of resolve_endpoints() in a small SQLite file, so that
+repeated runs only go to the network for hostnames whose entry has expired.
+
+Each entry stores whether the hostname has IPv4 / IPv6 addresses, when it
+was resolved, and how long the entry is valid. Negative answers (neither
+IPv4 nor IPv6, e.g. NXDOMAIN) use a separate, usually shorter TTL. Expired
+entries are kept for a while, so that a lookup that fails (e.g. SERVFAIL)
+can fall back to the last known result.
+"""
+
+import os
+import sqlite3
+import time
+
+
+# Default TTLs in seconds
+DNS_CACHE_TTL = 12 * 3600
+DNS_CACHE_NEGATIVE_TTL = 3600
+
+# Expired entries are kept this long, as fallback for failed lookups
+DNS_CACHE_MAX_STALE = 7 * 86400
+
+
+class DnsCache:
+    """
+    SQLite-backed cache of DNS results, keyed by hostname.
+
+    The database connection is opened on first use in each process, so a
+    DnsCache can be handed to collect_endpoints() workers.
+    """
+
+    def __init__(self, path, ttl=DNS_CACHE_TTL, negative_ttl=DNS_CACHE_NEGATIVE_TTL):
+        """
+        Args:
+            path: Path to the SQLite file (created if missing)
+            ttl: Seconds a positive answer stays valid
+            negative_ttl: Seconds a negative answer stays valid
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._conn = None
+        self._conn_pid = None
+
+    def _connection(self):
+        if self._conn is None or self._conn_pid != os.getpid():
+            # timeout: workers may write to the same file concurrently
+            self._conn = sqlite3.connect(self.path, timeout=60)
+            self._conn_pid = os.getpid()
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS dns_result (
+                    hostname TEXT PRIMARY KEY,
+                    has_ipv4 INTEGER,
+                    has_ipv6 INTEGER,
+                    resolved_at REAL,
+                    ttl REAL
+                )
+                WITHOUT ROWID
+            """)
+
+        return self._conn
+
+    def lookup(self, hostnames, now=None, include_expired=False):
+        """
+        Look up cached results.
+
+        Args:
+            hostnames: Iterable of hostnames
+            now: Current time (default: time.time())
+            include_expired: Also return expired entries (e.g. as fallback
+                for hostnames whose lookup failed)
+
+        Returns:
+            Dict mapping hostname -> (has_ipv4, has_ipv6), for hostnames
+            with an entry that hasn't expired yet (or any entry, with
+            include_expired)
+        """
+        if now is None:
+            now = time.time()
+        if include_expired:
+            now = float('-inf')
+
+        conn = self._connection()
+        results = {}
+
+        hostnames = list(hostnames)
+        # stay below SQLite's limit of host parameters per statement
+        for i in range(0, len(hostnames), 500):
+            chunk = hostnames[i:i + 500]
+            cur = conn.execute(f"""
+                SELECT hostname, has_ipv4, has_ipv6
+                FROM dns_result
+                WHERE hostname IN ({", ".join("?" * len(chunk))})
+                AND resolved_at + ttl > ?
+            """, (*chunk, now))
+
+            for (hostname, has_ipv4, has_ipv6) in cur:
+                results[hostname] = (bool(has_ipv4), bool(has_ipv6))
+
+        return results
+
+    def store(self, results, now=None):
+        """
+        Store results.
+
+        Args:
+            results: Dict mapping hostname -> (has_ipv4, has_ipv6)
+            now: Time of resolution (default: time.time())
+        """
+        if now is None:
+            now = time.time()
+
+        conn = self._connection()
+        with conn:
+            conn.executemany("""
+                INSERT INTO dns_result (hostname, has_ipv4, has_ipv6, resolved_at, ttl)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(hostname) DO UPDATE SET
+                    has_ipv4=excluded.has_ipv4,
+                    has_ipv6=excluded.has_ipv6,
+                    resolved_at=excluded.resolved_at,
+                    ttl=excluded.ttl
+            """, [
+                (
+                    hostname,
+                    int(has_ipv4),
+                    int(has_ipv6),
+                    now,
+                    self.ttl if (has_ipv4 or has_ipv6) else self.negative_ttl,
+                )
+                for hostname, (has_ipv4, has_ipv6) in results.items()
+            ])
+
+    def purge(self, now=None, max_stale=0):
+        """
+        Delete expired entries.
+
+        Args:
+            now: Current time (default: time.time())
+            max_stale: Keep entries until they have been expired for this
+                many seconds (see lookup(include_expired=True))
+        """
+        if now is None:
+            now = time.time()
+
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM dns_result WHERE resolved_at + ttl + ? <= ?", (max_stale, now))
+
+    def close(self):
+        if self._conn is not None and self._conn_pid == os.getpid():
+            self._conn.close()
+        self._conn = None
+        self._conn_pid = None
+
+    def __getstate__(self):
+        # connections can't be pickled; reopened on first use
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_conn_pid'] = None
+        return state
+
+
+# =============================================================================
+__all__ = [
+    'DnsCache',
+    'DNS_CACHE_TTL',
+    'DNS_CACHE_NEGATIVE_TTL',
+    'DNS_CACHE_MAX_STALE',
+]
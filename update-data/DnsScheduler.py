@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Adaptive DNS probe scheduling
+
+Runs the DNS lookups of resolve_endpoints() with retries and an adaptive
+concurrency limit, so that resolver trouble during a large run doesn't turn
+into endpoints that seem to have disappeared.
+
+Each lookup ends in one of three outcomes:
+- resolved: (has_ipv4, has_ipv6) of the hostname
+- not found: the resolver says the name doesn't exist (NXDOMAIN) or has
+  no addresses; final, result (False, False)
+- unresolved: every attempt failed for a reason that may go away (SERVFAIL,
+  timeout, ...); result None, i.e. "unknown", never "not found"
+
+Failed attempts are retried with exponential backoff and jitter. The number
+of lookups in flight is adjusted after every `window` attempts: it is halved
+when the share of transient errors or the median latency is too high, and
+grows by one when the window had no errors (additive increase /
+multiplicative decrease, as in TCP congestion control).
+
+Lookups are done by a resolver backend (see Resolvers), by default the
+system resolver.
+
+Classes:
+- ProbeScheduler: Resolve many hostnames with retries and adaptive concurrency
+"""
+
+import asyncio
+import collections
+import random
+import statistics
+import time
+
+from Metrics import METRICS
+from Resolvers import SystemResolver, TransientDnsError
+
+
+# Attempts per hostname, and backoff before a retry: base * 2^(retry - 1),
+# at most PROBE_BACKOFF_MAX, times a random factor between 0.5 and 1
+PROBE_MAX_ATTEMPTS = 4
+PROBE_BACKOFF_BASE = 0.5
+PROBE_BACKOFF_MAX = 8.0
+
+# Concurrency adjustment: number of attempts per window, and the share of
+# transient errors / median latency (seconds) above which concurrency is halved
+PROBE_WINDOW = 32
+PROBE_ERROR_THRESHOLD = 0.05
+PROBE_TARGET_LATENCY = 2.0
+
+# Lower bound of the concurrency limit: some resolver errors don't depend on
+# load, and a run at concurrency 1 would take hours
+PROBE_MIN_CONCURRENCY = 4
+
+
+class ProbeScheduler:
+    """
+    Resolve many hostnames with retries and adaptive concurrency.
+
+    The concurrency limit carries over from one resolve_all() call to the
+    next, so a scheduler that is used for all services of a run keeps what
+    it learned about the resolver. It is plain data and can be handed to
+    collect_endpoints() workers; each worker then adapts on its own.
+
+    Attributes:
+        limit: Current concurrency limit (between min_concurrency and max_concurrency)
+        stats: Dict of counters: lookups, attempts, retries, not_found,
+            transient_errors, unresolved, limit_decreases, limit_increases
+    """
+
+    def __init__(self, max_concurrency, timeout, resolver=None, min_concurrency=PROBE_MIN_CONCURRENCY,
+                 max_attempts=PROBE_MAX_ATTEMPTS, backoff_base=PROBE_BACKOFF_BASE,
+                 backoff_max=PROBE_BACKOFF_MAX, window=PROBE_WINDOW,
+                 error_threshold=PROBE_ERROR_THRESHOLD, target_latency=PROBE_TARGET_LATENCY):
+        """
+        Args:
+            max_concurrency: Maximum number of lookups in flight (also the start value)
+            timeout: Seconds to wait for each attempt
+            resolver: Resolver backend (see Resolvers; default: SystemResolver)
+            min_concurrency: Minimum number of lookups in flight
+            max_attempts: Attempts per hostname before it counts as unresolved
+            backoff_base: Seconds to wait before the first retry
+            backoff_max: Maximum seconds to wait before a retry
+            window: Number of attempts after which concurrency is adjusted
+            error_threshold: Share of transient errors in a window above which
+                concurrency is halved
+            target_latency: Median attempt latency (seconds) in a window above
+                which concurrency is halved
+        """
+        self.max_concurrency = max_concurrency
+        self.resolver = resolver if resolver is not None else SystemResolver()
+        self.min_concurrency = min(min_concurrency, max_concurrency)
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.window = window
+        self.error_threshold = error_threshold
+        self.target_latency = target_latency
+
+        self.limit = max_concurrency
+        self.stats = dict.fromkeys([
+            'lookups',
+            'attempts',
+            'retries',
+            'not_found',
+            'transient_errors',
+            'unresolved',
+            'limit_decreases',
+            'limit_increases',
+        ], 0)
+
+        # (is_error, latency) of the attempts since the last adjustment
+        self._window = collections.deque()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_window'] = collections.deque()
+        return state
+
+    def backoff(self, retry):
+        """Get the seconds to wait before retry number `retry` (1, 2, ...)."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (retry - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record(self, is_error, latency):
+        """Record one attempt, and adjust the concurrency limit at the end of a window."""
+        self._window.append((is_error, latency))
+        if len(self._window) < self.window:
+            return
+
+        error_count = sum(is_error for (is_error, _latency) in self._window)
+        latencies = [latency for (is_error, latency) in self._window if not is_error]
+        self._window.clear()
+
+        too_slow = bool(latencies) and statistics.median(latencies) > self.target_latency
+        if error_count / self.window > self.error_threshold or too_slow:
+            new_limit = max(self.min_concurrency, self.limit // 2)
+            if new_limit < self.limit:
+                self.stats['limit_decreases'] += 1
+            self.limit = new_limit
+        elif error_count == 0 and self.limit < self.max_concurrency:
+            self.limit += 1
+            self.stats['limit_increases'] += 1
+
+    async def resolve_all(self, hostnames, lookup=None):
+        """
+        Resolve hostnames.
+
+        Not reentrant: use one scheduler per event loop.
+
+        Args:
+            hostnames: Iterable of unique hostnames
+            lookup: Async function hostname -> (has_ipv4, has_ipv6), raising
+                TransientDnsError for failures worth retrying (default: the
+                lookup method of the resolver backend)
+
+        Returns:
+            Dict mapping hostname -> (has_ipv4, has_ipv6), or None if the
+            hostname couldn't be resolved (all attempts failed)
+        """
+        if lookup is None:
+            lookup = self.resolver.lookup
+
+        condition = asyncio.Condition()
+        in_flight = 0
+
+        async def attempt(hostname):
+            nonlocal in_flight
+
+            async with condition:
+                await condition.wait_for(lambda: in_flight < self.limit)
+                in_flight += 1
+
+            self.stats['attempts'] += 1
+            started = time.monotonic()
+            try:
+                families = await asyncio.wait_for(lookup(hostname), self.timeout)
+            except (TransientDnsError, asyncio.TimeoutError):
+                families = None
+            finally:
+                async with condition:
+                    in_flight -= 1
+                    previous_limit = self.limit
+                    latency = time.monotonic() - started
+                    self._record(families is None, latency)
+                    METRICS.observe('dns_attempt', latency)
+                    # wake one waiter per free slot (one more if the limit grew)
+                    condition.notify(1 + max(0, self.limit - previous_limit))
+
+            return families
+
+        async def resolve_one(hostname):
+            self.stats['lookups'] += 1
+
+            for attempt_number in range(1, self.max_attempts + 1):
+                if attempt_number > 1:
+                    self.stats['retries'] += 1
+                    await asyncio.sleep(self.backoff(attempt_number - 1))
+
+                families = await attempt(hostname)
+                if families is not None:
+                    if families == (False, False):
+                        self.stats['not_found'] += 1
+                    return hostname, families
+
+                self.stats['transient_errors'] += 1
+                METRICS.count('dns_transient_errors')
+
+            self.stats['unresolved'] += 1
+            return hostname, None
+
+        return dict(await asyncio.gather(*(resolve_one(h) for h in hostnames)))
+
+
+# =============================================================================
+__all__ = [
+    'ProbeScheduler',
+    'PROBE_MAX_ATTEMPTS',
+    'PROBE_BACKOFF_BASE',
+    'PROBE_BACKOFF_MAX',
+    'PROBE_WINDOW',
+    'PROBE_ERROR_THRESHOLD',
+    'PROBE_TARGET_LATENCY',
+    'PROBE_MIN_CONCURRENCY',
+]
@@ -8,18 +8,41 @@ including IPv4/IPv6 support detection via DNS resolution.
 Functions:
 - get_available_services: Get list of available AWS services
 - get_all_regions: Get all AWS regions with partition info
+- build_availability_index: Map (service, partition) to available regions
+- save_availability_index / load_availability_index: (De)serialise that map
+- get_region_table: get_all_regions() from a cache file, without a session
+- save_region_table / load_region_table: (De)serialise the region table
 - resolve_endpoint: Resolve hostname and detect IPv4/IPv6 support
+- resolve_endpoints: Resolve many hostnames concurrently
 - get_service_hostname: Get service endpoint hostname via botocore
+- get_service_hostnames: Get service endpoint hostnames for many regions
+- collect_service_hostnames: Get one service's hostnames in all regions
+- collect_endpoint_records: Generator that yields EndpointRecords
 - collect_endpoints: Generator that yields endpoint data dicts
+- as_endpoint_record: Convert an endpoint dict to an EndpointRecord
+- apply_unsupported_dualstack_partitions: Patch a session's dualstack partition list
+- endpoint_category: Support category of an endpoint (see CATEGORY_RULES)
 - calculate_stats: Calculate statistics from endpoint list
+
+Classes:
+- EndpointResult: DNS result for one hostname (NOT_AVAILABLE if none)
+- EndpointRecord: Endpoint data of one (service, region) cell
 """
 
-from botocore.regions import EndpointResolver
-import urllib
-import botocore.session
-import botocore.exceptions
+# botocore, and the modules for concurrent collection and DNS, are only
+# imported by the functions that need them, so that users of the data
+# functions and classes (EndpointRecord, calculate_stats,
+# load_endpoints_from_json, ...) start quickly
+import collections
+import functools
+import itertools
 import json
+import pickle
 import socket
+import sys
+import typing
+
+from Metrics import METRICS
 
 
 # Service blacklist - services that require additional parameters
@@ -31,6 +54,29 @@ SERVICE_BLACKLIST = {
 # Unsupported dualstack partitions
 UNSUPPORTED_DUALSTACK_PARTITIONS = ["aws-iso-e", "aws-iso-f"]
 
+# DNS resolution: number of concurrent lookups, and seconds to wait for each
+DNS_CONCURRENCY = 64
+DNS_TIMEOUT = 10.0
+
+# Number of botocore clients / endpoint rulesets kept for reuse
+# (see _get_service_client, _get_service_ruleset)
+SERVICE_CLIENT_CACHE_SIZE = 64
+
+# Endpoint ruleset built-ins, as botocore sets them for a client created by
+# get_service_hostname (region and dualstack are set per call)
+RULESET_BUILTINS = {
+    'AWS::UseFIPS': False,
+    'AWS::STS::UseGlobalEndpoint': False,
+    'AWS::S3::UseGlobalEndpoint': False,
+    'AWS::S3::Accelerate': False,
+    'AWS::S3::ForcePathStyle': False,
+    'AWS::S3::UseArnRegion': True,
+    'AWS::S3Control::UseArnRegion': False,
+    'AWS::S3::DisableMultiRegionAccessPoints': False,
+    'AWS::S3::DisableS3ExpressSessionAuth': False,
+    'AWS::Auth::AccountIdEndpointMode': 'preferred',
+}
+
 
 # =============================================================================
 # Test Data
@@ -87,6 +133,34 @@ TEST_SERVICES = [
     'secretsmanager',
 ]
 
+# Endpoint attributes the support categories are based on
+CATEGORY_ATTRIBUTES = [
+    'default_hostname',
+    'default_ipv4',
+    'default_ipv6',
+    'dualstack_hostname',
+    'dualstack_ipv4',
+    'dualstack_ipv6',
+]
+
+# Support categories of a (service, region) cell. A cell is in the category
+# of the first rule it matches; a rule maps CATEGORY_ATTRIBUTES to the value
+# they must have:
+# - nx: no endpoint at all
+# - ipv6_default: default endpoint has IPv6
+# - ipv6_dualstack: dualstack endpoint has IPv6, default endpoint doesn't
+# - ipv4_only: has an endpoint, but without IPv6
+# Matrix.EndpointMatrix.classify() and Query.CATEGORY_SQL are built from
+# these rules, so all of them classify the same way.
+CATEGORY_RULES = [
+    ('nx', {'default_hostname': False, 'dualstack_hostname': False}),
+    ('ipv6_default', {'default_ipv6': True}),
+    ('ipv6_dualstack', {'dualstack_ipv6': True}),
+    ('ipv4_only', {}),
+]
+
+CATEGORIES = ['ipv6_default', 'ipv6_dualstack', 'ipv4_only', 'nx']
+
 
 # =============================================================================
 # Core Functions
@@ -94,6 +168,8 @@ TEST_SERVICES = [
 
 def get_botocore_session():
     """Create and return a botocore session."""
+    import botocore.session
+
     return botocore.session.get_session()
 
 
@@ -146,38 +222,458 @@ def get_all_regions(botocore_session, use_test_data=False):
     return all_regions
 
 
+def build_availability_index(botocore_session, service_names, partition_names):
+    """
+    Build an index of the regions each service is available in.
+
+    Args:
+        botocore_session: Botocore session object
+        service_names: Iterable of service names
+        partition_names: Iterable of partition names
+
+    Returns:
+        Dict mapping (service_name, partition_name) -> frozenset of region names
+    """
+    partition_names = set(partition_names)
+
+    return {
+        (service_name, partition_name): frozenset(
+            botocore_session.get_available_regions(service_name, partition_name)
+        )
+        for service_name in service_names
+        for partition_name in partition_names
+    }
+
+
+def save_availability_index(availability_index, json_file):
+    """
+    Save an availability index (see build_availability_index) to a JSON file.
+
+    The botocore version is stored along with the index, so that
+    load_availability_index() can tell whether it is still current.
+
+    Args:
+        availability_index: Dict mapping (service_name, partition_name) -> regions
+        json_file: Path to JSON file
+    """
+    import botocore
+
+    services = {}
+    for (service_name, partition_name), region_names in availability_index.items():
+        services.setdefault(service_name, {})[partition_name] = sorted(region_names)
+
+    with open(json_file, "w") as f:
+        json.dump({
+            "botocore_version": botocore.__version__,
+            "services": services,
+        }, f)
+
+
+def load_availability_index(json_file):
+    """
+    Load an availability index saved by save_availability_index().
+
+    Args:
+        json_file: Path to JSON file
+
+    Returns:
+        Dict mapping (service_name, partition_name) -> frozenset of region names,
+        or None if the file doesn't exist or was made by another botocore version
+    """
+    import botocore
+
+    try:
+        with open(json_file, "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if data["botocore_version"] != botocore.__version__:
+        return None
+
+    return {
+        (service_name, partition_name): frozenset(region_names)
+        for service_name, partitions in data["services"].items()
+        for partition_name, region_names in partitions.items()
+    }
+
+
+def save_region_table(all_regions, pickle_file):
+    """
+    Save a region table (see get_all_regions) to a pickle file.
+
+    The botocore version is stored along with the table, so that
+    load_region_table() can tell whether it is still current.
+
+    Args:
+        all_regions: Dict mapping region_name -> {description, partition}
+        pickle_file: Path to pickle file
+    """
+    import botocore
+
+    with open(pickle_file, "wb") as f:
+        pickle.dump({
+            "botocore_version": botocore.__version__,
+            "regions": all_regions,
+        }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_region_table(pickle_file):
+    """
+    Load a region table saved by save_region_table().
+
+    Only needs the botocore package itself, not a session or its data files.
+
+    Args:
+        pickle_file: Path to pickle file
+
+    Returns:
+        Dict mapping region_name -> {description, partition}, or None if the
+        file doesn't exist, can't be read or was made by another botocore version
+    """
+    import botocore
+
+    try:
+        with open(pickle_file, "rb") as f:
+            data = pickle.load(f)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return None
+
+    if data["botocore_version"] != botocore.__version__:
+        return None
+
+    return data["regions"]
+
+
+def get_region_table(pickle_file, use_test_data=False, botocore_session=None):
+    """
+    Get all AWS regions with partition information, from a cache file if
+    possible.
+
+    Same result as get_all_regions(), but without creating a botocore
+    session (which loads botocore's full endpoint data) if pickle_file was
+    saved for the installed botocore version. Otherwise the table is built
+    from botocore_session (or a new session) and saved to pickle_file.
+
+    Args:
+        pickle_file: Path to the cache file (see save_region_table)
+        use_test_data: If True, return test regions instead
+        botocore_session: Session to build the table with if needed
+
+    Returns:
+        Dict mapping region_name -> {description, partition}
+    """
+    if use_test_data:
+        return dict(TEST_REGIONS)
+
+    all_regions = load_region_table(pickle_file)
+    if all_regions is None:
+        all_regions = get_all_regions(botocore_session or get_botocore_session())
+        save_region_table(all_regions, pickle_file)
+
+    return all_regions
+
+
+class EndpointResult(typing.NamedTuple):
+    """DNS result for one endpoint hostname (see resolve_endpoints)."""
+
+    hostname: str | None
+    has_ipv4: bool
+    has_ipv6: bool
+
+    @classmethod
+    def create(cls, hostname, has_ipv4, has_ipv6):
+        """Like EndpointResult(...), but returns NOT_AVAILABLE for an empty result."""
+        if hostname is None and not has_ipv4 and not has_ipv6:
+            return NOT_AVAILABLE
+        return cls(hostname, has_ipv4, has_ipv6)
+
+    @classmethod
+    def from_dict(cls, result):
+        """Create from a dict {hostname, has_ipv4, has_ipv6}; missing keys are empty."""
+        return cls.create(result.get('hostname'), result.get('has_ipv4', False), result.get('has_ipv6', False))
+
+    def to_dict(self):
+        """Get the dict {hostname, has_ipv4, has_ipv6}."""
+        return {
+            "hostname": self.hostname,
+            "has_ipv4": self.has_ipv4,
+            "has_ipv6": self.has_ipv6,
+        }
+
+    def __reduce__(self):
+        # keep NOT_AVAILABLE a singleton across processes
+        return (EndpointResult.create, tuple(self))
+
+
+# Shared result for "no endpoint"
+NOT_AVAILABLE = EndpointResult(None, False, False)
+
+
+class EndpointRecord(typing.NamedTuple):
+    """
+    Endpoint data of one (service, region) cell (see collect_endpoint_records).
+
+    Field names are the keys of the endpoint dicts of collect_endpoints().
+    """
+
+    service: str
+    partition: str
+    region: str
+    endpoint_default: EndpointResult
+    endpoint_dualstack: EndpointResult
+
+    @classmethod
+    def create(cls, service, partition, region, endpoint_default, endpoint_dualstack):
+        """Like EndpointRecord(...), but with interned service / partition / region names."""
+        return cls(sys.intern(service), sys.intern(partition), sys.intern(region),
+                   endpoint_default, endpoint_dualstack)
+
+    @classmethod
+    def from_dict(cls, ep):
+        """Create from an endpoint dict (see collect_endpoints)."""
+        return cls.create(
+            ep['service'],
+            ep['partition'],
+            ep['region'],
+            EndpointResult.from_dict(ep.get('endpoint_default', {})),
+            EndpointResult.from_dict(ep.get('endpoint_dualstack', {})),
+        )
+
+    def to_dict(self):
+        """Get the endpoint dict (see collect_endpoints)."""
+        return {
+            'service': self.service,
+            'partition': self.partition,
+            'region': self.region,
+            'endpoint_default': self.endpoint_default.to_dict(),
+            'endpoint_dualstack': self.endpoint_dualstack.to_dict(),
+        }
+
+    def __reduce__(self):
+        # re-intern names when unpickled in another process
+        return (EndpointRecord.create, tuple(self))
+
+
+def as_endpoint_record(ep):
+    """
+    Get an endpoint as EndpointRecord.
+
+    Args:
+        ep: EndpointRecord, or endpoint dict (see collect_endpoints)
+
+    Returns:
+        EndpointRecord
+    """
+    if isinstance(ep, EndpointRecord):
+        return ep
+    return EndpointRecord.from_dict(ep)
+
+
+def _endpoint_result(hostname, has_ipv4=False, has_ipv6=False):
+    """
+    Build a result of resolve_endpoints().
+
+    Returns:
+        EndpointResult
+    """
+    # If neither IP version resolved, there is no endpoint
+    if not has_ipv4 and not has_ipv6:
+        return NOT_AVAILABLE
+
+    return EndpointResult(hostname, has_ipv4, has_ipv6)
+
+
 def resolve_endpoint(hostname):
     """
     Resolve hostname and detect IPv4/IPv6 support via DNS.
 
+    A single synchronous getaddrinfo() lookup, without retries or cache;
+    use resolve_endpoints() for many hostnames.
+
     Args:
         hostname: The hostname to resolve
 
     Returns:
         dict: {hostname, has_ipv4, has_ipv6}
     """
-    result = {
-        "hostname": hostname,
-        "has_ipv4": False,
-        "has_ipv6": False,
-    }
+    has_ipv4 = False
+    has_ipv6 = False
 
-    if hostname is None:
-        return result
+    if hostname is not None:
+        try:
+            for (family, _socktype, _proto, _canon_name, _addr) in socket.getaddrinfo(hostname, 443):
+                has_ipv4 |= (family == socket.AddressFamily.AF_INET)
+                has_ipv6 |= (family == socket.AddressFamily.AF_INET6)
+        except socket.gaierror:
+            # Name not known, probably
+            pass
 
-    try:
-        for (family, _socktype, _proto, _canon_name, _addr) in socket.getaddrinfo(hostname, 443):
-            result["has_ipv4"] |= (family == socket.AddressFamily.AF_INET)
-            result["has_ipv6"] |= (family == socket.AddressFamily.AF_INET6)
-    except socket.gaierror:
-        # Name not known, probably
-        pass
+    return _endpoint_result(hostname, has_ipv4, has_ipv6).to_dict()
+
+
+def resolve_endpoints(hostnames, concurrency=DNS_CONCURRENCY, timeout=DNS_TIMEOUT, dns_cache=None,
+                      scheduler=None):
+    """
+    Resolve many hostnames concurrently and detect IPv4/IPv6 support via DNS.
+
+    Lookups are done by the scheduler's resolver backend (system resolver:
+    on a thread pool of at most `concurrency` workers), scheduled by a
+    ProbeScheduler: transient resolver failures (SERVFAIL, timeouts) are
+    retried with backoff, and concurrency is reduced while the resolver has
+    trouble. Each hostname is only resolved once, even if it appears
+    multiple times.
 
-    # If neither IP version resolved, clear hostname
-    if not result["has_ipv4"] and not result["has_ipv6"]:
-        result["hostname"] = None
+    Hostnames that still fail after all retries are not reported as missing
+    if avoidable: their last cached result is used, even if it has expired.
+    Only hostnames without any cached result become NOT_AVAILABLE.
 
-    return result
+    Args:
+        hostnames: Iterable of hostnames to resolve (None entries are allowed)
+        concurrency: Maximum number of lookups in flight at the same time
+        timeout: Seconds to wait for each lookup attempt
+        dns_cache: DnsCache to take unexpired results from, and to store new
+            results in (lookups that failed are not stored)
+        scheduler: ProbeScheduler to use, e.g. to keep its concurrency limit
+            across calls or for another resolver backend (default: a new one
+            with `concurrency` and `timeout`, using the system resolver)
+
+    Returns:
+        List of EndpointResults, in the order of `hostnames`
+    """
+    import asyncio
+    import concurrent.futures
+    from DnsScheduler import ProbeScheduler
+
+    hostnames = list(hostnames)
+    unique_hostnames = {h for h in hostnames if h is not None}
+
+    families_by_hostname = {}
+    if dns_cache is not None and unique_hostnames:
+        families_by_hostname = dns_cache.lookup(unique_hostnames)
+        unique_hostnames -= families_by_hostname.keys()
+        METRICS.count('dns_cache_hits', len(families_by_hostname))
+
+    if unique_hostnames:
+        if scheduler is None:
+            scheduler = ProbeScheduler(concurrency, timeout)
+
+        # A private executor, so that lookups that timed out can't starve
+        # the default executor of other event loops
+        with concurrent.futures.ThreadPoolExecutor(max_workers=scheduler.max_concurrency) as executor:
+            loop = asyncio.new_event_loop()
+            try:
+                loop.set_default_executor(executor)
+                resolved = loop.run_until_complete(scheduler.resolve_all(unique_hostnames))
+            finally:
+                loop.close()
+
+        METRICS.count('dns_lookups', len(unique_hostnames))
+
+        unresolved = {h for h, families in resolved.items() if families is None}
+        resolved = {h: families for h, families in resolved.items() if families is not None}
+        if dns_cache is not None:
+            dns_cache.store(resolved)
+        families_by_hostname.update(resolved)
+
+        if unresolved:
+            stale = dns_cache.lookup(unresolved, include_expired=True) if dns_cache is not None else {}
+            families_by_hostname.update(stale)
+            METRICS.count('dns_unresolved', len(unresolved))
+            METRICS.count('dns_stale_results', len(stale))
+            print(f"WARNING: DNS lookup failed for {len(unresolved)} hostnames after "
+                  f"{scheduler.max_attempts} attempts ({len(stale)} taken from expired cache entries): "
+                  f"{', '.join(sorted(unresolved)[:5])}{', ...' if len(unresolved) > 5 else ''}")
+
+    return [_endpoint_result(h, *families_by_hostname.get(h, (False, False))) for h in hostnames]
+
+
+def _create_service_client(service_name, region_name, botocore_session, use_dualstack=False):
+    """Create a botocore client, as used by get_service_hostname."""
+    import botocore.config
+
+    config = botocore.config.Config(
+        defaults_mode='standard',
+        use_dualstack_endpoint=use_dualstack
+    )
+
+    with METRICS.timer('client_create', service=service_name):
+        return botocore_session.create_client(
+            service_name,
+            region_name=region_name,
+            config=config,
+        )
+
+
+# (botocore_session, service_name, partition_name, region_key) -> (client, builtins)
+_service_client_cache = collections.OrderedDict()
+
+
+def _get_service_client(service_name, region_name, botocore_session):
+    """
+    Get a cached botocore client for a service, shared by the regions of a partition.
+
+    Creating a client loads and parses the service model and endpoint ruleset,
+    so clients are created once per (service, partition) and kept in a LRU
+    cache of SERVICE_CLIENT_CACHE_SIZE entries. The client is created without
+    dualstack; get_service_hostname() sets region and dualstack per call.
+
+    Some built-ins are derived from the region (legacy global endpoints for
+    S3 and STS); those regions get a client of their own.
+
+    Args:
+        service_name: AWS service name (e.g., 'ec2')
+        region_name: AWS region (e.g., 'us-east-1')
+        botocore_session: Botocore session object
+
+    Returns:
+        Tuple (client, builtins); builtins are the endpoint ruleset built-ins
+        the client was created with
+    """
+    import botocore.args
+
+    partition_name = botocore_session.get_partition_for_region(region_name)
+
+    region_key = None
+    if region_name == 'us-east-1' or (
+        region_name in botocore.args.LEGACY_GLOBAL_STS_REGIONS
+        and botocore_session.get_config_variable('sts_regional_endpoints') == 'legacy'
+    ):
+        region_key = region_name
+
+    cache_key = (botocore_session, service_name, partition_name, region_key)
+    if cache_key in _service_client_cache:
+        _service_client_cache.move_to_end(cache_key)
+        return _service_client_cache[cache_key]
+
+    aws_client = _create_service_client(service_name, region_name, botocore_session)
+    builtins = None
+    if aws_client._ruleset_resolver is not None:
+        builtins = aws_client._ruleset_resolver._builtins
+
+    _service_client_cache[cache_key] = (aws_client, builtins)
+    if len(_service_client_cache) > SERVICE_CLIENT_CACHE_SIZE:
+        _service_client_cache.popitem(last=False)
+
+    return aws_client, builtins
+
+
+def _check_dualstack_variant(endpoint_prefix, region_name, botocore_session):
+    """
+    Check that botocore's endpoint data has a dualstack variant for the region.
+
+    This is the check that create_client() does for a dualstack client.
+
+    Raises:
+        botocore.exceptions.EndpointVariantError: if there is no dualstack variant
+    """
+    botocore_endpoint_resolver = botocore_session.get_component('endpoint_resolver')
+    if not botocore_endpoint_resolver.construct_endpoint(
+        endpoint_prefix, region_name, use_dualstack_endpoint=True
+    ):
+        botocore_endpoint_resolver.construct_endpoint(
+            endpoint_prefix, region_name, partition_name='aws', use_dualstack_endpoint=True
+        )
 
 
 def get_service_hostname(service_name, region_name, botocore_session, use_dualstack=False):
@@ -193,27 +689,43 @@ def get_service_hostname(service_name, region_name, botocore_session, use_dualst
     Returns:
         Hostname string or None if not available
     """
-    config = botocore.config.Config(
-        defaults_mode='standard',
-        use_dualstack_endpoint=use_dualstack
-    )
+    with METRICS.timer('hostname', service_name, botocore_session.get_partition_for_region(region_name)):
+        return _get_service_hostname(service_name, region_name, botocore_session, use_dualstack)
+
+
+def _get_service_hostname(service_name, region_name, botocore_session, use_dualstack):
+    import urllib.parse
+    import botocore.exceptions
 
     try:
-        aws_client = botocore_session.create_client(
-            service_name,
-            region_name=region_name,
-            config=config,
-        )
+        aws_client, builtins = _get_service_client(service_name, region_name, botocore_session)
+
+        if builtins is None:
+            # No endpoint ruleset, so the client's endpoint depends on the
+            # region and dualstack setting -- can't share it
+            aws_client = _create_service_client(service_name, region_name, botocore_session, use_dualstack)
+        elif use_dualstack:
+            # The shared client was created without dualstack
+            _check_dualstack_variant(
+                aws_client.meta.service_model.endpoint_prefix, region_name, botocore_session
+            )
     except botocore.exceptions.EndpointVariantError as e:
         print(f"WARNING:  Resolving {service_name} in {region_name}: {e}")
         return None
 
+    if builtins is not None:
+        aws_client._ruleset_resolver._builtins = {
+            **builtins,
+            'AWS::Region': region_name,
+            'AWS::UseDualStack': use_dualstack,
+        }
+
     # Get any operation to resolve the endpoint
     some_operation_name = list(aws_client._service_model._service_description['operations'].keys())[0]
     operation_model = aws_client._service_model.operation_model(some_operation_name)
 
     request_context = {
-        'client_region': aws_client.meta.region_name,
+        'client_region': region_name,
         'client_config': aws_client.meta.config,
         'has_streaming_input': operation_model.has_streaming_input,
         'auth_type': operation_model.auth_type,
@@ -231,13 +743,372 @@ def get_service_hostname(service_name, region_name, botocore_session, use_dualst
         return None
 
 
-def collect_endpoints(botocore_session, use_test_data=False):
+@functools.lru_cache(maxsize=SERVICE_CLIENT_CACHE_SIZE)
+def _get_service_ruleset(botocore_session, service_name):
+    """
+    Load a service's endpoint ruleset for direct evaluation.
+
+    Args:
+        botocore_session: Botocore session object
+        service_name: AWS service name (e.g., 'ec2')
+
+    Returns:
+        Tuple (endpoint_provider, endpoint_prefix, static_params), or None if
+        the service has no endpoint ruleset. static_params are the static
+        context parameters of the operation that get_service_hostname uses.
+    """
+    with METRICS.timer('ruleset_load', service=service_name):
+        return _load_service_ruleset(botocore_session, service_name)
+
+
+def _load_service_ruleset(botocore_session, service_name):
+    import botocore.endpoint_provider
+    import botocore.exceptions
+
+    loader = botocore_session.get_component('data_loader')
+
+    try:
+        ruleset_data = loader.load_service_model(service_name, 'endpoint-rule-set-1')
+    except botocore.exceptions.UnknownServiceError:
+        return None
+
+    service_description = loader.load_service_model(service_name, 'service-2')
+    some_operation = next(iter(service_description['operations'].values()))
+    static_params = {
+        param_name: param['value']
+        for param_name, param in some_operation.get('staticContextParams', {}).items()
+    }
+
+    endpoint_provider = botocore.endpoint_provider.EndpointProvider(
+        ruleset_data=ruleset_data,
+        partition_data=loader.load_data('partitions'),
+        excluded_params=(
+            botocore.endpoint_provider.S3_UNREFERENCED_PARAMS
+            if service_name == 's3'
+            else None
+        ),
+    )
+
+    return endpoint_provider, service_description['metadata']['endpointPrefix'], static_params
+
+
+def get_service_hostnames(service_name, region_names, botocore_session, use_dualstack=False):
+    """
+    Get service endpoint hostnames for many regions at once.
+
+    Evaluates the service's endpoint ruleset directly, without creating a
+    client; results are the same as calling get_service_hostname() for each
+    region. Services without an endpoint ruleset fall back to
+    get_service_hostname().
+
+    Args:
+        service_name: AWS service name (e.g., 'ec2')
+        region_names: Iterable of AWS regions (e.g., ['us-east-1'])
+        botocore_session: Botocore session object
+        use_dualstack: If True, use dualstack endpoints
+
+    Returns:
+        Dict mapping region_name -> hostname string or None if not available
+    """
+    service_ruleset = _get_service_ruleset(botocore_session, service_name)
+    if service_ruleset is None:
+        return {
+            region_name: get_service_hostname(service_name, region_name, botocore_session, use_dualstack)
+            for region_name in region_names
+        }
+
+    endpoint_provider, endpoint_prefix, static_params = service_ruleset
+    use_legacy_global_sts = botocore_session.get_config_variable('sts_regional_endpoints') == 'legacy'
+
+    hostnames = {}
+    for region_name in region_names:
+        with METRICS.timer('hostname', service_name, botocore_session.get_partition_for_region(region_name)):
+            hostnames[region_name] = _evaluate_service_ruleset(
+                service_name, region_name, botocore_session, use_dualstack,
+                endpoint_provider, endpoint_prefix, static_params, use_legacy_global_sts,
+            )
+
+    return hostnames
+
+
+def _evaluate_service_ruleset(service_name, region_name, botocore_session, use_dualstack,
+                              endpoint_provider, endpoint_prefix, static_params, use_legacy_global_sts):
+    """Get one hostname for get_service_hostnames(), or None if not available."""
+    import urllib.parse
+    import botocore.args
+    import botocore.exceptions
+
+    if use_dualstack:
+        try:
+            _check_dualstack_variant(endpoint_prefix, region_name, botocore_session)
+        except botocore.exceptions.EndpointVariantError as e:
+            print(f"WARNING:  Resolving {service_name} in {region_name}: {e}")
+            return None
+
+    builtins = {
+        **RULESET_BUILTINS,
+        'AWS::Region': region_name,
+        'AWS::UseDualStack': use_dualstack,
+        'AWS::STS::UseGlobalEndpoint': (
+            use_legacy_global_sts and region_name in botocore.args.LEGACY_GLOBAL_STS_REGIONS
+        ),
+    }
+
+    params = {}
+    for param_name, param_def in endpoint_provider.ruleset.parameters.items():
+        if param_name in static_params:
+            params[param_name] = static_params[param_name]
+        elif builtins.get(param_def.builtin) is not None:
+            params[param_name] = builtins[param_def.builtin]
+
+    try:
+        result = endpoint_provider.resolve_endpoint(**params)
+        return urllib.parse.urlparse(result.url).netloc
+    except Exception as e:
+        print(f"ERROR:  Resolving for service {service_name} in {region_name}: {e}")
+        return None
+
+
+def apply_unsupported_dualstack_partitions(botocore_session):
+    """
+    Add UNSUPPORTED_DUALSTACK_PARTITIONS to botocore's list, so that no
+    dualstack hostnames are generated for them. Needed once for each new
+    session before getting hostnames from it.
+
+    Args:
+        botocore_session: Botocore session object
+    """
+    botocore_endpoint_resolver = botocore_session.get_component('endpoint_resolver')
+    for partition in UNSUPPORTED_DUALSTACK_PARTITIONS:
+        if partition not in botocore_endpoint_resolver._UNSUPPORTED_DUALSTACK_PARTITIONS:
+            botocore_endpoint_resolver._UNSUPPORTED_DUALSTACK_PARTITIONS.append(partition)
+
+
+def collect_service_hostnames(service_name, all_regions, availability_index, botocore_session,
+                               known_hostnames=None):
+    """
+    Get the default and dualstack hostnames of one service in all regions.
+
+    Args:
+        service_name: AWS service name (e.g., 'ec2')
+        all_regions: Result of get_all_regions()
+        availability_index: Result of build_availability_index()
+        botocore_session: Botocore session object
+        known_hostnames: Dict mapping (service_name, region_name) ->
+            (hostname_default, hostname_dualstack) for cells that don't need
+            to be looked up via botocore (see collect_endpoints)
+
+    Returns:
+        List of tuples (region_name, partition_name, hostname_default, hostname_dualstack),
+        in the order of all_regions; hostnames are None if not available, and
+        hostname_dualstack is None if it's the same as hostname_default
+    """
+    if known_hostnames is None:
+        known_hostnames = {}
+
+    # Regions the service is available in (no regions listed: assume all),
+    # and whose hostnames aren't known yet
+    service_region_names = []
+    for region_name, region_data in all_regions.items():
+        if (service_name, region_name) in known_hostnames:
+            continue
+
+        service_regions = availability_index[(service_name, region_data['partition'])]
+        if len(service_regions) == 0 or region_name in service_regions:
+            service_region_names.append(region_name)
+
+    hostnames_default = {}
+    hostnames_dualstack = {}
+    if service_region_names:
+        hostnames_default = get_service_hostnames(
+            service_name, service_region_names, botocore_session, use_dualstack=False
+        )
+        hostnames_dualstack = get_service_hostnames(
+            service_name, service_region_names, botocore_session, use_dualstack=True
+        )
+
+    # (region_name, partition_name, hostname_default, hostname_dualstack)
+    service_hostnames = []
+
+    for region_name, region_data in all_regions.items():
+        partition_name = region_data['partition']
+
+        if (service_name, region_name) in known_hostnames:
+            hostname_default, hostname_dualstack = known_hostnames[(service_name, region_name)]
+        else:
+            # Not available in this region: None
+            hostname_default = hostnames_default.get(region_name)
+            hostname_dualstack = hostnames_dualstack.get(region_name)
+
+        if hostname_dualstack == hostname_default:
+            # Same as default or not supported
+            hostname_dualstack = None
+
+        service_hostnames.append((region_name, partition_name, hostname_default, hostname_dualstack))
+
+    return service_hostnames
+
+
+def _collect_service_endpoints(service_name, all_regions, availability_index, botocore_session,
+                               dns_scheduler, dns_cache, known_hostnames):
+    """
+    Collect endpoint data for one service in all regions.
+
+    Returns:
+        List of EndpointRecords, in the order of all_regions
+    """
+    service_hostnames = collect_service_hostnames(
+        service_name, all_regions, availability_index, botocore_session, known_hostnames
+    )
+
+    with METRICS.timer('dns', service=service_name):
+        resolved = iter(resolve_endpoints(
+            [h for (_r, _p, h_default, h_dualstack) in service_hostnames for h in (h_default, h_dualstack)],
+            dns_cache=dns_cache,
+            scheduler=dns_scheduler,
+        ))
+
+    return [
+        EndpointRecord.create(service_name, partition_name, region_name, next(resolved), next(resolved))
+        for (region_name, partition_name, _h_default, _h_dualstack) in service_hostnames
+    ]
+
+
+# Per-process state of collect_endpoints() workers (see _init_collect_worker)
+_worker_state = {}
+
+
+def _init_collect_worker(all_regions, availability_index, dns_scheduler, dns_cache, known_hostnames):
+    """Process pool initializer: each worker gets its own botocore session."""
+    botocore_session = get_botocore_session()
+    apply_unsupported_dualstack_partitions(botocore_session)
+
+    # only this worker's observations; they're sent back with each result
+    METRICS.reset()
+
+    _worker_state.update({
+        'botocore_session': botocore_session,
+        'all_regions': all_regions,
+        'availability_index': availability_index,
+        'dns_scheduler': dns_scheduler,
+        'dns_cache': dns_cache,
+        'known_hostnames': known_hostnames,
+    })
+
+
+def _collect_service_endpoints_worker(service_name):
+    """
+    Returns:
+        Tuple (list of EndpointRecords, Metrics of this service)
+    """
+    records = _collect_service_endpoints(
+        service_name,
+        _worker_state['all_regions'],
+        _worker_state['availability_index'],
+        _worker_state['botocore_session'],
+        _worker_state['dns_scheduler'],
+        _worker_state['dns_cache'],
+        _worker_state['known_hostnames'],
+    )
+
+    return records, METRICS.drain()
+
+
+def collect_endpoint_records(botocore_session, use_test_data=False,
+                             dns_concurrency=DNS_CONCURRENCY, dns_timeout=DNS_TIMEOUT, workers=1,
+                             availability_index=None, dns_cache=None, known_hostnames=None,
+                             dns_resolver=None, all_regions=None):
     """
     Generator that yields endpoint data for all services in all regions.
 
+    Hostnames are determined for all regions of a service first, and then
+    resolved as one concurrent batch (see resolve_endpoints). Transient DNS
+    failures are retried, with concurrency adapting to the resolver over the
+    whole run (see DnsScheduler).
+
+    With workers > 1, services are sharded across a pool of processes, each
+    with its own botocore session. Results are yielded in the same order
+    as with a single process, and the workers' instrumentation (see
+    Metrics) is merged into this process's METRICS.
+
     Args:
         botocore_session: Botocore session object
         use_test_data: If True, use test data instead of live AWS data
+        dns_concurrency: Maximum number of concurrent DNS lookups (per worker)
+        dns_timeout: Seconds to wait for each DNS lookup attempt
+        workers: Number of worker processes
+        availability_index: Result of build_availability_index() (or
+            load_availability_index()); missing entries are built here
+        dns_cache: DnsCache for DNS results (see resolve_endpoints)
+        known_hostnames: Dict mapping (service_name, region_name) ->
+            (hostname_default, hostname_dualstack), for cells whose hostnames
+            are already known (e.g. from a previous run); only DNS is done
+            for those
+        dns_resolver: Resolver backend (see Resolvers; default: the system resolver)
+        all_regions: Result of get_all_regions() (or get_region_table());
+            determined from botocore_session if None
+
+    Yields:
+        EndpointRecord for each (service, region)
+    """
+    import concurrent.futures
+    import multiprocessing
+    from DnsScheduler import ProbeScheduler
+
+    all_services = get_available_services(botocore_session, use_test_data)
+    if all_regions is None:
+        all_regions = get_all_regions(botocore_session, use_test_data)
+
+    apply_unsupported_dualstack_partitions(botocore_session)
+
+    # Complete the availability index with any services it doesn't cover
+    partition_names = {region_data['partition'] for region_data in all_regions.values()}
+    availability_index = dict(availability_index or {})
+    missing_services = {
+        service_name
+        for service_name in all_services
+        for partition_name in partition_names
+        if (service_name, partition_name) not in availability_index
+    }
+    availability_index.update(build_availability_index(botocore_session, missing_services, partition_names))
+
+    # One scheduler for all services, so that its concurrency limit adapts
+    # over the whole run (per worker process, with workers > 1)
+    dns_scheduler = ProbeScheduler(dns_concurrency, dns_timeout, resolver=dns_resolver)
+
+    if workers <= 1:
+        for service_name in sorted(all_services):
+            yield from _collect_service_endpoints(
+                service_name, all_regions, availability_index, botocore_session,
+                dns_scheduler, dns_cache, known_hostnames,
+            )
+        return
+
+    # Workers are forked, so they inherit sys.path (botocore from a git
+    # clone, see awsipv6-get.py) without re-running the calling script
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_init_collect_worker,
+        initargs=(all_regions, availability_index, dns_scheduler, dns_cache, known_hostnames),
+    ) as executor:
+        # map() returns results in order of submission
+        for records, worker_metrics in executor.map(_collect_service_endpoints_worker, sorted(all_services)):
+            METRICS.merge(worker_metrics)
+            yield from records
+
+
+def collect_endpoints(botocore_session, use_test_data=False, **kwargs):
+    """
+    Generator that yields endpoint data for all services in all regions.
+
+    Same as collect_endpoint_records(), with endpoint dicts instead of
+    EndpointRecords.
+
+    Args:
+        botocore_session: Botocore session object
+        use_test_data: If True, use test data instead of live AWS data
+        kwargs: See collect_endpoint_records()
 
     Yields:
         dict with endpoint data:
@@ -249,51 +1120,55 @@ def collect_endpoints(botocore_session, use_test_data=False):
             'endpoint_dualstack': {hostname, has_ipv4, has_ipv6},
         }
     """
-    all_services = get_available_services(botocore_session, use_test_data)
-    all_regions = get_all_regions(botocore_session, use_test_data)
+    for record in collect_endpoint_records(botocore_session, use_test_data, **kwargs):
+        yield record.to_dict()
 
-    # Add unsupported partitions to botocore's list (needed for each new session)
-    botocore_endpoint_resolver = botocore_session.get_component('endpoint_resolver')
-    for partition in UNSUPPORTED_DUALSTACK_PARTITIONS:
-        if partition not in botocore_endpoint_resolver._UNSUPPORTED_DUALSTACK_PARTITIONS:
-            botocore_endpoint_resolver._UNSUPPORTED_DUALSTACK_PARTITIONS.append(partition)
 
-    for service_name in sorted(all_services):
-        for region_name, region_data in all_regions.items():
-            partition_name = region_data['partition']
-
-            # Check if service is available in this region
-            service_regions = botocore_session.get_available_regions(service_name, partition_name)
-
-            if len(service_regions) > 0 and region_name not in service_regions:
-                # Service not available in this region
-                endpoint_default = resolve_endpoint(None)
-                endpoint_dualstack = resolve_endpoint(None)
-            else:
-                # Get default endpoint
-                hostname_default = get_service_hostname(
-                    service_name, region_name, botocore_session, use_dualstack=False
-                )
-                endpoint_default = resolve_endpoint(hostname_default)
-
-                # Get dualstack endpoint (if different)
-                hostname_dualstack = get_service_hostname(
-                    service_name, region_name, botocore_session, use_dualstack=True
-                )
-
-                if hostname_dualstack != hostname_default:
-                    endpoint_dualstack = resolve_endpoint(hostname_dualstack)
-                else:
-                    # Same as default or not supported
-                    endpoint_dualstack = resolve_endpoint(None)
-
-            yield {
-                'service': service_name,
-                'partition': partition_name,
-                'region': region_name,
-                'endpoint_default': endpoint_default,
-                'endpoint_dualstack': endpoint_dualstack,
-            }
+def _endpoint_attributes(ep):
+    """
+    Get the CATEGORY_ATTRIBUTES values of an endpoint.
+
+    Reads endpoint dicts directly, without converting them to EndpointRecords,
+    as calculate_stats runs over whole snapshots.
+
+    Returns:
+        Tuple of bools, in CATEGORY_ATTRIBUTES order
+    """
+    if isinstance(ep, EndpointRecord):
+        default, dualstack = ep.endpoint_default, ep.endpoint_dualstack
+        return (bool(default.hostname), bool(default.has_ipv4), bool(default.has_ipv6),
+                bool(dualstack.hostname), bool(dualstack.has_ipv4), bool(dualstack.has_ipv6))
+
+    default = ep.get('endpoint_default', {})
+    dualstack = ep.get('endpoint_dualstack', {})
+    return (bool(default.get('hostname')), bool(default.get('has_ipv4')), bool(default.get('has_ipv6')),
+            bool(dualstack.get('hostname')), bool(dualstack.get('has_ipv4')), bool(dualstack.get('has_ipv6')))
+
+
+@functools.cache
+def _category_table():
+    """Get the category of every combination of CATEGORY_ATTRIBUTES values."""
+    table = {}
+    for values in itertools.product([False, True], repeat=len(CATEGORY_ATTRIBUTES)):
+        attributes = dict(zip(CATEGORY_ATTRIBUTES, values))
+        for category, rule in CATEGORY_RULES:
+            if all(attributes[attribute] == value for attribute, value in rule.items()):
+                table[values] = category
+                break
+    return table
+
+
+def endpoint_category(ep):
+    """
+    Get the support category of an endpoint (see CATEGORY_RULES).
+
+    Args:
+        ep: EndpointRecord or endpoint dict
+
+    Returns:
+        Category name (one of CATEGORIES)
+    """
+    return _category_table()[_endpoint_attributes(ep)]
 
 
 def calculate_stats(endpoints):
@@ -301,7 +1176,7 @@ def calculate_stats(endpoints):
     Calculate statistics from endpoint list.
 
     Args:
-        endpoints: List of endpoint dicts
+        endpoints: List of endpoint dicts or EndpointRecords
 
     Returns:
         dict with statistics:
@@ -314,41 +1189,16 @@ def calculate_stats(endpoints):
             'count_nx': int,
         }
     """
-    se_count = 0
-    se_count_ipv6_default = 0
-    se_count_ipv6_dualstack = 0
-    se_count_ipv4_only = 0
-    se_count_nx = 0
-
-    for ep in endpoints:
-        ep_default = ep.get('endpoint_default', {})
-        ep_dualstack = ep.get('endpoint_dualstack', {})
-
-        hostname_default = ep_default.get('hostname')
-        hostname_dualstack = ep_dualstack.get('hostname')
-
-        has_ipv6_default = ep_default.get('has_ipv6', False)
-        has_ipv6_dualstack = ep_dualstack.get('has_ipv6', False)
-
-        if not hostname_default and not hostname_dualstack:
-            se_count_nx += 1
-        elif has_ipv6_default:
-            se_count += 1
-            se_count_ipv6_default += 1
-        elif has_ipv6_dualstack:
-            se_count += 1
-            se_count_ipv6_dualstack += 1
-        else:
-            se_count += 1
-            se_count_ipv4_only += 1
+    counts = collections.Counter(endpoint_category(ep) for ep in endpoints)
+    count_enabled = counts['ipv6_default'] + counts['ipv6_dualstack'] + counts['ipv4_only']
 
     return {
-        "count_total": se_count + se_count_nx,
-        "count_enabled": se_count,
-        "count_ipv6_default": se_count_ipv6_default,
-        "count_ipv6_dualstack": se_count_ipv6_dualstack,
-        "count_ipv4_only": se_count_ipv4_only,
-        "count_nx": se_count_nx,
+        "count_total": count_enabled + counts['nx'],
+        "count_enabled": count_enabled,
+        "count_ipv6_default": counts['ipv6_default'],
+        "count_ipv6_dualstack": counts['ipv6_dualstack'],
+        "count_ipv4_only": counts['ipv4_only'],
+        "count_nx": counts['nx'],
     }
 
 
@@ -356,6 +1206,9 @@ def load_endpoints_from_json(json_file):
     """
     Load endpoints from JSON file.
 
+    Parses the whole file; to read a few records of a large snapshot, see
+    Snapshot.SnapshotReader.
+
     Args:
         json_file: Path to JSON file
 
@@ -370,10 +1223,29 @@ def load_endpoints_from_json(json_file):
 __all__ = [
     'get_available_services',
     'get_all_regions',
+    'build_availability_index',
+    'save_availability_index',
+    'load_availability_index',
+    'get_region_table',
+    'save_region_table',
+    'load_region_table',
     'resolve_endpoint',
+    'resolve_endpoints',
     'get_service_hostname',
+    'get_service_hostnames',
+    'collect_service_hostnames',
+    'collect_endpoint_records',
     'collect_endpoints',
+    'as_endpoint_record',
+    'apply_unsupported_dualstack_partitions',
+    'endpoint_category',
     'calculate_stats',
+    'CATEGORY_ATTRIBUTES',
+    'CATEGORY_RULES',
+    'CATEGORIES',
+    'EndpointResult',
+    'EndpointRecord',
+    'NOT_AVAILABLE',
     'load_endpoints_from_json',
 ]
 
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Endpoint history
+
+Keeps the endpoint data of every run in one SQLite file. Rows use the
+columns of the endpoint table of endpoints.sqlite, plus the range of
+snapshots they are valid for:
+
+- valid_from: first snapshot the row is part of
+- valid_to: first snapshot the row is no longer part of (NULL: still current)
+
+A new snapshot only closes the rows that changed or disappeared and adds
+rows for what changed or appeared, so each run stores just its delta
+against the previous one. Any snapshot can be reconstructed with a single
+range query, and the history of a (service, region) cell is just its rows.
+
+Functions / classes:
+- HistoryStore: The history file; add snapshots, query history
+"""
+
+import json
+import sqlite3
+import time
+
+from Endpoints import EndpointRecord, EndpointResult
+from SqliteWriter import endpoint_row
+
+
+SNAPSHOT_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS snapshot (
+        snapshot_id INTEGER PRIMARY KEY,
+        taken_at REAL,
+        regions TEXT
+    )
+"""
+
+ENDPOINT_HISTORY_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS endpoint_history (
+        service_name TEXT,
+        region_name TEXT,
+        partition_name TEXT,
+        endpoint_default_hostname TEXT,
+        endpoint_default_has_ipv4 INTEGER,
+        endpoint_default_has_ipv6 INTEGER,
+        endpoint_dualstack_hostname TEXT,
+        endpoint_dualstack_has_ipv4 INTEGER,
+        endpoint_dualstack_has_ipv6 INTEGER,
+        valid_from INTEGER,
+        valid_to INTEGER,
+        PRIMARY KEY (service_name, region_name, valid_from)
+    )
+    WITHOUT ROWID
+"""
+
+ENDPOINT_HISTORY_INDEXES = [
+    # snapshot reconstruction: rows valid at a given snapshot
+    "CREATE INDEX IF NOT EXISTS endpoint_history_valid ON endpoint_history (valid_from, valid_to)",
+]
+
+# Data columns, in the order of SqliteWriter.endpoint_row()
+ENDPOINT_COLUMNS = [
+    'service_name',
+    'partition_name',
+    'region_name',
+    'endpoint_default_hostname',
+    'endpoint_default_has_ipv4',
+    'endpoint_default_has_ipv6',
+    'endpoint_dualstack_hostname',
+    'endpoint_dualstack_has_ipv4',
+    'endpoint_dualstack_has_ipv6',
+]
+
+
+def _same_cell(history, staged):
+    """SQL condition: history row is for the same cell as staged row."""
+    return " AND ".join(f"{history}.{column} = {staged}.{column}" for column in ['service_name', 'region_name'])
+
+
+def _same_row(history, staged):
+    """SQL condition: history row has the same data as staged row."""
+    # '=' on the key columns, so lookups can use the primary key; 'IS' for
+    # the others, as they may be NULL
+    return " AND ".join([_same_cell(history, staged)] + [
+        f"{history}.{column} IS {staged}.{column}"
+        for column in ENDPOINT_COLUMNS
+        if column not in ('service_name', 'region_name')
+    ])
+
+
+def _record_from_row(row):
+    """Get an EndpointRecord from ENDPOINT_COLUMNS values."""
+    (service_name, partition_name, region_name,
+     default_hostname, default_has_ipv4, default_has_ipv6,
+     dualstack_hostname, dualstack_has_ipv4, dualstack_has_ipv6) = row
+
+    return EndpointRecord.create(
+        service_name,
+        partition_name,
+        region_name,
+        EndpointResult.create(default_hostname, bool(default_has_ipv4), bool(default_has_ipv6)),
+        EndpointResult.create(dualstack_hostname, bool(dualstack_has_ipv4), bool(dualstack_has_ipv6)),
+    )
+
+
+class HistoryStore:
+    """
+    SQLite file with the endpoint data of all snapshots, stored as deltas.
+
+    Add a snapshot with add_snapshot(), or step by step with
+    open_snapshot() / stage_endpoints() / close_snapshot() while endpoints
+    are being collected (see Sinks.HistorySink).
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: Path to the SQLite file (created if missing)
+        """
+        self.path = path
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute(SNAPSHOT_SCHEMA)
+        self._conn.execute(ENDPOINT_HISTORY_SCHEMA)
+        for index_sql in ENDPOINT_HISTORY_INDEXES:
+            self._conn.execute(index_sql)
+
+        self._snapshot_id = None
+
+    # ----- adding snapshots -----
+
+    def open_snapshot(self, all_regions, taken_at=None):
+        """
+        Start a new snapshot. Load its endpoints with stage_endpoints(),
+        then call close_snapshot().
+
+        Args:
+            all_regions: Dict mapping region_name -> {description, partition}
+            taken_at: Time of the snapshot (default: time.time())
+
+        Returns:
+            Snapshot id
+        """
+        if self._snapshot_id is not None:
+            raise RuntimeError("snapshot already open")
+
+        if taken_at is None:
+            taken_at = time.time()
+
+        self._conn.execute("BEGIN")
+        cur = self._conn.execute(
+            "INSERT INTO snapshot (taken_at, regions) VALUES (?, ?)",
+            (taken_at, json.dumps(all_regions, sort_keys=True)),
+        )
+        self._snapshot_id = cur.lastrowid
+
+        self._conn.execute("DROP TABLE IF EXISTS temp.staged_endpoint")
+        self._conn.execute(f"""
+            CREATE TEMP TABLE staged_endpoint (
+                {", ".join(ENDPOINT_COLUMNS)},
+                PRIMARY KEY (service_name, region_name)
+            )
+            WITHOUT ROWID
+        """)
+
+        return self._snapshot_id
+
+    def stage_endpoints(self, endpoints):
+        """
+        Add endpoints to the open snapshot.
+
+        Args:
+            endpoints: Iterable of EndpointRecords or endpoint dicts
+        """
+        self._conn.executemany(f"""
+            INSERT INTO staged_endpoint ({", ".join(ENDPOINT_COLUMNS)})
+            VALUES ({", ".join("?" * len(ENDPOINT_COLUMNS))})
+        """, (endpoint_row(ep) for ep in endpoints))
+
+    def close_snapshot(self):
+        """
+        Finish the open snapshot: store its delta against the previous one.
+
+        Returns:
+            dict: {snapshot_id, added, changed, removed} (numbers of cells)
+        """
+        snapshot_id = self._snapshot_id
+        conn = self._conn
+
+        try:
+            counts = conn.execute(f"""
+                SELECT
+                    (SELECT count(*) FROM staged_endpoint n WHERE NOT EXISTS (
+                        SELECT 1 FROM endpoint_history h WHERE h.valid_to IS NULL AND {_same_cell("h", "n")}
+                    )),
+                    (SELECT count(*) FROM staged_endpoint n WHERE EXISTS (
+                        SELECT 1 FROM endpoint_history h WHERE h.valid_to IS NULL AND {_same_cell("h", "n")}
+                    ) AND NOT EXISTS (
+                        SELECT 1 FROM endpoint_history h WHERE h.valid_to IS NULL AND {_same_row("h", "n")}
+                    )),
+                    (SELECT count(*) FROM endpoint_history h WHERE h.valid_to IS NULL AND NOT EXISTS (
+                        SELECT 1 FROM staged_endpoint n WHERE {_same_cell("h", "n")}
+                    ))
+            """).fetchone()
+
+            # Close rows that changed or disappeared ...
+            conn.execute(f"""
+                UPDATE endpoint_history
+                SET valid_to = ?
+                WHERE valid_to IS NULL
+                AND NOT EXISTS (
+                    SELECT 1 FROM staged_endpoint n WHERE {_same_row("endpoint_history", "n")}
+                )
+            """, (snapshot_id,))
+
+            # ... and add rows for what changed or appeared
+            conn.execute(f"""
+                INSERT INTO endpoint_history ({", ".join(ENDPOINT_COLUMNS)}, valid_from, valid_to)
+                SELECT {", ".join(f"n.{column}" for column in ENDPOINT_COLUMNS)}, ?, NULL
+                FROM staged_endpoint n
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM endpoint_history h WHERE h.valid_to IS NULL AND {_same_row("h", "n")}
+                )
+            """, (snapshot_id,))
+
+            conn.execute("DROP TABLE temp.staged_endpoint")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._snapshot_id = None
+
+        added, changed, removed = counts
+        return {
+            'snapshot_id': snapshot_id,
+            'added': added,
+            'changed': changed,
+            'removed': removed,
+        }
+
+    def abort_snapshot(self):
+        """Discard the open snapshot."""
+        if self._snapshot_id is not None:
+            self._conn.execute("ROLLBACK")
+            self._snapshot_id = None
+
+    def add_snapshot(self, endpoints, all_regions, taken_at=None):
+        """
+        Add a snapshot.
+
+        Args:
+            endpoints: Iterable of EndpointRecords or endpoint dicts
+            all_regions: Dict mapping region_name -> {description, partition}
+            taken_at: Time of the snapshot (default: time.time())
+
+        Returns:
+            dict: {snapshot_id, added, changed, removed}
+        """
+        self.open_snapshot(all_regions, taken_at)
+        try:
+            self.stage_endpoints(endpoints)
+        except BaseException:
+            self.abort_snapshot()
+            raise
+
+        return self.close_snapshot()
+
+    # ----- queries -----
+
+    def snapshots(self):
+        """
+        List all snapshots.
+
+        Returns:
+            List of (snapshot_id, taken_at), oldest first
+        """
+        return self._conn.execute(
+            "SELECT snapshot_id, taken_at FROM snapshot ORDER BY snapshot_id"
+        ).fetchall()
+
+    def snapshot_id_at(self, when):
+        """
+        Get the snapshot that was current at a given time.
+
+        Args:
+            when: Time (as for time.time())
+
+        Returns:
+            Snapshot id of the last snapshot taken at or before `when`, or
+            None if there is none
+        """
+        row = self._conn.execute("""
+            SELECT max(snapshot_id) FROM snapshot WHERE taken_at <= ?
+        """, (when,)).fetchone()
+
+        return row[0]
+
+    def snapshot_regions(self, snapshot_id):
+        """
+        Get the regions of a snapshot.
+
+        Returns:
+            Dict mapping region_name -> {description, partition}
+        """
+        row = self._conn.execute(
+            "SELECT regions FROM snapshot WHERE snapshot_id = ?", (snapshot_id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(snapshot_id)
+
+        return json.loads(row[0])
+
+    def snapshot_endpoints(self, snapshot_id):
+        """
+        Reconstruct the endpoints of a snapshot.
+
+        Args:
+            snapshot_id: Snapshot id (see snapshots(), snapshot_id_at())
+
+        Returns:
+            List of EndpointRecords, ordered by service and region
+        """
+        cur = self._conn.execute(f"""
+            SELECT {", ".join(ENDPOINT_COLUMNS)}
+            FROM endpoint_history
+            WHERE valid_from <= ?
+            AND (valid_to IS NULL OR valid_to > ?)
+            ORDER BY service_name, region_name
+        """, (snapshot_id, snapshot_id))
+
+        return [_record_from_row(row) for row in cur]
+
+    def cell_history(self, service_name, region_name):
+        """
+        Get the history of one (service, region) cell.
+
+        Returns:
+            List of (valid_from, valid_to, record), oldest first, with
+            valid_from / valid_to as taken_at of the snapshots (valid_to is
+            None for the current row)
+        """
+        cur = self._conn.execute(f"""
+            SELECT
+                f.taken_at,
+                t.taken_at,
+                {", ".join(f"h.{column}" for column in ENDPOINT_COLUMNS)}
+            FROM endpoint_history h
+            JOIN snapshot f ON f.snapshot_id = h.valid_from
+            LEFT JOIN snapshot t ON t.snapshot_id = h.valid_to
+            WHERE h.service_name = ? AND h.region_name = ?
+            ORDER BY h.valid_from
+        """, (service_name, region_name))
+
+        return [(row[0], row[1], _record_from_row(row[2:])) for row in cur]
+
+    def ipv6_since(self, service_name, region_name, dualstack=True):
+        """
+        Get when a cell got IPv6 (and kept it since).
+
+        Args:
+            service_name: Service name
+            region_name: Region name
+            dualstack: Also count IPv6 on the dualstack endpoint
+
+        Returns:
+            taken_at of the first snapshot of the current IPv6 streak, or
+            None if the cell doesn't have IPv6 now
+        """
+        history = self.cell_history(service_name, region_name)
+        if not history or history[-1][1] is not None:
+            # no current row
+            return None
+
+        since = None
+        previous_valid_to = None
+        for (valid_from, valid_to, record) in history:
+            if valid_from != previous_valid_to:
+                # cell was gone in between (or first row)
+                since = None
+
+            has_ipv6 = record.endpoint_default.has_ipv6 or (dualstack and record.endpoint_dualstack.has_ipv6)
+            if not has_ipv6:
+                since = None
+            elif since is None:
+                since = valid_from
+
+            previous_valid_to = valid_to
+
+        return since
+
+    def close(self):
+        self.abort_snapshot()
+        self._conn.close()
+
+
+# =============================================================================
+__all__ = [
+    'HistoryStore',
+]
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Incremental refresh of endpoint data
+
+Instead of asking botocore for the hostnames of every (service, region)
+cell on each run, keep the hostnames of the previous run in a state file,
+together with content hashes of the botocore data they were derived from:
+
+- per service: the service model and its endpoint ruleset
+- per partition: the partition's entries in endpoints.json / partitions.json
+- botocore itself: its version and the code that resolves endpoints
+  (ENDPOINT_CODE_MODULES); if that changed, all cells are looked up again
+
+Only cells whose service or partition data changed (or that are new) are
+looked up via botocore again. All cells still go through DNS resolution,
+as that's what actually changes from day to day.
+
+Functions:
+- compute_data_hashes: Hash botocore data files per service and partition
+- compute_code_hash: Hash botocore's version and endpoint resolution code
+- collect_hostnames: Get hostnames for all cells, reusing unchanged ones
+- load_state / save_state: Read / write the state file
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+
+from Endpoints import (
+    get_available_services,
+    get_all_regions,
+    build_availability_index,
+    collect_service_hostnames,
+    apply_unsupported_dualstack_partitions,
+)
+
+
+# botocore modules whose code determines hostnames (ruleset evaluation,
+# endpoint builtins, dualstack / FIPS handling)
+ENDPOINT_CODE_MODULES = [
+    'botocore.regions',
+    'botocore.endpoint_provider',
+    'botocore.args',
+    'botocore.config',
+]
+
+
+def _data_file_hash(loader, *path_parts):
+    """
+    Get the SHA-256 of a botocore data file, as found by the loader.
+
+    Args:
+        loader: botocore data loader
+        path_parts: Path below the data directory, without extension
+
+    Returns:
+        Hex digest, or None if the file doesn't exist
+    """
+    for search_path in loader.search_paths:
+        for extension in ('.json', '.json.gz'):
+            file_path = os.path.join(search_path, *path_parts) + extension
+            if os.path.isfile(file_path):
+                with open(file_path, 'rb') as f:
+                    return hashlib.sha256(f.read()).hexdigest()
+
+    return None
+
+
+def _json_hash(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def compute_code_hash():
+    """
+    Hash botocore's version and the source of ENDPOINT_CODE_MODULES.
+
+    fetch-data.sh uses botocore's master branch, where the code can change
+    without a new version number, so the source is hashed as well.
+
+    Returns:
+        Hex digest
+    """
+    import botocore
+
+    sources = [botocore.__version__]
+    for module_name in ENDPOINT_CODE_MODULES:
+        spec = importlib.util.find_spec(module_name)
+        with open(spec.origin, 'rb') as f:
+            sources.append(hashlib.sha256(f.read()).hexdigest())
+
+    return _json_hash(sources)
+
+
+def compute_data_hashes(botocore_session, service_names, partition_names):
+    """
+    Hash the botocore data that hostnames are derived from.
+
+    Args:
+        botocore_session: Botocore session object
+        service_names: Iterable of service names
+        partition_names: Iterable of partition names
+
+    Returns:
+        dict: {
+            'services': {service_name: hex digest},
+            'partitions': {partition_name: hex digest},
+        }
+    """
+    loader = botocore_session.get_component('data_loader')
+
+    service_hashes = {}
+    for service_name in service_names:
+        api_version = loader.determine_latest_version(service_name, 'service-2')
+        service_hashes[service_name] = _json_hash([
+            _data_file_hash(loader, service_name, api_version, 'service-2'),
+            _data_file_hash(loader, service_name, api_version, 'endpoint-rule-set-1'),
+        ])
+
+    endpoints_data = {p['partition']: p for p in loader.load_data('endpoints')['partitions']}
+    partitions_data = {p['id']: p for p in loader.load_data('partitions')['partitions']}
+
+    partition_hashes = {
+        partition_name: _json_hash([
+            endpoints_data.get(partition_name),
+            partitions_data.get(partition_name),
+        ])
+        for partition_name in partition_names
+    }
+
+    return {
+        'services': service_hashes,
+        'partitions': partition_hashes,
+    }
+
+
+def collect_hostnames(botocore_session, previous_state, use_test_data=False, all_regions=None):
+    """
+    Get default and dualstack hostnames for all services in all regions.
+
+    Cells whose service and partition data are unchanged since
+    `previous_state` are taken from there; all others are looked up via
+    botocore (see Endpoints.collect_service_hostnames).
+
+    Args:
+        botocore_session: Botocore session object
+        previous_state: State of the previous run (see load_state), or None
+        use_test_data: If True, use test data instead of live AWS data
+        all_regions: Result of get_all_regions() (or get_region_table());
+            determined from botocore_session if None
+
+    Returns:
+        Tuple (known_hostnames, state, changed_services):
+        - known_hostnames: Dict mapping (service_name, region_name) ->
+          (hostname_default, hostname_dualstack), for collect_endpoints()
+        - state: State to save for the next run
+        - changed_services: Set of services that had cells looked up again
+    """
+    all_services = get_available_services(botocore_session, use_test_data)
+    if all_regions is None:
+        all_regions = get_all_regions(botocore_session, use_test_data)
+    partition_names = {region_data['partition'] for region_data in all_regions.values()}
+
+    apply_unsupported_dualstack_partitions(botocore_session)
+
+    data_hashes = compute_data_hashes(botocore_session, all_services, partition_names)
+    code_hash = compute_code_hash()
+
+    # with other botocore code, any cell may resolve differently
+    if (previous_state is None
+            or previous_state['use_test_data'] != use_test_data
+            or previous_state.get('code_hash') != code_hash):
+        previous_state = {
+            'data_hashes': {'services': {}, 'partitions': {}},
+            'hostnames': {},
+        }
+
+    previous_hashes = previous_state['data_hashes']
+    changed_partitions = {
+        partition_name
+        for partition_name in partition_names
+        if previous_hashes['partitions'].get(partition_name) != data_hashes['partitions'][partition_name]
+    }
+
+    # Reuse hostnames of cells with unchanged service and partition data
+    known_hostnames = {}
+    for service_name in all_services:
+        if previous_hashes['services'].get(service_name) != data_hashes['services'][service_name]:
+            continue
+
+        previous_service_hostnames = previous_state['hostnames'].get(service_name, {})
+        for region_name, region_data in all_regions.items():
+            if region_data['partition'] in changed_partitions:
+                continue
+            if region_name in previous_service_hostnames:
+                known_hostnames[(service_name, region_name)] = tuple(previous_service_hostnames[region_name])
+
+    # Look up everything else
+    changed_services = {
+        service_name
+        for service_name in all_services
+        for region_name in all_regions
+        if (service_name, region_name) not in known_hostnames
+    }
+
+    availability_index = build_availability_index(botocore_session, changed_services, partition_names)
+    for service_name in sorted(changed_services):
+        service_hostnames = collect_service_hostnames(
+            service_name, all_regions, availability_index, botocore_session, known_hostnames
+        )
+        for (region_name, _partition_name, hostname_default, hostname_dualstack) in service_hostnames:
+            known_hostnames[(service_name, region_name)] = (hostname_default, hostname_dualstack)
+
+    hostnames = {}
+    for (service_name, region_name), cell_hostnames in known_hostnames.items():
+        hostnames.setdefault(service_name, {})[region_name] = list(cell_hostnames)
+
+    state = {
+        'use_test_data': use_test_data,
+        'code_hash': code_hash,
+        'data_hashes': data_hashes,
+        'hostnames': hostnames,
+    }
+
+    return known_hostnames, state, changed_services
+
+
+def load_state(json_file):
+    """
+    Load the state of a previous run.
+
+    Args:
+        json_file: Path to JSON file
+
+    Returns:
+        State dict, or None if the file doesn't exist
+    """
+    try:
+        with open(json_file, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_state(state, json_file):
+    """
+    Save the state returned by collect_hostnames().
+
+    Args:
+        state: State dict
+        json_file: Path to JSON file
+    """
+    with open(json_file, "w") as f:
+        json.dump(state, f)
+
+
+# =============================================================================
+__all__ = [
+    'compute_data_hashes',
+    'compute_code_hash',
+    'collect_hostnames',
+    'load_state',
+    'save_state',
+]
@@ -0,0 +1,454 @@
+#!/usr/bin/env python3
+"""
+Columnar endpoint matrix
+
+Holds the endpoint data of one snapshot as a (service, region) matrix, with
+one bitset per attribute instead of one dict per endpoint. Bitsets are
+Python ints with one bit per cell, cells ordered service-major:
+
+    cell = service_index * len(regions) + region_index
+
+Classification and counting then are a handful of bitwise operations and
+int.bit_count() calls over the whole matrix, which run in C, instead of a
+Python loop over endpoint dicts. That makes it cheap to compute stats for
+many snapshots, e.g. for history, and the per-region / per-service counts of
+the web pages (see web/build/EndpointsData).
+
+Categories are Endpoints.CATEGORIES, classified by Endpoints.CATEGORY_RULES
+like Endpoints.calculate_stats does.
+"""
+
+import sqlite3
+
+from Endpoints import CATEGORIES, CATEGORY_RULES, EndpointResult, as_endpoint_record
+
+
+# Counters of the web pages (see web/build/EndpointsData). Unlike the
+# categories they overlap: a cell counts towards every counter whose
+# condition it fulfills.
+#
+# - ipv6_default: default endpoint has IPv6
+# - ipv6_dualstack: dualstack endpoint has IPv6
+# - ipv6_opt_in: dualstack endpoint has IPv6, default endpoint doesn't
+# - ipv4_only: default endpoint has IPv4, neither endpoint has IPv6
+# - ipv4_default: default endpoint has IPv4
+# - active: any endpoint has IPv4
+COUNTERS = [
+    'ipv6_default',
+    'ipv6_dualstack',
+    'ipv6_opt_in',
+    'ipv4_only',
+    'ipv4_default',
+    'active',
+]
+
+# Per-cell category codes, see EndpointMatrix.cell_categories()
+CATEGORY_CODES = {
+    'none': 0,
+    'ipv6_default': 1,
+    'ipv6_dualstack': 2,
+    'ipv4_only': 3,
+    'nx': 4,
+}
+
+# Attribute bitsets of an EndpointMatrix
+ATTRIBUTES = [
+    'present',
+    'default_hostname',
+    'default_ipv4',
+    'default_ipv6',
+    'dualstack_hostname',
+    'dualstack_ipv4',
+    'dualstack_ipv6',
+]
+
+
+def _as_endpoint_result(result):
+    """Get an EndpointResult from an EndpointResult or a dict {hostname, has_ipv4, has_ipv6}."""
+    if isinstance(result, EndpointResult):
+        return result
+    return EndpointResult.from_dict(result)
+
+
+def _bitset_to_bytes(bitset, cell_count, code):
+    """Get one byte per cell: `code` where the bit is set, 0 otherwise."""
+    bits = format(bitset, f'0{cell_count}b')[::-1] if cell_count else ''
+    return bits.encode().translate(bytes.maketrans(b'01', bytes([0, code])))
+
+
+class EndpointMatrix:
+    """
+    Endpoint data as bitsets over a (service, region) matrix.
+
+    Attributes:
+        services: List of service names (matrix rows)
+        regions: List of region names (matrix columns)
+        region_partitions: Dict mapping region_name -> partition_name
+        present, default_hostname, default_ipv4, ...: Bitsets, see ATTRIBUTES.
+            `present` has a bit for every cell that has an endpoint row.
+    """
+
+    def __init__(self, services, regions, region_partitions):
+        """
+        Create an empty matrix.
+
+        Args:
+            services: List of service names
+            regions: List of region names
+            region_partitions: Dict mapping region_name -> partition_name
+        """
+        self.services = list(services)
+        self.regions = list(regions)
+        self.region_partitions = dict(region_partitions)
+
+        self._service_index = {service_name: i for i, service_name in enumerate(self.services)}
+        self._region_index = {region_name: i for i, region_name in enumerate(self.regions)}
+        self._column_mask = None
+
+        for attribute in ATTRIBUTES:
+            setattr(self, attribute, 0)
+
+    @property
+    def cell_count(self):
+        return len(self.services) * len(self.regions)
+
+    def cell(self, service_name, region_name):
+        """Get the cell number of a (service, region) pair."""
+        return self._service_index[service_name] * len(self.regions) + self._region_index[region_name]
+
+    def set_cell(self, service_name, region_name, default, dualstack):
+        """
+        Set the data of one cell.
+
+        Args:
+            service_name: Service name
+            region_name: Region name
+            default: EndpointResult (or dict with hostname, has_ipv4,
+                has_ipv6) of the default endpoint
+            dualstack: Same for the dualstack endpoint
+        """
+        bit = 1 << self.cell(service_name, region_name)
+        clear = ~bit
+
+        default = _as_endpoint_result(default)
+        dualstack = _as_endpoint_result(dualstack)
+
+        values = {
+            'present': True,
+            'default_hostname': default.hostname,
+            'default_ipv4': default.has_ipv4,
+            'default_ipv6': default.has_ipv6,
+            'dualstack_hostname': dualstack.hostname,
+            'dualstack_ipv4': dualstack.has_ipv4,
+            'dualstack_ipv6': dualstack.has_ipv6,
+        }
+
+        for attribute, value in values.items():
+            bitset = getattr(self, attribute) & clear
+            setattr(self, attribute, bitset | bit if value else bitset)
+
+    @classmethod
+    def from_endpoints(cls, endpoints, all_regions=None):
+        """
+        Build a matrix from endpoints.
+
+        Args:
+            endpoints: Iterable of endpoint dicts or EndpointRecords (see Endpoints.collect_endpoints)
+            all_regions: Dict mapping region_name -> {description, partition};
+                if None, only regions that occur in `endpoints` are included
+
+        Returns:
+            EndpointMatrix
+        """
+        endpoints = [as_endpoint_record(ep) for ep in endpoints]
+
+        region_partitions = {ep.region: ep.partition for ep in endpoints}
+        if all_regions is not None:
+            region_partitions.update(
+                (region_name, region_data['partition'])
+                for region_name, region_data in all_regions.items()
+            )
+
+        matrix = cls(
+            sorted({ep.service for ep in endpoints}),
+            sorted(region_partitions),
+            region_partitions,
+        )
+
+        # Collect bit positions first; one int per attribute is built at the end
+        positions = {attribute: [] for attribute in ATTRIBUTES}
+        for ep in endpoints:
+            ep_default = ep.endpoint_default
+            ep_dualstack = ep.endpoint_dualstack
+            cell = matrix.cell(ep.service, ep.region)
+
+            positions['present'].append(cell)
+            if ep_default.hostname:
+                positions['default_hostname'].append(cell)
+            if ep_default.has_ipv4:
+                positions['default_ipv4'].append(cell)
+            if ep_default.has_ipv6:
+                positions['default_ipv6'].append(cell)
+            if ep_dualstack.hostname:
+                positions['dualstack_hostname'].append(cell)
+            if ep_dualstack.has_ipv4:
+                positions['dualstack_ipv4'].append(cell)
+            if ep_dualstack.has_ipv6:
+                positions['dualstack_ipv6'].append(cell)
+
+        for attribute, cells in positions.items():
+            setattr(matrix, attribute, matrix._positions_to_bitset(cells))
+
+        return matrix
+
+    @classmethod
+    def from_rows(cls, rows, region_partitions):
+        """
+        Build a matrix from rows of the endpoint table of endpoints.sqlite.
+
+        Args:
+            rows: Iterable of rows with the columns of the endpoint table
+                (see SqliteWriter), e.g. sqlite3.Rows
+            region_partitions: Dict mapping region_name -> partition_name
+                (regions that occur in `rows` are added)
+
+        Returns:
+            EndpointMatrix
+        """
+        rows = list(rows)
+
+        region_partitions = dict(region_partitions)
+        for row in rows:
+            region_partitions.setdefault(row['region_name'], row['partition_name'])
+
+        matrix = cls(
+            sorted({row['service_name'] for row in rows}),
+            sorted(region_partitions),
+            region_partitions,
+        )
+
+        positions = {attribute: [] for attribute in ATTRIBUTES}
+        for row in rows:
+            cell = matrix.cell(row['service_name'], row['region_name'])
+
+            positions['present'].append(cell)
+            if row['endpoint_default_hostname']:
+                positions['default_hostname'].append(cell)
+            if row['endpoint_default_has_ipv4']:
+                positions['default_ipv4'].append(cell)
+            if row['endpoint_default_has_ipv6']:
+                positions['default_ipv6'].append(cell)
+            if row['endpoint_dualstack_hostname']:
+                positions['dualstack_hostname'].append(cell)
+            if row['endpoint_dualstack_has_ipv4']:
+                positions['dualstack_ipv4'].append(cell)
+            if row['endpoint_dualstack_has_ipv6']:
+                positions['dualstack_ipv6'].append(cell)
+
+        for attribute, cells in positions.items():
+            setattr(matrix, attribute, matrix._positions_to_bitset(cells))
+
+        return matrix
+
+    @classmethod
+    def from_sqlite(cls, sqlite_path):
+        """
+        Build a matrix from an endpoints.sqlite file.
+
+        Args:
+            sqlite_path: Path of the SQLite file (see SqliteWriter)
+
+        Returns:
+            EndpointMatrix
+        """
+        conn = sqlite3.connect(sqlite_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            region_partitions = dict(
+                (row['region_name'], row['partition_name'])
+                for row in conn.execute("SELECT region_name, partition_name FROM region")
+            )
+            rows = conn.execute("SELECT * FROM endpoint").fetchall()
+        finally:
+            conn.close()
+
+        return cls.from_rows(rows, region_partitions)
+
+    def _positions_to_bitset(self, cells):
+        # one bytearray write per cell, then a single conversion to int
+        buf = bytearray((self.cell_count + 7) // 8)
+        for cell in cells:
+            buf[cell >> 3] |= 1 << (cell & 7)
+        return int.from_bytes(buf, 'little')
+
+    # ----- masks -----
+
+    def all_mask(self):
+        """Bitset with all cells set."""
+        return (1 << self.cell_count) - 1
+
+    def service_mask(self, service_name):
+        """Bitset with the cells of one service set."""
+        region_count = len(self.regions)
+        return ((1 << region_count) - 1) << (self._service_index[service_name] * region_count)
+
+    def region_mask(self, region_name):
+        """Bitset with the cells of one region set."""
+        if self._column_mask is None:
+            # one bit per service, len(regions) bits apart
+            self._column_mask = int(('0' * (len(self.regions) - 1) + '1') * len(self.services) or '0', 2)
+        return self._column_mask << self._region_index[region_name]
+
+    def partition_mask(self, partition_name):
+        """Bitset with the cells of all regions in one partition set."""
+        mask = 0
+        for region_name, region_partition in self.region_partitions.items():
+            if region_partition == partition_name and region_name in self._region_index:
+                mask |= self.region_mask(region_name)
+        return mask
+
+    # ----- classification -----
+
+    def classify(self):
+        """
+        Classify all cells.
+
+        Returns:
+            Dict mapping category (see CATEGORIES) -> bitset of the cells
+            in that category. Cells without endpoint row are in none of them.
+        """
+        # Each rule takes the cells it matches out of the remaining ones,
+        # so a cell ends up in the category of the first rule it matches
+        remaining = self.present
+        categories = {}
+        for category, rule in CATEGORY_RULES:
+            cells = remaining
+            for attribute, value in rule.items():
+                bitset = getattr(self, attribute)
+                cells &= bitset if value else ~bitset
+            categories[category] = cells
+            remaining &= ~cells
+
+        return {category: categories[category] for category in CATEGORIES}
+
+    def counters(self):
+        """
+        Get the cells counted by each of COUNTERS.
+
+        Returns:
+            Dict mapping counter name -> bitset of the cells it counts
+        """
+        return {
+            'ipv6_default': self.default_ipv6,
+            'ipv6_dualstack': self.dualstack_ipv6,
+            'ipv6_opt_in': self.dualstack_ipv6 & ~self.default_ipv6,
+            'ipv4_only': self.default_ipv4 & ~self.default_ipv6 & ~self.dualstack_ipv6,
+            'ipv4_default': self.default_ipv4,
+            'active': self.default_ipv4 | self.dualstack_ipv4,
+        }
+
+    def cell_categories(self):
+        """
+        Get the category of every cell.
+
+        Returns:
+            bytes with one CATEGORY_CODES value per cell, in cell order
+        """
+        result = 0
+        for category, bitset in self.classify().items():
+            # categories are disjoint, so OR-ing the byte strings combines them
+            category_bytes = _bitset_to_bytes(bitset, self.cell_count, CATEGORY_CODES[category])
+            result |= int.from_bytes(category_bytes, 'big')
+
+        return result.to_bytes(self.cell_count, 'big')
+
+    def stats(self, mask=None, categories=None):
+        """
+        Count cells per category, like Endpoints.calculate_stats.
+
+        Args:
+            mask: Bitset of cells to count (default: all)
+            categories: Result of classify(), to avoid computing it again
+
+        Returns:
+            dict with count_total, count_enabled, count_ipv6_default,
+            count_ipv6_dualstack, count_ipv4_only, count_nx
+        """
+        if categories is None:
+            categories = self.classify()
+        if mask is None:
+            mask = self.all_mask()
+
+        counts = {category: (bitset & mask).bit_count() for category, bitset in categories.items()}
+        count_enabled = counts['ipv6_default'] + counts['ipv6_dualstack'] + counts['ipv4_only']
+
+        return {
+            "count_total": count_enabled + counts['nx'],
+            "count_enabled": count_enabled,
+            "count_ipv6_default": counts['ipv6_default'],
+            "count_ipv6_dualstack": counts['ipv6_dualstack'],
+            "count_ipv4_only": counts['ipv4_only'],
+            "count_nx": counts['nx'],
+        }
+
+    def counts(self, mask=None, counters=None):
+        """
+        Count cells per counter (see COUNTERS).
+
+        Args:
+            mask: Bitset of cells to count (default: all)
+            counters: Result of counters(), to avoid computing it again
+
+        Returns:
+            Dict mapping counter name -> number of cells
+        """
+        if counters is None:
+            counters = self.counters()
+        if mask is None:
+            mask = self.all_mask()
+
+        return {counter: (bitset & mask).bit_count() for counter, bitset in counters.items()}
+
+    def rollups(self):
+        """
+        Get stats for the whole matrix and per service, region and partition.
+
+        Returns:
+            dict: {
+                'total': stats,
+                'services': {service_name: stats},
+                'regions': {region_name: stats},
+                'partitions': {partition_name: stats},
+            }
+
+            with stats as returned by stats().
+        """
+        categories = self.classify()
+        partition_names = sorted({
+            self.region_partitions[region_name] for region_name in self.regions
+        })
+
+        return {
+            'total': self.stats(categories=categories),
+            'services': {
+                service_name: self.stats(self.service_mask(service_name), categories)
+                for service_name in self.services
+            },
+            'regions': {
+                region_name: self.stats(self.region_mask(region_name), categories)
+                for region_name in self.regions
+            },
+            'partitions': {
+                partition_name: self.stats(self.partition_mask(partition_name), categories)
+                for partition_name in partition_names
+            },
+        }
+
+
+# =============================================================================
+__all__ = [
+    'EndpointMatrix',
+    'CATEGORIES',
+    'CATEGORY_CODES',
+    'COUNTERS',
+]
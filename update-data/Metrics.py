@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Run instrumentation
+
+Latency histograms and counters for the stages of a collection run
+(client creation, ruleset loading, hostname resolution, DNS, output), kept
+in one process-wide registry, METRICS. Instrumented code records into it
+with METRICS.timer() / METRICS.observe() / METRICS.count(); at the end of a
+run it is written as JSON report and, optionally, as Prometheus textfile
+(for node_exporter's textfile collector).
+
+Every observation is recorded in total, and per service and / or per
+partition if given. The Prometheus output has full histograms in total and
+per partition, but only count and sum per service, to keep the number of
+series small.
+
+Worker processes record into their own registry; the parent merges them
+(see Metrics.drain() and Metrics.merge()).
+
+Functions / classes:
+- Metrics: Registry of histograms and counters
+- Histogram: Latency histogram with fixed buckets
+- METRICS: The process-wide registry
+"""
+
+import bisect
+import collections
+import contextlib
+import json
+import math
+import os
+import time
+
+
+# Upper bounds (seconds) of the histogram buckets; the last one catches the rest
+HISTOGRAM_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf,
+)
+
+PROMETHEUS_PREFIX = "awsipv6"
+
+
+class Histogram:
+    """Latency histogram with HISTOGRAM_BUCKETS, plus count, sum and max."""
+
+    __slots__ = ('bucket_counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.bucket_counts = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.bucket_counts[bisect.bisect_left(HISTOGRAM_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for i, bucket_count in enumerate(other.bucket_counts):
+            self.bucket_counts[i] += bucket_count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """Estimate a quantile: the upper bound of the bucket it falls into (at most max)."""
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        cumulative = 0
+        for upper_bound, bucket_count in zip(HISTOGRAM_BUCKETS, self.bucket_counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return min(upper_bound, self.max)
+
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else None,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            # cumulative, as in Prometheus
+            'buckets': {
+                _bucket_label(upper_bound): cumulative
+                for upper_bound, cumulative in zip(HISTOGRAM_BUCKETS, _cumulative(self.bucket_counts))
+            },
+        }
+
+    def __getstate__(self):
+        return (self.bucket_counts, self.count, self.sum, self.max)
+
+    def __setstate__(self, state):
+        (self.bucket_counts, self.count, self.sum, self.max) = state
+
+
+def _cumulative(counts):
+    total = 0
+    result = []
+    for count in counts:
+        total += count
+        result.append(total)
+    return result
+
+
+def _bucket_label(upper_bound):
+    return "+Inf" if upper_bound == math.inf else repr(upper_bound)
+
+
+def _prometheus_labels(labels):
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metrics:
+    """
+    Registry of latency histograms (by stage) and counters (by name).
+
+    Both are kept in total, per service and per partition; keys are
+    (stage or counter name, label name, label value), with label name
+    'total' / 'service' / 'partition'.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = collections.Counter()
+        self.started_at = time.time()
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = collections.Counter()
+        self.started_at = time.time()
+
+    def _label_keys(self, name, service, partition):
+        yield (name, 'total', '')
+        if service is not None:
+            yield (name, 'service', service)
+        if partition is not None:
+            yield (name, 'partition', partition)
+
+    def observe(self, stage, seconds, service=None, partition=None):
+        """
+        Record the duration of one execution of a stage.
+
+        Args:
+            stage: Stage name (e.g. 'hostname')
+            seconds: Duration
+            service: Service name, if the stage ran for one service
+            partition: Partition name, if the stage ran for one partition
+        """
+        for key in self._label_keys(stage, service, partition):
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, stage, service=None, partition=None):
+        """Context manager: observe() the duration of the with block (also if it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, service, partition)
+
+    def count(self, name, n=1, service=None, partition=None):
+        """Add n to a counter."""
+        for key in self._label_keys(name, service, partition):
+            self.counters[key] += n
+
+    def merge(self, other):
+        """Add the observations and counts of another registry (e.g. of a worker)."""
+        for key, histogram in other.histograms.items():
+            if key in self.histograms:
+                self.histograms[key].merge(histogram)
+            else:
+                self.histograms[key] = histogram
+        self.counters.update(other.counters)
+
+    def drain(self):
+        """
+        Get the observations so far as a new registry, and reset this one.
+
+        Returns:
+            Metrics
+        """
+        drained = Metrics()
+        drained.histograms = self.histograms
+        drained.counters = self.counters
+        drained.started_at = self.started_at
+
+        self.histograms = {}
+        self.counters = collections.Counter()
+        return drained
+
+    def __getstate__(self):
+        return (self.histograms, dict(self.counters), self.started_at)
+
+    def __setstate__(self, state):
+        (self.histograms, counters, self.started_at) = state
+        self.counters = collections.Counter(counters)
+
+    # ----- output -----
+
+    def report(self, **extra):
+        """
+        Get all metrics as a JSON-compatible dict.
+
+        Args:
+            extra: Additional top-level entries (e.g. botocore version)
+
+        Returns:
+            dict: {
+                'started_at', 'finished_at', 'duration' (seconds),
+                'stages': {stage: {'total': histogram,
+                                   'services': {service_name: histogram},
+                                   'partitions': {partition_name: histogram}}},
+                'counters': {name: {'total': n, 'services': {...}, 'partitions': {...}}},
+                **extra
+            }
+
+            with histograms as returned by Histogram.to_dict()
+        """
+        finished_at = time.time()
+        report = {
+            'started_at': self.started_at,
+            'finished_at': finished_at,
+            'duration': finished_at - self.started_at,
+            'stages': {},
+            'counters': {},
+            **extra,
+        }
+
+        label_groups = {'service': 'services', 'partition': 'partitions'}
+
+        for (stage, label_name, label_value), histogram in sorted(self.histograms.items()):
+            stage_report = report['stages'].setdefault(stage, {'total': None, 'services': {}, 'partitions': {}})
+            if label_name == 'total':
+                stage_report['total'] = histogram.to_dict()
+            else:
+                stage_report[label_groups[label_name]][label_value] = histogram.to_dict()
+
+        for (name, label_name, label_value), n in sorted(self.counters.items()):
+            counter_report = report['counters'].setdefault(name, {'total': 0, 'services': {}, 'partitions': {}})
+            if label_name == 'total':
+                counter_report['total'] = n
+            else:
+                counter_report[label_groups[label_name]][label_value] = n
+
+        return report
+
+    def slowest(self, stage, label_name='service', limit=10):
+        """
+        Get the label values with the most total time in a stage.
+
+        Returns:
+            List of (label_value, seconds, count), slowest first
+        """
+        totals = [
+            (label_value, histogram.sum, histogram.count)
+            for (key_stage, key_label_name, label_value), histogram in self.histograms.items()
+            if key_stage == stage and key_label_name == label_name
+        ]
+        return sorted(totals, key=lambda total: total[1], reverse=True)[:limit]
+
+    def write_json(self, json_file, **extra):
+        """Write report() to a JSON file."""
+        _write_atomic(json_file, json.dumps(self.report(**extra), indent=4) + '\n')
+
+    def write_prometheus(self, prom_file, prefix=PROMETHEUS_PREFIX):
+        """
+        Write the metrics in Prometheus text format.
+
+        The file is replaced atomically, as node_exporter's textfile
+        collector may read it at any time.
+        """
+        lines = []
+
+        histogram_name = f"{prefix}_stage_duration_seconds"
+        lines.append(f"# HELP {histogram_name} Duration of one execution of a collection stage")
+        lines.append(f"# TYPE {histogram_name} histogram")
+        for (stage, label_name, label_value), histogram in sorted(self.histograms.items()):
+            if label_name == 'service':
+                continue
+
+            labels = {'stage': stage}
+            if label_name == 'partition':
+                labels['partition'] = label_value
+
+            for upper_bound, cumulative in zip(HISTOGRAM_BUCKETS, _cumulative(histogram.bucket_counts)):
+                bucket_labels = _prometheus_labels({**labels, 'le': _bucket_label(upper_bound)})
+                lines.append(f"{histogram_name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{histogram_name}_sum{_prometheus_labels(labels)} {histogram.sum!r}")
+            lines.append(f"{histogram_name}_count{_prometheus_labels(labels)} {histogram.count}")
+
+        service_name = f"{prefix}_service_stage_duration_seconds"
+        lines.append(f"# HELP {service_name} Total duration of a collection stage per service")
+        lines.append(f"# TYPE {service_name} summary")
+        for (stage, label_name, label_value), histogram in sorted(self.histograms.items()):
+            if label_name != 'service':
+                continue
+            labels = _prometheus_labels({'stage': stage, 'service': label_value})
+            lines.append(f"{service_name}_sum{labels} {histogram.sum!r}")
+            lines.append(f"{service_name}_count{labels} {histogram.count}")
+
+        counter_names = sorted({name for (name, _label_name, _label_value) in self.counters})
+        for name in counter_names:
+            metric_name = f"{prefix}_{name}_total"
+            lines.append(f"# TYPE {metric_name} counter")
+            for (key_name, label_name, label_value), n in sorted(self.counters.items()):
+                if key_name != name:
+                    continue
+                labels = {} if label_name == 'total' else {label_name: label_value}
+                lines.append(f"{metric_name}{_prometheus_labels(labels) if labels else ''} {n}")
+
+        lines.append(f"# TYPE {prefix}_run_duration_seconds gauge")
+        lines.append(f"{prefix}_run_duration_seconds {time.time() - self.started_at!r}")
+        lines.append(f"# TYPE {prefix}_run_finished_timestamp_seconds gauge")
+        lines.append(f"{prefix}_run_finished_timestamp_seconds {time.time()!r}")
+
+        _write_atomic(prom_file, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# The process-wide registry
+METRICS = Metrics()
+
+
+# =============================================================================
+__all__ = [
+    'Metrics',
+    'Histogram',
+    'METRICS',
+    'HISTOGRAM_BUCKETS',
+    'PROMETHEUS_PREFIX',
+]
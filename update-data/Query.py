@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Queries over endpoints.sqlite
+
+Typed lookups of endpoint data (as EndpointRecords) by service, region,
+partition and support category, and reverse lookups from hostnames to the
+(service, region) cells that use them, backed by secondary indexes.
+
+The shipped endpoints.sqlite has no secondary indexes, and its hostnames
+are only available through the `endpoint` view (see SqliteWriter). If the
+file doesn't have QUERY_INDEXES, EndpointQuery copies its rows into an
+in-memory table with full hostnames and creates them there, which takes a
+few milliseconds; for a file that is queried often, do that once with
+ensure_indexes() on a local copy.
+
+Functions / classes:
+- EndpointQuery: Queries over one endpoints.sqlite file
+- HostnameMatch: Result of a reverse hostname lookup
+- ensure_indexes: Create QUERY_INDEXES in a database
+- endpoint_category: Support category of an EndpointRecord (from Endpoints)
+"""
+
+import pathlib
+import sqlite3
+import typing
+
+from Endpoints import CATEGORIES, CATEGORY_RULES, EndpointRecord, EndpointResult, endpoint_category
+from SqliteWriter import REGION_SCHEMA
+
+
+# SQL condition per endpoint attribute of Endpoints.CATEGORY_RULES
+_ATTRIBUTE_SQL = {
+    'default_hostname': "COALESCE(endpoint_default_hostname, '') != ''",
+    'default_ipv4': "endpoint_default_has_ipv4",
+    'default_ipv6': "endpoint_default_has_ipv6",
+    'dualstack_hostname': "COALESCE(endpoint_dualstack_hostname, '') != ''",
+    'dualstack_ipv4': "endpoint_dualstack_has_ipv4",
+    'dualstack_ipv6': "endpoint_dualstack_has_ipv6",
+}
+
+
+def _category_sql():
+    lines = ["CASE"]
+    for category, rule in CATEGORY_RULES:
+        if not rule:
+            lines.append(f"    ELSE '{category}'")
+            break
+        condition = " AND ".join(
+            _ATTRIBUTE_SQL[attribute] if value else f"NOT ({_ATTRIBUTE_SQL[attribute]})"
+            for attribute, value in rule.items()
+        )
+        lines.append(f"    WHEN {condition} THEN '{category}'")
+    lines.append("END")
+    return "\n".join(lines)
+
+
+# The category of an endpoint row, generated from Endpoints.CATEGORY_RULES.
+# Queries have to use this exact expression for SQLite to use the
+# endpoint_category index.
+CATEGORY_SQL = _category_sql()
+
+# The endpoint table with full hostnames, which queries run on (the file's
+# `endpoint` view is turned into one, see ensure_indexes())
+ENDPOINT_TABLE_SCHEMA = """
+    CREATE TABLE {table} (
+        service_name TEXT,
+        region_name TEXT,
+        partition_name TEXT,
+        endpoint_default_hostname TEXT,
+        endpoint_default_has_ipv4 INTEGER,
+        endpoint_default_has_ipv6 INTEGER,
+        endpoint_dualstack_hostname TEXT,
+        endpoint_dualstack_has_ipv4 INTEGER,
+        endpoint_dualstack_has_ipv6 INTEGER,
+        PRIMARY KEY (service_name, region_name, partition_name)
+    )
+    WITHOUT ROWID
+"""
+
+# Secondary indexes for queries that don't start with service_name (the
+# primary key covers those)
+QUERY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS endpoint_region ON endpoint (region_name, service_name)",
+    "CREATE INDEX IF NOT EXISTS endpoint_partition ON endpoint (partition_name, service_name)",
+    "CREATE INDEX IF NOT EXISTS endpoint_default_hostname ON endpoint (endpoint_default_hostname)",
+    "CREATE INDEX IF NOT EXISTS endpoint_dualstack_hostname ON endpoint (endpoint_dualstack_hostname)",
+    f"CREATE INDEX IF NOT EXISTS endpoint_category ON endpoint ({CATEGORY_SQL})",
+]
+
+QUERY_INDEX_NAMES = [
+    'endpoint_region',
+    'endpoint_partition',
+    'endpoint_default_hostname',
+    'endpoint_dualstack_hostname',
+    'endpoint_category',
+]
+
+# Hostnames per query in EndpointQuery.lookup_hostnames (stays below
+# SQLite's limit on the number of parameters)
+HOSTNAME_BATCH_SIZE = 500
+
+_ENDPOINT_COLUMNS = """
+    service_name,
+    partition_name,
+    region_name,
+    endpoint_default_hostname,
+    endpoint_default_has_ipv4,
+    endpoint_default_has_ipv6,
+    endpoint_dualstack_hostname,
+    endpoint_dualstack_has_ipv4,
+    endpoint_dualstack_has_ipv6
+"""
+
+
+class HostnameMatch(typing.NamedTuple):
+    """A (service, region) cell that uses a hostname."""
+
+    hostname: str
+    # 'endpoint_default' or 'endpoint_dualstack' (the EndpointRecord field)
+    variant: str
+    record: EndpointRecord
+
+
+def _normalize_hostname(hostname):
+    return hostname.lower().rstrip('.')
+
+
+def _endpoint_record(row):
+    return EndpointRecord.create(
+        row[0],
+        row[1],
+        row[2],
+        EndpointResult.create(row[3], bool(row[4]), bool(row[5])),
+        EndpointResult.create(row[6], bool(row[7]), bool(row[8])),
+    )
+
+
+def _copy_endpoint_table(conn, source, table):
+    """Create `table` (see ENDPOINT_TABLE_SCHEMA) with the rows of `source`."""
+    conn.execute(ENDPOINT_TABLE_SCHEMA.format(table=table))
+    conn.execute(f"""
+        INSERT INTO {table} ({_ENDPOINT_COLUMNS})
+        SELECT {_ENDPOINT_COLUMNS}
+        FROM {source}
+    """)
+
+
+def _materialize_endpoint_view(conn):
+    """
+    Replace the endpoint view (see SqliteWriter) with a table of its rows,
+    and drop the tables the view was built on.
+    """
+    (endpoint_type,) = conn.execute("SELECT type FROM sqlite_master WHERE name = 'endpoint'").fetchone()
+    if endpoint_type != 'view':
+        return
+
+    _copy_endpoint_table(conn, "endpoint", "endpoint_materialized")
+    conn.execute("DROP VIEW endpoint")
+    conn.execute("DROP TABLE endpoint_cell")
+    conn.execute("DROP TABLE hostname_template")
+    conn.execute("ALTER TABLE endpoint_materialized RENAME TO endpoint")
+
+
+def _load_into_memory(uri):
+    """
+    Copy the regions and endpoints of a database into a new in-memory one.
+
+    Only the rows of the endpoint table or view are copied, into a table
+    with full hostnames; the template tables stay behind.
+
+    Returns:
+        sqlite3 connection to the in-memory database
+    """
+    conn = sqlite3.connect("file::memory:", uri=True)
+    conn.execute("ATTACH DATABASE ? AS source", (uri,))
+
+    conn.execute(REGION_SCHEMA)
+    conn.execute("""
+        INSERT INTO region (region_name, partition_name, description)
+        SELECT region_name, partition_name, description
+        FROM source.region
+    """)
+    _copy_endpoint_table(conn, "source.endpoint", "endpoint")
+    conn.commit()
+
+    conn.execute("DETACH DATABASE source")
+    return conn
+
+
+def ensure_indexes(conn):
+    """
+    Create QUERY_INDEXES (unless they exist) and update the query planner's
+    statistics.
+
+    If the database has hostnames as template ids (see SqliteWriter), the
+    endpoint view is replaced by a table with the expanded rows first (see
+    ENDPOINT_TABLE_SCHEMA), and the template tables are dropped.
+
+    Args:
+        conn: sqlite3 connection to an endpoints database
+    """
+    _materialize_endpoint_view(conn)
+
+    for index_sql in QUERY_INDEXES:
+        conn.execute(index_sql)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def _has_indexes(conn):
+    index_names = {
+        name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+    return index_names.issuperset(QUERY_INDEX_NAMES)
+
+
+class EndpointQuery:
+    """
+    Queries over one endpoints.sqlite file (see SqliteWriter).
+
+    Results are EndpointRecords, ordered by service and region name.
+
+        query = EndpointQuery('web/zola/static/endpoints.sqlite')
+        query.endpoints(region='eu-central-1', category='ipv4_only')
+        query.lookup_hostnames(['ec2.eu-central-1.api.aws', ...])
+    """
+
+    def __init__(self, sqlite_path, in_memory=None):
+        """
+        Args:
+            sqlite_path: Path of the SQLite file; opened read-only
+            in_memory: Copy the file into memory and query the copy. The
+                default is to do that only if the file lacks QUERY_INDEXES
+                (which are then created in the copy).
+        """
+        uri = pathlib.Path(sqlite_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+
+        if in_memory is None:
+            in_memory = not _has_indexes(conn)
+
+        if in_memory:
+            conn.close()
+            conn = _load_into_memory(uri)
+            ensure_indexes(conn)
+
+        self.conn = conn
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _records(self, sql, params=()):
+        return [_endpoint_record(row) for row in self.conn.execute(sql, params)]
+
+    def services(self):
+        """Get all service names, sorted."""
+        return [
+            service_name
+            for (service_name,) in self.conn.execute("SELECT DISTINCT service_name FROM endpoint ORDER BY service_name")
+        ]
+
+    def regions(self):
+        """
+        Get all regions.
+
+        Returns:
+            Dict mapping region_name -> {description, partition}, ordered by region name
+        """
+        return {
+            region_name: {'description': description, 'partition': partition_name}
+            for (region_name, partition_name, description) in self.conn.execute(
+                "SELECT region_name, partition_name, description FROM region ORDER BY region_name"
+            )
+        }
+
+    def get(self, service_name, region_name):
+        """
+        Get the endpoint of one (service, region) cell.
+
+        Returns:
+            EndpointRecord, or None if there is no such cell
+        """
+        records = self._records(f"""
+            SELECT {_ENDPOINT_COLUMNS}
+            FROM endpoint
+            WHERE service_name = ? AND region_name = ?
+        """, (service_name, region_name))
+
+        return records[0] if records else None
+
+    def endpoints(self, service=None, region=None, partition=None, category=None):
+        """
+        Get endpoints, optionally filtered (filters are combined with AND).
+
+        Args:
+            service: Service name
+            region: Region name
+            partition: Partition name
+            category: Support category (see CATEGORIES)
+
+        Returns:
+            List of EndpointRecords
+        """
+        if category is not None and category not in CATEGORIES:
+            raise ValueError(f"unknown category: {category}")
+
+        conditions = []
+        params = []
+        for column, value in [
+            ('service_name', service),
+            ('region_name', region),
+            ('partition_name', partition),
+            (CATEGORY_SQL, category),
+        ]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+        return self._records(f"""
+            SELECT {_ENDPOINT_COLUMNS}
+            FROM endpoint
+            {where}
+            ORDER BY service_name, region_name
+        """, params)
+
+    def lookup_hostname(self, hostname):
+        """
+        Get the cells that use a hostname, as default or dualstack endpoint.
+
+        Args:
+            hostname: Hostname (case and a trailing dot are ignored)
+
+        Returns:
+            List of HostnameMatch
+        """
+        return self.lookup_hostnames([hostname]).get(hostname, [])
+
+    def lookup_hostnames(self, hostnames):
+        """
+        Get the cells that use any of many hostnames.
+
+        Args:
+            hostnames: Iterable of hostnames (case and a trailing dot are ignored)
+
+        Returns:
+            Dict mapping hostname (as given) -> list of HostnameMatch;
+            hostnames that no cell uses are left out
+        """
+        given = {}
+        for hostname in hostnames:
+            spellings = given.setdefault(_normalize_hostname(hostname), [])
+            if hostname not in spellings:
+                spellings.append(hostname)
+
+        normalized = list(given)
+        results = {}
+
+        for i in range(0, len(normalized), HOSTNAME_BATCH_SIZE):
+            batch = normalized[i:i + HOSTNAME_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+
+            rows = self.conn.execute(f"""
+                SELECT {_ENDPOINT_COLUMNS}, endpoint_default_hostname, 'endpoint_default'
+                FROM endpoint
+                WHERE endpoint_default_hostname IN ({placeholders})
+                UNION ALL
+                SELECT {_ENDPOINT_COLUMNS}, endpoint_dualstack_hostname, 'endpoint_dualstack'
+                FROM endpoint
+                WHERE endpoint_dualstack_hostname IN ({placeholders})
+            """, batch + batch)
+
+            for row in rows:
+                record = _endpoint_record(row)
+                for hostname in given[row[9]]:
+                    results.setdefault(hostname, []).append(HostnameMatch(hostname, row[10], record))
+
+        # sorted here: with ORDER BY, SQLite scans the table in primary key
+        # order instead of using the hostname indexes
+        for matches in results.values():
+            matches.sort(key=lambda match: (match.record.service, match.record.region))
+
+        return results
+
+
+# =============================================================================
+__all__ = [
+    'EndpointQuery',
+    'HostnameMatch',
+    'ensure_indexes',
+    'endpoint_category',
+    'CATEGORIES',
+    'CATEGORY_SQL',
+    'QUERY_INDEXES',
+    'ENDPOINT_TABLE_SCHEMA',
+]
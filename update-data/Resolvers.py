@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+DNS resolver backends
+
+A resolver backend has one method, `async lookup(hostname)`, which returns
+(has_ipv4, has_ipv6) of a hostname, (False, False) if the name doesn't exist
+or has no addresses, and raises TransientDnsError for failures worth
+retrying (see DnsScheduler, which schedules and retries the lookups).
+
+Backends are plain data, so they can be handed to collect_endpoints()
+workers.
+
+Classes:
+- SystemResolver: The system resolver (getaddrinfo)
+- DnsClient: Direct DNS client, sending A and AAAA queries in parallel over
+  UDP (TCP if the answer is truncated)
+- TransientDnsError: Raised by lookups for failures worth retrying
+
+Functions:
+- parse_nameserver: Parse 'HOST', 'HOST:PORT' or '[IPV6]:PORT'
+- system_nameserver: First nameserver of /etc/resolv.conf
+"""
+
+import asyncio
+import random
+import socket
+import struct
+
+
+# DNS message constants (RFC 1035, RFC 3596)
+TYPE_A = 1
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+
+RCODE_NAMES = {
+    0: 'NOERROR',
+    1: 'FORMERR',
+    2: 'SERVFAIL',
+    3: 'NXDOMAIN',
+    4: 'NOTIMP',
+    5: 'REFUSED',
+}
+
+FLAG_QR = 0x8000
+FLAG_TC = 0x0200
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+
+DNS_PORT = 53
+
+# getaddrinfo() errors that mean the name doesn't exist or has no addresses.
+# EAI_NODATA and EAI_ADDRFAMILY are glibc-only.
+_NOT_FOUND_ERRORS = {
+    getattr(socket, name)
+    for name in ['EAI_NONAME', 'EAI_NODATA', 'EAI_ADDRFAMILY']
+    if hasattr(socket, name)
+}
+
+
+class TransientDnsError(Exception):
+    """A lookup failed for a reason that may go away (e.g. SERVFAIL); retried."""
+
+
+def _addrinfo_families(addrinfo):
+    """
+    Check getaddrinfo() output for IPv4 / IPv6 addresses.
+
+    Args:
+        addrinfo: List of getaddrinfo() tuples
+
+    Returns:
+        Tuple (has_ipv4, has_ipv6)
+    """
+    has_ipv4 = False
+    has_ipv6 = False
+
+    for (family, _socktype, _proto, _canon_name, _addr) in addrinfo:
+        has_ipv4 |= (family == socket.AddressFamily.AF_INET)
+        has_ipv6 |= (family == socket.AddressFamily.AF_INET6)
+
+    return has_ipv4, has_ipv6
+
+
+class SystemResolver:
+    """
+    The system resolver (getaddrinfo), run on the event loop's executor.
+
+    getaddrinfo() only tells whether a name has any addresses, so a name
+    that exists without A / AAAA records looks the same as NXDOMAIN.
+    """
+
+    async def lookup(self, hostname):
+        """
+        Look up a hostname.
+
+        Returns:
+            Tuple (has_ipv4, has_ipv6); (False, False) if the name doesn't exist
+
+        Raises:
+            TransientDnsError: The resolver failed (EAI_AGAIN, EAI_FAIL, ...)
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            addrinfo = await loop.getaddrinfo(hostname, 443)
+        except socket.gaierror as e:
+            if e.errno in _NOT_FOUND_ERRORS:
+                return (False, False)
+            raise TransientDnsError(f"{hostname}: {e}") from e
+
+        return _addrinfo_families(addrinfo)
+
+    def __repr__(self):
+        return "SystemResolver()"
+
+
+# ----- DNS messages -----
+
+def encode_name(hostname):
+    """Encode a hostname as a sequence of DNS labels."""
+    labels = hostname.rstrip('.').encode('ascii').split(b'.')
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\0'
+
+
+def decode_name(message, offset):
+    """
+    Decode a (possibly compressed) name in a DNS message.
+
+    Returns:
+        Tuple (hostname, offset after the name)
+    """
+    labels = []
+    end = None
+    for _ in range(128):  # guard against compression loops
+        length = message[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = ((length & 0x3F) << 8) | message[offset + 1]
+        elif length == 0:
+            return '.'.join(labels), (offset + 1 if end is None else end)
+        else:
+            labels.append(message[offset + 1:offset + 1 + length].decode('ascii'))
+            offset += 1 + length
+
+    raise ValueError("DNS name compression loop")
+
+
+def build_query(query_id, hostname, qtype):
+    """Build a DNS query message (recursion desired)."""
+    return (
+        struct.pack('!HHHHHH', query_id, FLAG_RD, 1, 0, 0, 0)
+        + encode_name(hostname)
+        + struct.pack('!HH', qtype, CLASS_IN)
+    )
+
+
+def parse_response(message, query_id, qtype):
+    """
+    Parse the response to a query built by build_query().
+
+    CNAME chains are followed by the recursive resolver, so the answer
+    section just has to contain a record of the queried type.
+
+    Returns:
+        Tuple (rcode, truncated, has_record)
+
+    Raises:
+        ValueError: Malformed or truncated message, or not a response to
+            that query
+    """
+    if len(message) < 12:
+        raise ValueError("short DNS message")
+
+    (response_id, flags, qdcount, ancount, _nscount, _arcount) = struct.unpack_from('!HHHHHH', message)
+    if response_id != query_id or not flags & FLAG_QR:
+        raise ValueError("not a response to this query")
+
+    rcode = flags & 0x000F
+    truncated = bool(flags & FLAG_TC)
+
+    offset = 12
+    has_record = False
+    try:
+        for _ in range(qdcount):
+            _name, offset = decode_name(message, offset)
+            offset += 4
+
+        if not truncated:
+            for _ in range(ancount):
+                _name, offset = decode_name(message, offset)
+                (rtype, rclass, _ttl, rdlength) = struct.unpack_from('!HHIH', message, offset)
+                offset += 10 + rdlength
+                has_record |= (rtype == qtype and rclass == CLASS_IN)
+    except (struct.error, IndexError) as e:
+        # a section runs past the end of the message
+        raise ValueError(f"truncated DNS message: {e}") from e
+
+    return rcode, truncated, has_record
+
+
+class _UdpQueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, query_id, qtype):
+        self.query_id = query_id
+        self.qtype = qtype
+        self.result = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if self.result.done():
+            return
+        if len(data) < 2 or int.from_bytes(data[:2], 'big') != self.query_id:
+            # stray packet; keep waiting for the answer
+            return
+        try:
+            self.result.set_result(parse_response(data, self.query_id, self.qtype))
+        except ValueError as e:
+            self.result.set_exception(TransientDnsError(f"bad UDP response: {e}"))
+
+    def error_received(self, exc):
+        if not self.result.done():
+            self.result.set_exception(TransientDnsError(f"UDP error: {exc}"))
+
+
+def parse_nameserver(nameserver):
+    """
+    Parse a nameserver address.
+
+    Args:
+        nameserver: 'HOST', 'HOST:PORT', '[IPV6]:PORT' or an IPv6 address
+
+    Returns:
+        Tuple (host, port)
+    """
+    if nameserver.startswith('['):
+        host, _, port = nameserver[1:].partition(']')
+        return host, int(port.lstrip(':') or DNS_PORT)
+    if nameserver.count(':') == 1:
+        host, port = nameserver.split(':')
+        return host, int(port)
+    return nameserver, DNS_PORT
+
+
+def system_nameserver(resolv_conf='/etc/resolv.conf'):
+    """
+    Get the first nameserver of resolv.conf.
+
+    Returns:
+        Tuple (host, port); ('127.0.0.1', 53) if none is configured
+    """
+    try:
+        with open(resolv_conf) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == 'nameserver':
+                    return fields[1], DNS_PORT
+    except OSError:
+        pass
+
+    return '127.0.0.1', DNS_PORT
+
+
+class DnsClient:
+    """
+    Direct DNS client: sends the A and AAAA queries of a hostname in
+    parallel to one recursive nameserver, without going through getaddrinfo
+    and its thread pool.
+
+    Queries go over UDP; an answer with the TC (truncated) bit set is
+    repeated over TCP. NXDOMAIN and NOERROR without records of the queried
+    type mean "no addresses of that family"; any other response code is a
+    TransientDnsError. Timeouts are left to the caller (see DnsScheduler).
+    """
+
+    def __init__(self, nameserver=None):
+        """
+        Args:
+            nameserver: (host, port) of the nameserver (default: the first
+                nameserver in /etc/resolv.conf)
+        """
+        self.nameserver = tuple(nameserver) if nameserver is not None else system_nameserver()
+
+    def __repr__(self):
+        return f"DnsClient({self.nameserver!r})"
+
+    async def lookup(self, hostname):
+        """
+        Look up a hostname (A and AAAA in parallel).
+
+        Returns:
+            Tuple (has_ipv4, has_ipv6); (False, False) if the name doesn't exist
+
+        Raises:
+            TransientDnsError: A query failed (SERVFAIL, REFUSED, network error, ...)
+        """
+        has_ipv4, has_ipv6 = await asyncio.gather(
+            self.query(hostname, TYPE_A),
+            self.query(hostname, TYPE_AAAA),
+        )
+        return has_ipv4, has_ipv6
+
+    async def query(self, hostname, qtype):
+        """
+        Send one query.
+
+        Returns:
+            True if the answer has records of type `qtype`
+        """
+        query_id = random.getrandbits(16)
+        message = build_query(query_id, hostname, qtype)
+
+        rcode, truncated, has_record = await self._query_udp(message, query_id, qtype)
+        if truncated:
+            rcode, truncated, has_record = await self._query_tcp(message, query_id, qtype)
+
+        if rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            return has_record
+
+        raise TransientDnsError(f"{hostname}: {RCODE_NAMES.get(rcode, rcode)}")
+
+    async def _query_udp(self, message, query_id, qtype):
+        loop = asyncio.get_running_loop()
+        try:
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda: _UdpQueryProtocol(query_id, qtype),
+                remote_addr=self.nameserver,
+            )
+        except OSError as e:
+            raise TransientDnsError(f"UDP error: {e}") from e
+
+        try:
+            transport.sendto(message)
+            return await protocol.result
+        finally:
+            transport.close()
+
+    async def _query_tcp(self, message, query_id, qtype):
+        try:
+            reader, writer = await asyncio.open_connection(*self.nameserver)
+        except OSError as e:
+            raise TransientDnsError(f"TCP error: {e}") from e
+
+        try:
+            writer.write(struct.pack('!H', len(message)) + message)
+            await writer.drain()
+            (length,) = struct.unpack('!H', await reader.readexactly(2))
+            response = await reader.readexactly(length)
+        except (OSError, asyncio.IncompleteReadError) as e:
+            raise TransientDnsError(f"TCP error: {e}") from e
+        finally:
+            writer.close()
+
+        try:
+            return parse_response(response, query_id, qtype)
+        except ValueError as e:
+            raise TransientDnsError(f"bad TCP response: {e}") from e
+
+
+# =============================================================================
+__all__ = [
+    'SystemResolver',
+    'DnsClient',
+    'TransientDnsError',
+    'parse_nameserver',
+    'system_nameserver',
+    'encode_name',
+    'decode_name',
+    'build_query',
+    'parse_response',
+    'TYPE_A',
+    'TYPE_AAAA',
+    'CLASS_IN',
+    'RCODE_NOERROR',
+    'RCODE_SERVFAIL',
+    'RCODE_NXDOMAIN',
+]
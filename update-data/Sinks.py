@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Streaming outputs for endpoint data
+
+Each sink takes endpoints one at a time (EndpointRecords as yielded by
+collect_endpoint_records, or endpoint dicts) via write(), and finishes its output on close(). That
+way the full endpoint list never has to be kept in memory, and writing
+output overlaps with collecting data.
+
+Sinks:
+- JsonSink: endpoints.json, same format as json.dump(endpoints, indent=4)
+- TextSink: endpoints.text, sorted lines; sorts in chunks that are spilled
+  to temporary files, so memory use is bounded
+- SqliteSink: endpoints.sqlite (see SqliteWriter)
+- HistorySink: a new snapshot in a HistoryStore (see History)
+
+Outputs are written to a temporary file next to the target, and only
+moved into place by close(), so an aborted run doesn't leave truncated
+files behind. HistorySink only commits its snapshot in close(), for the
+same reason.
+
+Functions:
+- endpoint_text_lines: Lines of endpoints.text for one endpoint
+"""
+
+import heapq
+import json
+import os
+import tempfile
+
+from Endpoints import as_endpoint_record
+from Hostnames import HostnameTemplates
+from SqliteWriter import open_sqlite, insert_endpoints, close_sqlite
+
+
+# TextSink: number of lines sorted in memory before spilling to a temp file
+TEXT_SORT_BUFFER_LINES = 100_000
+
+# SqliteSink: number of rows inserted per executemany()
+SQLITE_BATCH_SIZE = 1000
+
+
+def endpoint_text_lines(ep):
+    """
+    Get the lines of endpoints.text for one endpoint.
+
+    Args:
+        ep: EndpointRecord or endpoint dict (see Endpoints.collect_endpoints)
+
+    Returns:
+        List of strings (without newline), e.g.
+        'ec2.us-east-1.amazonaws.com [ipv4] (default)'
+    """
+    lines = []
+
+    ep = as_endpoint_record(ep)
+    ep_default = ep.endpoint_default
+    ep_dualstack = ep.endpoint_dualstack
+
+    hostname_default = ep_default.hostname
+    hostname_dualstack = ep_dualstack.hostname
+
+    if hostname_default:
+        tags = []
+        if ep_default.has_ipv4:
+            tags.append('ipv4')
+        if ep_default.has_ipv6:
+            tags.append('ipv6')
+        tags_str = " [" + ", ".join(tags) + "]" if tags else ""
+        lines.append(f"{hostname_default}{tags_str} (default)")
+
+    if hostname_dualstack and hostname_dualstack != hostname_default:
+        tags = []
+        if ep_dualstack.has_ipv4:
+            tags.append('ipv4')
+        if ep_dualstack.has_ipv6:
+            tags.append('ipv6')
+        tags_str = " [" + ", ".join(tags) + "]" if tags else ""
+        lines.append(f"{hostname_dualstack}{tags_str} (dualstack)")
+
+    return lines
+
+
+class JsonSink:
+    """Writes endpoints as a JSON list, one element at a time."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(f"{path}.tmp", "w")
+        self._count = 0
+
+    def write(self, ep):
+        if not isinstance(ep, dict):
+            ep = ep.to_dict()
+
+        # same layout as json.dump(endpoints, indent=4)
+        element = json.dumps(ep, indent=4).replace("\n", "\n    ")
+        self._file.write(("[\n    " if self._count == 0 else ",\n    ") + element)
+        self._count += 1
+
+    def close(self):
+        self._file.write("\n]" if self._count > 0 else "[]")
+        self._file.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class TextSink:
+    """Writes the sorted lines of endpoint_text_lines(), with bounded memory."""
+
+    def __init__(self, path, buffer_lines=TEXT_SORT_BUFFER_LINES):
+        self.path = path
+        self.buffer_lines = buffer_lines
+        self._lines = []
+        self._runs = []
+
+    def _spill(self):
+        run = tempfile.TemporaryFile("w+")
+        for line in sorted(self._lines):
+            print(line, file=run)
+        run.seek(0)
+
+        self._runs.append(run)
+        self._lines = []
+
+    def write(self, ep):
+        self._lines.extend(endpoint_text_lines(ep))
+        if len(self._lines) >= self.buffer_lines:
+            self._spill()
+
+    def close(self):
+        runs = [(line.rstrip("\n") for line in run) for run in self._runs]
+        runs.append(iter(sorted(self._lines)))
+
+        with open(f"{self.path}.tmp", "w") as text_file:
+            for line in heapq.merge(*runs):
+                print(line, file=text_file)
+        os.replace(f"{self.path}.tmp", self.path)
+
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._lines = []
+
+
+class SqliteSink:
+    """Writes endpoints to a new SQLite file, in batches."""
+
+    def __init__(self, path, all_regions, batch_size=SQLITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._conn = open_sqlite(f"{path}.tmp", all_regions)
+        self._templates = HostnameTemplates()
+        self._batch = []
+
+    def write(self, ep):
+        self._batch.append(ep)
+        if len(self._batch) >= self.batch_size:
+            insert_endpoints(self._conn, self._batch, self._templates)
+            self._batch = []
+
+    def close(self):
+        insert_endpoints(self._conn, self._batch, self._templates)
+        self._batch = []
+        close_sqlite(self._conn, self._templates)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+class HistorySink:
+    """Adds endpoints as a new snapshot to a HistoryStore, in batches."""
+
+    def __init__(self, history_store, all_regions, taken_at=None, batch_size=SQLITE_BATCH_SIZE):
+        self.history_store = history_store
+        self.batch_size = batch_size
+        self.result = None
+        self._batch = []
+
+        history_store.open_snapshot(all_regions, taken_at)
+
+    def write(self, ep):
+        self._batch.append(ep)
+        if len(self._batch) >= self.batch_size:
+            self.history_store.stage_endpoints(self._batch)
+            self._batch = []
+
+    def close(self):
+        self.history_store.stage_endpoints(self._batch)
+        self._batch = []
+        # {snapshot_id, added, changed, removed}
+        self.result = self.history_store.close_snapshot()
+
+
+# =============================================================================
+__all__ = [
+    'JsonSink',
+    'TextSink',
+    'SqliteSink',
+    'HistorySink',
+    'endpoint_text_lines',
+]
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Indexed endpoints.json snapshot reader
+
+Reads single (service, region) records of an endpoints.json snapshot (see
+JsonSink) without parsing the whole file: the file is memory-mapped, and a
+sidecar index (`<snapshot>.idx`) has the byte range of each record, so only
+the records asked for are decoded.
+
+The index is built on first use, by parsing the snapshot once, and saved
+next to it (if the directory is writable; otherwise it is only kept in
+memory). It records size and mtime of the snapshot and is rebuilt if either
+changed.
+
+Index file layout (little-endian):
+- INDEX_MAGIC
+- header: snapshot size, snapshot mtime (ns), length of the names block,
+  number of entries
+- names block: JSON {"services": [...], "regions": [...], "partitions": [...]}
+- entries, in file order: service id, region id, partition id (indexes into
+  the names lists), byte offset, byte length
+
+Functions / classes:
+- SnapshotReader: Random access to and filtered iteration over a snapshot
+- build_snapshot_index: Build the index of a snapshot
+- save_snapshot_index / load_snapshot_index: (De)serialise an index
+"""
+
+import json
+import mmap
+import os
+import struct
+
+
+INDEX_MAGIC = b"AWSIPV6I\x01"
+INDEX_SUFFIX = ".idx"
+
+_HEADER = struct.Struct("<QqII")
+_ENTRY = struct.Struct("<HHHQI")
+
+ORDER_SERVICE = "service"
+ORDER_REGION = "region"
+
+
+class SnapshotIndex:
+    """
+    Index of an endpoints.json snapshot.
+
+    Attributes:
+        services, regions, partitions: Lists of names, referenced by the entries
+        entries: List of (service id, region id, partition id, offset, length),
+            in file order
+        source_size, source_mtime_ns: Size / mtime of the indexed snapshot
+    """
+
+    def __init__(self, services, regions, partitions, entries, source_size, source_mtime_ns):
+        self.services = services
+        self.regions = regions
+        self.partitions = partitions
+        self.entries = entries
+        self.source_size = source_size
+        self.source_mtime_ns = source_mtime_ns
+
+    def matches(self, json_file):
+        """Check whether this index is (still) the index of json_file."""
+        stat = os.stat(json_file)
+        return (stat.st_size, stat.st_mtime_ns) == (self.source_size, self.source_mtime_ns)
+
+
+def _skip_whitespace(text, pos):
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def build_snapshot_index(json_file):
+    """
+    Build the index of a snapshot, by parsing it once.
+
+    Args:
+        json_file: Path to endpoints.json (a JSON list of endpoint dicts)
+
+    Returns:
+        SnapshotIndex
+
+    Raises:
+        ValueError: The file is not a JSON list
+    """
+    stat = os.stat(json_file)
+    with open(json_file, "rb") as f:
+        data = f.read()
+
+    text = data.decode("utf-8")
+    # json.dump() writes ASCII by default; otherwise offsets in the text
+    # have to be converted to byte offsets
+    is_ascii = (len(text) == len(data))
+
+    names = {"services": {}, "regions": {}, "partitions": {}}
+
+    def name_id(kind, name):
+        ids = names[kind]
+        if name not in ids:
+            ids[name] = len(ids)
+        return ids[name]
+
+    decoder = json.JSONDecoder()
+    entries = []
+    byte_pos = 0
+    text_pos = 0
+
+    pos = _skip_whitespace(text, 0)
+    if not text.startswith("[", pos):
+        raise ValueError(f"{json_file}: not a JSON list")
+    pos = _skip_whitespace(text, pos + 1)
+
+    while not text.startswith("]", pos):
+        ep, end = decoder.raw_decode(text, pos)
+
+        if is_ascii:
+            offset, length = pos, end - pos
+        else:
+            byte_pos += len(text[text_pos:pos].encode("utf-8"))
+            length = len(text[pos:end].encode("utf-8"))
+            offset = byte_pos
+            byte_pos += length
+            text_pos = end
+
+        entries.append((
+            name_id("services", ep["service"]),
+            name_id("regions", ep["region"]),
+            name_id("partitions", ep["partition"]),
+            offset,
+            length,
+        ))
+
+        pos = _skip_whitespace(text, end)
+        if text.startswith(",", pos):
+            pos = _skip_whitespace(text, pos + 1)
+        elif not text.startswith("]", pos):
+            raise ValueError(f"{json_file}: expected ',' or ']' at character {pos}")
+
+    return SnapshotIndex(
+        list(names["services"]),
+        list(names["regions"]),
+        list(names["partitions"]),
+        entries,
+        stat.st_size,
+        stat.st_mtime_ns,
+    )
+
+
+def save_snapshot_index(index, index_file):
+    """
+    Save a snapshot index.
+
+    Args:
+        index: SnapshotIndex
+        index_file: Path to index file
+    """
+    names = json.dumps({
+        "services": index.services,
+        "regions": index.regions,
+        "partitions": index.partitions,
+    }).encode("utf-8")
+
+    tmp_file = f"{index_file}.tmp.{os.getpid()}"
+    with open(tmp_file, "wb") as f:
+        f.write(INDEX_MAGIC)
+        f.write(_HEADER.pack(index.source_size, index.source_mtime_ns, len(names), len(index.entries)))
+        f.write(names)
+        f.write(b"".join(_ENTRY.pack(*entry) for entry in index.entries))
+    os.replace(tmp_file, index_file)
+
+
+def load_snapshot_index(index_file):
+    """
+    Load a snapshot index saved by save_snapshot_index().
+
+    Args:
+        index_file: Path to index file
+
+    Returns:
+        SnapshotIndex, or None if the file doesn't exist or isn't an index
+    """
+    try:
+        with open(index_file, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+
+    if not data.startswith(INDEX_MAGIC):
+        return None
+
+    pos = len(INDEX_MAGIC)
+    try:
+        (source_size, source_mtime_ns, names_length, entry_count) = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        names = json.loads(data[pos:pos + names_length])
+        pos += names_length
+        if len(data) - pos != entry_count * _ENTRY.size:
+            return None
+        entries = list(_ENTRY.iter_unpack(data[pos:]))
+    except (struct.error, ValueError):
+        return None
+
+    return SnapshotIndex(
+        names["services"],
+        names["regions"],
+        names["partitions"],
+        entries,
+        source_size,
+        source_mtime_ns,
+    )
+
+
+class SnapshotReader:
+    """
+    Random access to the records of an endpoints.json snapshot.
+
+    Records are endpoint dicts, as returned by load_endpoints_from_json()
+    (see Endpoints.as_endpoint_record() to convert them).
+
+        with SnapshotReader('endpoints.json') as snapshot:
+            ep = snapshot.get('ec2', 'eu-central-1')
+            for ep in snapshot.records(services=['s3', 'sqs'], order='region'):
+                ...
+    """
+
+    def __init__(self, json_file, index_file=None, save_index=True):
+        """
+        Args:
+            json_file: Path to endpoints.json
+            index_file: Path to its index (default: json_file + INDEX_SUFFIX)
+            save_index: Save the index if it had to be built (ignored if the
+                directory isn't writable)
+        """
+        self.json_file = json_file
+        self.index_file = index_file or f"{json_file}{INDEX_SUFFIX}"
+
+        index = load_snapshot_index(self.index_file)
+        if index is None or not index.matches(json_file):
+            index = build_snapshot_index(json_file)
+            if save_index:
+                try:
+                    save_snapshot_index(index, self.index_file)
+                except OSError:
+                    pass
+        self.index = index
+
+        self._file = open(json_file, "rb")
+        # mmap() can't map empty files
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if index.source_size else b""
+
+        # (service id, region id) -> entry
+        self._cells = {(entry[0], entry[1]): entry for entry in index.entries}
+        self._service_ids = {name: i for i, name in enumerate(index.services)}
+        self._region_ids = {name: i for i, name in enumerate(index.regions)}
+        self._partition_ids = {name: i for i, name in enumerate(index.partitions)}
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.index.entries)
+
+    def __contains__(self, cell):
+        (service_name, region_name) = cell
+        return self._cell_entry(service_name, region_name) is not None
+
+    @property
+    def services(self):
+        """Sorted list of service names in the snapshot."""
+        return sorted(self.index.services)
+
+    @property
+    def regions(self):
+        """Sorted list of region names in the snapshot."""
+        return sorted(self.index.regions)
+
+    @property
+    def partitions(self):
+        """Sorted list of partition names in the snapshot."""
+        return sorted(self.index.partitions)
+
+    def _cell_entry(self, service_name, region_name):
+        service_id = self._service_ids.get(service_name)
+        region_id = self._region_ids.get(region_name)
+        return self._cells.get((service_id, region_id))
+
+    def _decode(self, entry):
+        offset, length = entry[3], entry[4]
+        return json.loads(self._mmap[offset:offset + length])
+
+    def get(self, service_name, region_name):
+        """
+        Get the record of one (service, region) cell.
+
+        Returns:
+            Endpoint dict, or None if the snapshot has no such cell
+        """
+        entry = self._cell_entry(service_name, region_name)
+        return self._decode(entry) if entry is not None else None
+
+    def records(self, services=None, regions=None, partitions=None, order=ORDER_SERVICE):
+        """
+        Iterate over records, decoding only the selected ones.
+
+        Args:
+            services: Only these service names (default: all)
+            regions: Only these region names (default: all)
+            partitions: Only these partition names (default: all)
+            order: ORDER_SERVICE (service-major: by service name, then in
+                file order, i.e. region order of the collection run) or
+                ORDER_REGION (region-major: by region name, then service name)
+
+        Yields:
+            Endpoint dicts
+        """
+        def ids(names, name_ids):
+            return None if names is None else {name_ids[name] for name in names if name in name_ids}
+
+        service_ids = ids(services, self._service_ids)
+        region_ids = ids(regions, self._region_ids)
+        partition_ids = ids(partitions, self._partition_ids)
+
+        entries = [
+            entry for entry in self.index.entries
+            if (service_ids is None or entry[0] in service_ids)
+            and (region_ids is None or entry[1] in region_ids)
+            and (partition_ids is None or entry[2] in partition_ids)
+        ]
+
+        if order == ORDER_SERVICE:
+            entries.sort(key=lambda entry: self.index.services[entry[0]])
+        elif order == ORDER_REGION:
+            entries.sort(key=lambda entry: (self.index.regions[entry[1]], self.index.services[entry[0]]))
+        else:
+            raise ValueError(f"unknown order: {order}")
+
+        for entry in entries:
+            yield self._decode(entry)
+
+    def __iter__(self):
+        return self.records()
+
+
+# =============================================================================
+__all__ = [
+    'SnapshotReader',
+    'SnapshotIndex',
+    'build_snapshot_index',
+    'save_snapshot_index',
+    'load_snapshot_index',
+    'INDEX_SUFFIX',
+    'ORDER_SERVICE',
+    'ORDER_REGION',
+]
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+SQLite output for endpoint data
+
+Writes endpoints.sqlite, which is shipped to browsers as-is (see the
+endpoints matrix), so the file is built for size and read performance:
+
+- a fresh database, loaded with executemany() in a single transaction
+- no journal and no fsyncs while loading (the file is rebuilt from scratch
+  anyway, a crash just means running again)
+- secondary indexes (if any) created after the load
+- VACUUM and ANALYZE at the end, so the file is compact and the query
+  planner has statistics
+- hostnames stored as template ids (see Hostnames), which halves the file:
+  the endpoint_cell table has the ids, hostname_template the templates, and
+  the `endpoint` view expands them, so readers see full hostnames
+
+Functions:
+- write_sqlite: Write regions and endpoints to a new SQLite file
+- open_sqlite / insert_endpoints / close_sqlite: The same, step by step
+- endpoint_row: Row of an endpoint with full hostnames
+"""
+
+import pathlib
+import sqlite3
+
+from Endpoints import as_endpoint_record
+from Hostnames import HostnameTemplates, expand_hostname_sql
+
+
+# Page size of the output file. Smaller pages don't make the file smaller:
+# endpoint rows are big enough to spill into overflow pages then.
+SQLITE_PAGE_SIZE = 4096
+
+REGION_SCHEMA = """
+    CREATE TABLE region (
+        region_name TEXT,
+        partition_name TEXT,
+        description TEXT,
+        PRIMARY KEY (region_name, partition_name)
+    )
+    WITHOUT ROWID
+"""
+
+HOSTNAME_TEMPLATE_SCHEMA = """
+    CREATE TABLE hostname_template (
+        template_id INTEGER PRIMARY KEY,
+        template TEXT
+    )
+"""
+
+ENDPOINT_CELL_SCHEMA = """
+    CREATE TABLE endpoint_cell (
+        service_name TEXT,
+        region_name TEXT,
+        partition_name TEXT,
+        endpoint_default_template_id INTEGER,
+        endpoint_default_has_ipv4 INTEGER,
+        endpoint_default_has_ipv6 INTEGER,
+        endpoint_dualstack_template_id INTEGER,
+        endpoint_dualstack_has_ipv4 INTEGER,
+        endpoint_dualstack_has_ipv6 INTEGER,
+        PRIMARY KEY (service_name, region_name, partition_name)
+    )
+    WITHOUT ROWID
+"""
+
+# The endpoint table as readers know it, with expanded hostnames
+ENDPOINT_VIEW_SCHEMA = f"""
+    CREATE VIEW endpoint AS
+    SELECT
+        c.service_name,
+        c.region_name,
+        c.partition_name,
+        {expand_hostname_sql("t_default.template", "c.service_name", "c.region_name")} AS endpoint_default_hostname,
+        c.endpoint_default_has_ipv4,
+        c.endpoint_default_has_ipv6,
+        {expand_hostname_sql("t_dualstack.template", "c.service_name", "c.region_name")} AS endpoint_dualstack_hostname,
+        c.endpoint_dualstack_has_ipv4,
+        c.endpoint_dualstack_has_ipv6
+    FROM endpoint_cell c
+    LEFT JOIN hostname_template t_default ON t_default.template_id = c.endpoint_default_template_id
+    LEFT JOIN hostname_template t_dualstack ON t_dualstack.template_id = c.endpoint_dualstack_template_id
+"""
+
+# Secondary indexes (on endpoint_cell), created after loading the data. The
+# shipped file has none: the browser only does primary key lookups, and an
+# index on e.g. region_name makes the compressed download ~45% bigger.
+ENDPOINT_INDEXES = []
+
+
+def endpoint_row(ep):
+    """
+    Get the row of an endpoint with full hostnames and 0/1 flags (History
+    stores endpoints in this form).
+
+    Args:
+        ep: EndpointRecord or endpoint dict
+
+    Returns:
+        Tuple of service_name, partition_name, region_name,
+        endpoint_default_hostname, endpoint_default_has_ipv4,
+        endpoint_default_has_ipv6, endpoint_dualstack_hostname,
+        endpoint_dualstack_has_ipv4, endpoint_dualstack_has_ipv6
+    """
+    ep = as_endpoint_record(ep)
+    ep_default = ep.endpoint_default
+    ep_dualstack = ep.endpoint_dualstack
+
+    return (
+        ep.service,
+        ep.partition,
+        ep.region,
+        ep_default.hostname,
+        int(ep_default.has_ipv4),
+        int(ep_default.has_ipv6),
+        ep_dualstack.hostname,
+        int(ep_dualstack.has_ipv4),
+        int(ep_dualstack.has_ipv6),
+    )
+
+
+def _endpoint_cell_row(ep, templates):
+    ep = as_endpoint_record(ep)
+    ep_default = ep.endpoint_default
+    ep_dualstack = ep.endpoint_dualstack
+
+    return (
+        ep.service,
+        ep.partition,
+        ep.region,
+        templates.id_for(ep_default.hostname, ep.service, ep.region),
+        int(ep_default.has_ipv4),
+        int(ep_default.has_ipv6),
+        templates.id_for(ep_dualstack.hostname, ep.service, ep.region),
+        int(ep_dualstack.has_ipv4),
+        int(ep_dualstack.has_ipv6),
+    )
+
+
+def open_sqlite(sqlite_path, all_regions):
+    """
+    Create a new SQLite file and start loading data into it.
+
+    An existing file at sqlite_path is replaced. Load endpoints with
+    insert_endpoints(), then call close_sqlite(), with the same
+    HostnameTemplates for both.
+
+    Args:
+        sqlite_path: Path of the SQLite file
+        all_regions: Dict mapping region_name -> {description, partition}
+
+    Returns:
+        sqlite3 connection, with an open transaction
+    """
+    pathlib.Path(sqlite_path).unlink(missing_ok=True)
+
+    conn = sqlite3.connect(sqlite_path, isolation_level=None)
+    conn.execute(f"PRAGMA page_size = {SQLITE_PAGE_SIZE}")
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    conn.execute("BEGIN")
+
+    conn.execute(REGION_SCHEMA)
+    conn.execute(HOSTNAME_TEMPLATE_SCHEMA)
+    conn.execute(ENDPOINT_CELL_SCHEMA)
+    conn.execute(ENDPOINT_VIEW_SCHEMA)
+
+    conn.executemany("""
+        INSERT INTO region (region_name, partition_name, description)
+        VALUES (?, ?, ?)
+    """, (
+        (region_name, region_data['partition'], region_data['description'])
+        for region_name, region_data in all_regions.items()
+    ))
+
+    return conn
+
+
+def insert_endpoints(conn, endpoints, templates):
+    """
+    Load endpoints into a database opened with open_sqlite().
+
+    Args:
+        conn: sqlite3 connection
+        endpoints: Iterable of EndpointRecords or endpoint dicts (see Endpoints.collect_endpoints)
+        templates: HostnameTemplates; the templates of the endpoints'
+            hostnames are added to it, and written by close_sqlite()
+
+    Returns:
+        Number of endpoint rows written
+    """
+    cur = conn.executemany("""
+        INSERT INTO endpoint_cell (
+            service_name,
+            partition_name,
+            region_name,
+            endpoint_default_template_id,
+            endpoint_default_has_ipv4,
+            endpoint_default_has_ipv6,
+            endpoint_dualstack_template_id,
+            endpoint_dualstack_has_ipv4,
+            endpoint_dualstack_has_ipv6
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (_endpoint_cell_row(ep, templates) for ep in endpoints))
+
+    return cur.rowcount
+
+
+def close_sqlite(conn, templates, indexes=ENDPOINT_INDEXES):
+    """
+    Finish a database opened with open_sqlite(): write the hostname
+    templates, create indexes, commit, VACUUM and ANALYZE.
+
+    Args:
+        conn: sqlite3 connection
+        templates: HostnameTemplates passed to insert_endpoints()
+        indexes: List of CREATE INDEX statements to run after loading
+    """
+    try:
+        conn.executemany(
+            "INSERT INTO hostname_template (template_id, template) VALUES (?, ?)",
+            templates.items(),
+        )
+
+        for index_sql in indexes:
+            conn.execute(index_sql)
+
+        conn.execute("COMMIT")
+
+        conn.execute("VACUUM")
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def write_sqlite(sqlite_path, all_regions, endpoints, indexes=ENDPOINT_INDEXES):
+    """
+    Write regions and endpoints to a new SQLite file.
+
+    An existing file at sqlite_path is replaced.
+
+    Args:
+        sqlite_path: Path of the SQLite file
+        all_regions: Dict mapping region_name -> {description, partition}
+        endpoints: Iterable of EndpointRecords or endpoint dicts (see Endpoints.collect_endpoints)
+        indexes: List of CREATE INDEX statements to run after loading
+
+    Returns:
+        Number of endpoint rows written
+    """
+    templates = HostnameTemplates()
+
+    conn = open_sqlite(sqlite_path, all_regions)
+    try:
+        row_count = insert_endpoints(conn, endpoints, templates)
+    except BaseException:
+        conn.close()
+        raise
+
+    close_sqlite(conn, templates, indexes)
+
+    return row_count
+
+
+# =============================================================================
+__all__ = [
+    'write_sqlite',
+    'open_sqlite',
+    'insert_endpoints',
+    'close_sqlite',
+    'endpoint_row',
+]
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Local stub DNS server
+
+Serves recorded zone data over UDP and TCP on a local port, with
+configurable latency and failure rate, so that collection can be tested and
+benchmarked without network access (point a Resolvers.DnsClient at it).
+
+Zone data maps hostnames to (has_ipv4, has_ipv6). Names in the zone get an
+A record (192.0.2.1) and / or an AAAA record (2001:db8::1), both from the
+documentation ranges; names not in the zone get NXDOMAIN.
+
+Functions / classes:
+- StubDnsServer: The server, running on a background thread
+- zone_from_endpoints: Zone data from endpoint dicts / EndpointRecords
+- load_zone: Zone data from endpoints.json or a DnsCache file
+"""
+
+import asyncio
+import json
+import random
+import socket
+import sqlite3
+import struct
+import threading
+
+from Resolvers import (
+    CLASS_IN,
+    FLAG_QR,
+    FLAG_RA,
+    FLAG_RD,
+    FLAG_TC,
+    RCODE_NOERROR,
+    RCODE_NXDOMAIN,
+    RCODE_SERVFAIL,
+    TYPE_A,
+    TYPE_AAAA,
+    decode_name,
+)
+
+
+STUB_TTL = 60
+STUB_ADDRESSES = {
+    TYPE_A: socket.inet_pton(socket.AF_INET, '192.0.2.1'),
+    TYPE_AAAA: socket.inet_pton(socket.AF_INET6, '2001:db8::1'),
+}
+
+
+def zone_from_endpoints(endpoints):
+    """
+    Get zone data from endpoint data.
+
+    Args:
+        endpoints: Iterable of endpoint dicts or EndpointRecords
+
+    Returns:
+        Dict mapping hostname -> (has_ipv4, has_ipv6)
+    """
+    zone = {}
+    for ep in endpoints:
+        # EndpointRecords (see Endpoints) have the same data as to_dict()
+        if not isinstance(ep, dict):
+            ep = ep.to_dict()
+
+        for variant in ['endpoint_default', 'endpoint_dualstack']:
+            result = ep.get(variant) or {}
+            if result.get('hostname'):
+                zone[result['hostname'].lower()] = (bool(result['has_ipv4']), bool(result['has_ipv6']))
+
+    return zone
+
+
+def load_zone(path):
+    """
+    Load zone data from a file.
+
+    Args:
+        path: endpoints.json (see JsonSink), or a DnsCache SQLite file
+            (positive entries only; expiry is ignored)
+
+    Returns:
+        Dict mapping hostname -> (has_ipv4, has_ipv6)
+    """
+    if path.endswith('.json'):
+        with open(path) as f:
+            return zone_from_endpoints(json.load(f))
+
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            hostname.lower(): (bool(has_ipv4), bool(has_ipv6))
+            for (hostname, has_ipv4, has_ipv6) in conn.execute("""
+                SELECT hostname, has_ipv4, has_ipv6
+                FROM dns_result
+                WHERE has_ipv4 OR has_ipv6
+            """)
+        }
+    finally:
+        conn.close()
+
+
+class _UdpServerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+        # answers waiting for their latency (the loop only keeps weak references)
+        self.tasks = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        task = asyncio.get_running_loop().create_task(self._respond(data, addr))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _respond(self, data, addr):
+        response = await self.server._answer(data, udp=True)
+        if response is not None and not self.transport.is_closing():
+            self.transport.sendto(response, addr)
+
+
+class StubDnsServer:
+    """
+    Stub DNS server for zone data, on a background thread.
+
+    Usable as context manager:
+
+        with StubDnsServer(load_zone('endpoints.json'), latency=0.02) as server:
+            resolver = DnsClient(server.address)
+
+    Attributes:
+        address: (host, port) the server listens on (UDP and TCP)
+        stats: Dict of counters: queries, nxdomain, servfail, truncated
+    """
+
+    def __init__(self, zone, host='127.0.0.1', port=0, latency=0.0, jitter=0.0,
+                 servfail_rate=0.0, truncate_rate=0.0):
+        """
+        Args:
+            zone: Dict mapping hostname -> (has_ipv4, has_ipv6)
+            host: Address to listen on
+            port: Port to listen on (0: any free port)
+            latency: Seconds to wait before each answer
+            jitter: Up to this many seconds are added to `latency`, at random
+            servfail_rate: Share of queries answered with SERVFAIL, at random
+            truncate_rate: Share of UDP queries answered with the TC bit set,
+                at random (the client then has to repeat them over TCP)
+        """
+        self.zone = {hostname.lower().rstrip('.'): families for hostname, families in zone.items()}
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.servfail_rate = servfail_rate
+        self.truncate_rate = truncate_rate
+
+        self.address = None
+        self.stats = dict.fromkeys(['queries', 'nxdomain', 'servfail', 'truncated'], 0)
+
+        self._loop = None
+        self._thread = None
+        self._start_error = None
+        self._udp_transport = None
+        self._tcp_server = None
+
+    # ----- answering -----
+
+    def _response(self, query_id, flags, question, qname, qtype, rcode, truncated=False):
+        families = self.zone.get(qname, (False, False))
+        family_index = {TYPE_A: 0, TYPE_AAAA: 1}.get(qtype)
+
+        answers = b''
+        answer_count = 0
+        if rcode == RCODE_NOERROR and not truncated and family_index is not None and families[family_index]:
+            rdata = STUB_ADDRESSES[qtype]
+            # name: pointer to the question name at offset 12
+            answers = struct.pack('!HHHIH', 0xC00C, qtype, CLASS_IN, STUB_TTL, len(rdata)) + rdata
+            answer_count = 1
+
+        response_flags = FLAG_QR | FLAG_RA | (flags & FLAG_RD) | rcode
+        if truncated:
+            response_flags |= FLAG_TC
+
+        return struct.pack('!HHHHHH', query_id, response_flags, 1, answer_count, 0, 0) + question + answers
+
+    async def _answer(self, data, udp):
+        try:
+            (query_id, flags, qdcount) = struct.unpack_from('!HHH', data)
+            qname, offset = decode_name(data, 12)
+            (qtype, _qclass) = struct.unpack_from('!HH', data, offset)
+        except (struct.error, IndexError, ValueError, UnicodeDecodeError):
+            # not a query we understand; real servers would answer FORMERR
+            return None
+
+        if flags & FLAG_QR or qdcount != 1:
+            return None
+
+        self.stats['queries'] += 1
+        question = data[12:offset + 4]
+        qname = qname.lower()
+
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.servfail_rate and random.random() < self.servfail_rate:
+            self.stats['servfail'] += 1
+            return self._response(query_id, flags, question, qname, qtype, RCODE_SERVFAIL)
+
+        if udp and self.truncate_rate and random.random() < self.truncate_rate:
+            self.stats['truncated'] += 1
+            return self._response(query_id, flags, question, qname, qtype, RCODE_NOERROR, truncated=True)
+
+        if qname not in self.zone:
+            self.stats['nxdomain'] += 1
+            return self._response(query_id, flags, question, qname, qtype, RCODE_NXDOMAIN)
+
+        return self._response(query_id, flags, question, qname, qtype, RCODE_NOERROR)
+
+    async def _handle_tcp(self, reader, writer):
+        try:
+            while True:
+                (length,) = struct.unpack('!H', await reader.readexactly(2))
+                response = await self._answer(await reader.readexactly(length), udp=False)
+                if response is None:
+                    break
+                writer.write(struct.pack('!H', len(response)) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # ----- server thread -----
+
+    async def _start_servers(self):
+        loop = asyncio.get_running_loop()
+
+        # UDP first, then TCP on the same port (which may be taken, if the
+        # UDP port was chosen by the OS)
+        for _ in range(10):
+            udp_transport, _protocol = await loop.create_datagram_endpoint(
+                lambda: _UdpServerProtocol(self),
+                local_addr=(self.host, self.port),
+            )
+            port = udp_transport.get_extra_info('sockname')[1]
+            try:
+                self._tcp_server = await asyncio.start_server(self._handle_tcp, self.host, port)
+            except OSError:
+                udp_transport.close()
+                if self.port:
+                    raise
+                continue
+
+            self._udp_transport = udp_transport
+            self.address = (self.host, port)
+            return
+
+        raise OSError("no free port for UDP and TCP")
+
+    def _run(self, started):
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._start_servers())
+        except Exception as e:
+            self._start_error = e
+            return
+        finally:
+            started.set()
+
+        self._loop.run_forever()
+
+        self._udp_transport.close()
+        self._tcp_server.close()
+        self._loop.run_until_complete(self._tcp_server.wait_closed())
+        # cancel answers still waiting for their latency
+        for task in asyncio.all_tasks(self._loop):
+            task.cancel()
+        self._loop.run_until_complete(asyncio.sleep(0))
+
+    def start(self):
+        """
+        Start the server thread.
+
+        Returns:
+            (host, port) the server listens on
+        """
+        self._loop = asyncio.new_event_loop()
+        self._start_error = None
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), daemon=True)
+        self._thread.start()
+        started.wait()
+
+        if self._start_error is not None:
+            self._thread.join()
+            self._loop.close()
+            self._thread = None
+            raise self._start_error
+
+        return self.address
+
+    def stop(self):
+        """Stop the server thread."""
+        if self._thread is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# =============================================================================
+__all__ = [
+    'StubDnsServer',
+    'zone_from_endpoints',
+    'load_zone',
+]
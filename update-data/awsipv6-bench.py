@@ -0,0 +1,253 @@
+import argparse
+import glob
+import importlib.util
+import os
+import sys
+import tempfile
+
+# ----------------------------------------------------------------------
+# Benchmark the data collection and site generation pipeline on recorded
+# fixtures (test services / regions) and a synthetic full-size endpoint
+# matrix. Runs offline: DNS lookups go to a local stub DNS server.
+#
+# Each stage is measured in its own process (see Bench.py). Results can be
+# saved as baseline, and compared with one; regressions make the exit
+# status non-zero.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("botocore_repo", help="botocore repo directory")
+parser.add_argument("--repeat", type=int, default=3, metavar="N", help="timed runs per stage, the best counts (default: 3)")
+parser.add_argument("--stage", action="append", metavar="NAME", help="only run stages whose name contains NAME (repeatable)")
+parser.add_argument("--services", type=int, metavar="N", help="number of services in the synthetic matrix (default: all)")
+parser.add_argument("--resolve-count", type=int, default=5000, metavar="N", help="hostnames to resolve in the DNS stage (default: 5000)")
+parser.add_argument("--dns-latency", type=float, default=0.0, metavar="SECONDS", help="latency of the stub DNS server")
+parser.add_argument("--baseline", metavar="PATH", help="compare with the results in PATH")
+parser.add_argument("--threshold", type=float, metavar="SHARE", help="regression threshold, e.g. 0.25 for 25%% slower (default: 0.25)")
+parser.add_argument("--save", metavar="PATH", help="save results to PATH (e.g. as new baseline)")
+args = parser.parse_args()
+
+sys.path.insert(0, f"{args.botocore_repo}")
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+build_dir = os.path.join(repo_dir, "web", "build")
+sys.path.append(build_dir)
+
+import botocore
+import Bench
+from Changes import ChangesStore, diff_endpoints
+from DnsScheduler import ProbeScheduler
+from EndpointsData import load_endpoints_data
+from Resolvers import DnsClient
+from SqliteWriter import write_sqlite
+from StubDns import StubDnsServer, zone_from_endpoints
+from Endpoints import (
+    EndpointResult,
+    TEST_REGIONS,
+    TEST_SERVICES,
+    calculate_stats,
+    get_all_regions,
+    get_available_services,
+    get_botocore_session,
+    get_service_hostname,
+    resolve_endpoints,
+    apply_unsupported_dualstack_partitions,
+)
+
+# check for dummy tag to make sure we haven't accidentally imported the
+# system-provided botocore
+assert("awsipv6-git" in botocore.__version__)
+
+# ----------------------------------------------------------------------
+# fixtures
+
+print(f"Preparing fixtures ...")
+
+botocore_session = get_botocore_session()
+all_services = sorted(get_available_services(botocore_session))
+all_regions = get_all_regions(botocore_session)
+
+records = Bench.synthetic_endpoint_records(all_services[:args.services], all_regions)
+
+# the same matrix, one day later: every 50th cell gains IPv6
+next_records = [
+    ep._replace(endpoint_default=EndpointResult(ep.endpoint_default.hostname, True, True))
+    if i % 50 == 0 and ep.endpoint_default.hostname else ep
+    for i, ep in enumerate(records)
+]
+
+zone = zone_from_endpoints(records)
+hostnames = sorted(zone)[:args.resolve_count]
+
+work_dir = tempfile.TemporaryDirectory(prefix="awsipv6-bench-")
+for dir_name in [
+    "web/zola/generated",
+    "web/zola/static/assets",
+    "web/zola/static/endpoints-matrix/assets",
+    "web/zola/static/endpoints-services/assets",
+]:
+    os.makedirs(os.path.join(work_dir.name, dir_name))
+
+sqlite_path = os.path.join(work_dir.name, "web/zola/static/endpoints.sqlite")
+write_sqlite(sqlite_path, all_regions, records)
+
+changes_store = ChangesStore(os.path.join(work_dir.name, "web/zola/static/changes.sqlite"))
+changes_store.add("2000-01-01", diff_endpoints(records, next_records))
+changes_store.close()
+
+endpoints_data = load_endpoints_data(sqlite_path)
+
+print(f"Synthetic matrix: {len(all_services[:args.services])} services x {len(all_regions)} regions, "
+      f"{len(records)} endpoints, {len(zone)} hostnames")
+
+# ----------------------------------------------------------------------
+# stages: each function runs a stage once and returns the number of items
+
+def bench_load_model():
+    session = get_botocore_session()
+    services = get_available_services(session)
+    get_all_regions(session)
+    return len(services)
+
+
+def bench_service_hostname():
+    # a new session, so that no client / ruleset is cached yet
+    session = get_botocore_session()
+    apply_unsupported_dualstack_partitions(session)
+
+    count = 0
+    for service_name in TEST_SERVICES:
+        for region_name in TEST_REGIONS:
+            for use_dualstack in [False, True]:
+                get_service_hostname(service_name, region_name, session, use_dualstack)
+                count += 1
+    return count
+
+
+def bench_resolve_endpoints():
+    scheduler = ProbeScheduler(64, 5.0, resolver=DnsClient(stub_dns_server.address))
+    return len(resolve_endpoints(hostnames, scheduler=scheduler))
+
+
+def bench_calculate_stats():
+    calculate_stats(records)
+    return len(records)
+
+
+def bench_diff_endpoints():
+    diff_endpoints(records, next_records)
+    return len(records)
+
+
+def bench_write_sqlite():
+    return write_sqlite(os.path.join(work_dir.name, "bench.sqlite"), all_regions, records)
+
+
+def bench_load_endpoints_data():
+    return len(load_endpoints_data(sqlite_path)['endpoints'])
+
+
+def generator_stage(path):
+    def bench_generator():
+        module_name = os.path.basename(path).removesuffix(".py").replace("-", "_")
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        generator_parser = argparse.ArgumentParser()
+        if hasattr(module, "add_arguments"):
+            module.add_arguments(generator_parser)
+
+        # generators write relative to the repo root
+        os.chdir(work_dir.name)
+        module.generate(endpoints_data, generator_parser.parse_args([]))
+        return len(endpoints_data['endpoints'])
+
+    return bench_generator
+
+
+stages = {
+    'load_model': bench_load_model,
+    'service_hostname': bench_service_hostname,
+    'resolve_endpoints': bench_resolve_endpoints,
+    'calculate_stats': bench_calculate_stats,
+    'diff_endpoints': bench_diff_endpoints,
+    'write_sqlite': bench_write_sqlite,
+    'load_endpoints_data': bench_load_endpoints_data,
+}
+for path in sorted(glob.glob(os.path.join(build_dir, "generate*.py"))):
+    stages[os.path.basename(path).removesuffix(".py")] = generator_stage(path)
+
+if args.stage:
+    stages = {
+        stage_name: fn
+        for stage_name, fn in stages.items()
+        if any(pattern in stage_name for pattern in args.stage)
+    }
+
+# ----------------------------------------------------------------------
+# run
+
+baseline = Bench.load_results(args.baseline) if args.baseline else None
+
+# stages run in forked processes; the stub server keeps running here
+stub_dns_server = StubDnsServer(zone, latency=args.dns_latency)
+stub_dns_server.start()
+
+results = {
+    'botocore_version': botocore.__version__,
+    'environment': Bench.environment(),
+    'repeat': args.repeat,
+    'fixtures': {
+        'services': len(all_services[:args.services]),
+        'regions': len(all_regions),
+        'endpoints': len(records),
+        'resolve_count': len(hostnames),
+        'dns_latency': args.dns_latency,
+    },
+    'stages': {},
+}
+
+print()
+print(f"{'stage':<36} {'seconds':>9} {'items/s':>11} {'RSS MiB':>8} {'alloc MiB':>9} {'blocks':>8}  vs baseline")
+
+for stage_name, fn in stages.items():
+    result = Bench.run_stage(fn, repeat=args.repeat)
+    results['stages'][stage_name] = result
+
+    if 'error' in result:
+        print(f"{stage_name:<36} ERROR: {result['error']}")
+        continue
+
+    comparison = ""
+    if baseline is not None:
+        ratios, _regressions = Bench.compare_results({stage_name: result}, baseline['stages'])
+        comparison = "  ".join(f"{metric} x{ratio:.2f}" for metric, ratio in ratios.get(stage_name, {}).items())
+
+    throughput = f"{result['throughput']:11.0f}" if result['throughput'] else f"{'-':>11}"
+    print(f"{stage_name:<36} {result['seconds']:9.4f} {throughput} {result['peak_rss_kb'] / 1024:8.1f} "
+          f"{result['peak_alloc_bytes'] / 2**20:9.1f} {result['alloc_blocks']:8}  {comparison}")
+
+stub_dns_server.stop()
+work_dir.cleanup()
+
+print()
+
+if args.save:
+    Bench.save_results(results, args.save)
+    print(f"Results saved to {args.save}")
+
+if baseline is not None:
+    threshold = args.threshold if args.threshold is not None else Bench.REGRESSION_THRESHOLD
+    _ratios, regressions = Bench.compare_results(results['stages'], baseline['stages'], threshold)
+    if baseline.get('botocore_version') != results['botocore_version']:
+        print(f"Note: baseline is for botocore {baseline.get('botocore_version')}")
+    if baseline.get('fixtures') != results['fixtures']:
+        print(f"Note: baseline has different fixtures: {baseline.get('fixtures')}")
+
+    for stage_name, metric, ratio in regressions:
+        print(f"REGRESSION: {stage_name}: {metric} x{ratio:.2f} (baseline {args.baseline})")
+
+    if regressions:
+        sys.exit(1)
+
+    print(f"No regressions against {args.baseline} (threshold {threshold:.0%})")
@@ -0,0 +1,47 @@
+import argparse
+import datetime
+import json
+import os
+
+from Changes import ChangesStore, diff_endpoints
+
+# ----------------------------------------------------------------------
+# Detect changes between the previous and the current endpoints.json and
+# add them to the changes store, which the changes page is rendered from.
+# Optionally also write all changes as text file (the public `changes` file).
+
+# Changes in these partitions are left out of the text file (China: the text
+# file used to filter these by hostname, *.amazonaws.com.cn /
+# *.amazonwebservices.com.cn)
+TEXT_EXCLUDED_PARTITIONS = ['aws-cn']
+
+parser = argparse.ArgumentParser()
+parser.add_argument("previous_json", help="endpoints.json of the previous run")
+parser.add_argument("current_json", help="endpoints.json of this run")
+parser.add_argument("changes_db", help="changes store (SQLite, created if missing)")
+parser.add_argument("--date", default=datetime.date.today().isoformat(), help="date of the changes (default: today)")
+parser.add_argument("--import-legacy", metavar="PATH", help="import the old text changes file first")
+parser.add_argument("--write-text", metavar="PATH", help="also write all changes as text file to PATH")
+args = parser.parse_args()
+
+with open(args.previous_json) as f:
+    previous_endpoints = json.load(f)
+
+with open(args.current_json) as f:
+    current_endpoints = json.load(f)
+
+changes_store = ChangesStore(args.changes_db)
+
+if args.import_legacy:
+    line_count = changes_store.import_legacy(args.import_legacy)
+    print(f"Imported {line_count} lines from {args.import_legacy}")
+
+events = diff_endpoints(previous_endpoints, current_endpoints)
+changes_store.add(args.date, events)
+
+if args.write_text:
+    changes_store.write_text(args.write_text, TEXT_EXCLUDED_PARTITIONS)
+
+changes_store.close()
+
+print(f"{len(events)} changes on {args.date} ({os.path.basename(args.changes_db)})")
@@ -1,26 +1,47 @@
-import json
-import os
+import argparse
 import sys
-import time
-import pathlib
 
 # ----------------------------------------------------------------------
 # take care of importing botocore from a git clone
 
-if len(sys.argv) < 2:
-    raise Exception("need botocore repo directory")
-
-botocore_repo = sys.argv[1]
-
-use_test_data = True
-if len(sys.argv) == 3 and sys.argv[2] == "--live":
-    use_test_data = False
+parser = argparse.ArgumentParser()
+parser.add_argument("botocore_repo", help="botocore repo directory")
+parser.add_argument("--live", action="store_true", help="collect all services / regions (default: test data)")
+parser.add_argument("--workers", type=int, default=1, metavar="N", help="number of worker processes for data collection")
+parser.add_argument("--dns-server", metavar="HOST[:PORT]", help="query this DNS server directly instead of using the system resolver")
+parser.add_argument("--dns-cache", metavar="PATH", help="SQLite file to cache DNS results in")
+parser.add_argument("--dns-cache-ttl", type=float, metavar="SECONDS", help="how long positive DNS results are cached")
+parser.add_argument("--dns-cache-negative-ttl", type=float, metavar="SECONDS", help="how long negative DNS results are cached")
+parser.add_argument("--availability-index", metavar="PATH", help="load service availability index from PATH (built and saved there if missing or outdated)")
+parser.add_argument("--region-table", metavar="PATH", help="load region table from PATH (built and saved there if missing or for another botocore version)")
+parser.add_argument("--history", metavar="PATH", help="SQLite file to add this run's data to as a new snapshot")
+parser.add_argument("--incremental", metavar="PATH", help="state file of the previous run; only look up hostnames whose botocore data changed")
+parser.add_argument("--metrics-json", metavar="PATH", help="write timings and counters of this run to PATH (JSON)")
+parser.add_argument("--metrics-prom", metavar="PATH", help="write timings and counters of this run to PATH (Prometheus textfile format)")
+args = parser.parse_args()
+
+botocore_repo = args.botocore_repo
+use_test_data = not args.live
 
 sys.path.insert(0, f"{botocore_repo}")
 
 import botocore
-import sqlite3
-from Endpoints import collect_endpoints, get_all_regions, get_botocore_session
+from DnsCache import DnsCache, DNS_CACHE_TTL, DNS_CACHE_NEGATIVE_TTL, DNS_CACHE_MAX_STALE
+import Incremental
+from Resolvers import DnsClient, parse_nameserver
+from History import HistoryStore
+from Metrics import METRICS
+from Sinks import JsonSink, TextSink, SqliteSink, HistorySink
+from Endpoints import (
+    collect_endpoint_records,
+    get_all_regions,
+    get_region_table,
+    get_available_services,
+    get_botocore_session,
+    build_availability_index,
+    save_availability_index,
+    load_availability_index,
+)
 
 # check for dummy tag to make sure we haven't accidentally imported the
 # system-provided botocore
@@ -31,148 +52,133 @@ assert("awsipv6-git" in botocore.__version__)
 
 print(f"Gathering endpoint data ...")
 
+# the session is needed for service data and hostnames in any case; the
+# region table only saves determining the regions again (here, in
+# Incremental and in each collection worker)
 botocore_session = get_botocore_session()
-all_regions = get_all_regions(botocore_session, use_test_data=use_test_data)
+if args.region_table:
+    all_regions = get_region_table(args.region_table, use_test_data=use_test_data, botocore_session=botocore_session)
+else:
+    all_regions = get_all_regions(botocore_session, use_test_data=use_test_data)
+
+dns_cache = None
+if args.dns_cache:
+    dns_cache = DnsCache(
+        args.dns_cache,
+        ttl=args.dns_cache_ttl if args.dns_cache_ttl is not None else DNS_CACHE_TTL,
+        negative_ttl=args.dns_cache_negative_ttl if args.dns_cache_negative_ttl is not None else DNS_CACHE_NEGATIVE_TTL,
+    )
+    dns_cache.purge(max_stale=DNS_CACHE_MAX_STALE)
+
+dns_resolver = None
+if args.dns_server:
+    dns_resolver = DnsClient(parse_nameserver(args.dns_server))
+
+availability_index = None
+if args.availability_index:
+    availability_index = load_availability_index(args.availability_index)
+    if availability_index is None:
+        print(f"Building service availability index {args.availability_index} ...")
+        availability_index = build_availability_index(
+            botocore_session,
+            get_available_services(botocore_session, use_test_data=use_test_data),
+            {region_data['partition'] for region_data in all_regions.values()},
+        )
+        save_availability_index(availability_index, args.availability_index)
+
+known_hostnames = None
+if args.incremental:
+    known_hostnames, incremental_state, changed_services = Incremental.collect_hostnames(
+        botocore_session,
+        Incremental.load_state(args.incremental),
+        use_test_data=use_test_data,
+        all_regions=all_regions,
+    )
+    print(f"Incremental: hostnames changed for {len(changed_services)} services")
+
+json_path = "web/zola/static/endpoints.json"
+text_path = "web/zola/static/endpoints.text"
+sqlite_path = "web/zola/static/endpoints.sqlite"
+
+print(f"Writing output to {json_path}, {text_path}, {sqlite_path} ...")
 
-# Collect all endpoints into a list
-endpoints = []
+sinks = [
+    JsonSink(json_path),
+    TextSink(text_path),
+    SqliteSink(sqlite_path, all_regions),
+]
+
+history_store = None
+if args.history:
+    history_store = HistoryStore(args.history)
+    history_sink = HistorySink(history_store, all_regions)
+    sinks.append(history_sink)
+
+sink_names = [type(sink).__name__.removesuffix("Sink").lower() for sink in sinks]
+
+# Each endpoint goes to all outputs as soon as it's collected
 last_service = None
-for ep in collect_endpoints(botocore_session, use_test_data=use_test_data):
-    service_name = ep['service']
+for ep in collect_endpoint_records(
+    botocore_session,
+    use_test_data=use_test_data,
+    workers=args.workers,
+    availability_index=availability_index,
+    dns_cache=dns_cache,
+    known_hostnames=known_hostnames,
+    dns_resolver=dns_resolver,
+    all_regions=all_regions,
+):
+    service_name = ep.service
     if service_name != last_service:
         print(f'* {service_name} ...')
         last_service = service_name
-    endpoints.append(ep)
 
-print()
+    for sink, sink_name in zip(sinks, sink_names):
+        with METRICS.timer(f"write_{sink_name}", ep.service, ep.partition):
+            sink.write(ep)
 
-# ----------------------------------------------------------------------
-# write json output
-
-print(f"Writing output to web/zola/static/endpoints.json ...")
-
-with open(f"web/zola/static/endpoints.json", "w") as json_file:
-    json.dump(endpoints, json_file, indent = 4)
+for sink, sink_name in zip(sinks, sink_names):
+    with METRICS.timer(f"close_{sink_name}"):
+        sink.close()
 
 print()
 
-# ----------------------------------------------------------------------
-# write text output
-
-print(f"Writing output to web/zola/static/endpoints.text ...")
-
-all_endpoints_text = []
-for ep in endpoints:
-    ep_default = ep['endpoint_default']
-    ep_dualstack = ep['endpoint_dualstack']
-
-    hostname_default = ep_default.get('hostname')
-    hostname_dualstack = ep_dualstack.get('hostname')
-
-    if hostname_default:
-        tags = []
-        if ep_default.get('has_ipv4'):
-            tags.append('ipv4')
-        if ep_default.get('has_ipv6'):
-            tags.append('ipv6')
-        tags_str = " [" + ", ".join(tags) + "]" if tags else ""
-        all_endpoints_text.append(f"{hostname_default}{tags_str} (default)")
-
-    if hostname_dualstack and hostname_dualstack != hostname_default:
-        tags = []
-        if ep_dualstack.get('has_ipv4'):
-            tags.append('ipv4')
-        if ep_dualstack.get('has_ipv6'):
-            tags.append('ipv6')
-        tags_str = " [" + ", ".join(tags) + "]" if tags else ""
-        all_endpoints_text.append(f"{hostname_dualstack}{tags_str} (dualstack)")
-
-with open(f"web/zola/static/endpoints.text", "w") as text_file:
-    for ep in sorted(all_endpoints_text):
-        print(f"{ep}", file = text_file)
+if dns_cache is not None:
+    dns_cache.close()
 
-# ----------------------------------------------------------------------
-# write sqlite output
+if history_store is not None:
+    snapshot = history_sink.result
+    print(f"History: snapshot {snapshot['snapshot_id']}: "
+          f"{snapshot['added']} added, {snapshot['changed']} changed, {snapshot['removed']} removed")
+    history_store.close()
 
-sqlite_path = "web/zola/static/endpoints.sqlite"
-pathlib.Path(sqlite_path).unlink(missing_ok=True)
-print(f"Writing output to {sqlite_path} ...")
-
-with sqlite3.connect(sqlite_path) as conn_sqlite:
-    cur_sqlite = conn_sqlite.cursor()
-    cur_sqlite.execute("""
-        CREATE TABLE IF NOT EXISTS region (
-            region_name TEXT,
-            partition_name TEXT,
-            description TEXT,
-            PRIMARY KEY (region_name, partition_name)
-        )
-        WITHOUT ROWID
-    """)
-
-    cur_sqlite.execute("""
-        CREATE TABLE IF NOT EXISTS endpoint (
-            service_name TEXT,
-            region_name TEXT,
-            partition_name TEXT,
-            endpoint_default_hostname TEXT,
-            endpoint_default_has_ipv4 INTEGER,
-            endpoint_default_has_ipv6 INTEGER,
-            endpoint_dualstack_hostname TEXT,
-            endpoint_dualstack_has_ipv4 INTEGER,
-            endpoint_dualstack_has_ipv6 INTEGER,
-            PRIMARY KEY (service_name, region_name, partition_name)
-        )
-        WITHOUT ROWID
-    """)
-
-    for region_name, region_data in all_regions.items():
-        cur_sqlite.execute("""
-            INSERT INTO region (region_name, partition_name, description)
-            VALUES (?, ?, ?)
-            ON CONFLICT(region_name, partition_name) DO UPDATE SET description=excluded.description
-        """, (
-            region_name,
-            region_data['partition'],
-            region_data['description'],
-        ))
-
-    for ep in endpoints:
-        ep_default = ep['endpoint_default']
-        ep_dualstack = ep['endpoint_dualstack']
-
-        cur_sqlite.execute("""
-            INSERT INTO endpoint (
-                service_name,
-                partition_name,
-                region_name,
-                endpoint_default_hostname,
-                endpoint_default_has_ipv4,
-                endpoint_default_has_ipv6,
-                endpoint_dualstack_hostname,
-                endpoint_dualstack_has_ipv4,
-                endpoint_dualstack_has_ipv6
-            )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ON CONFLICT(service_name, partition_name, region_name) DO UPDATE SET
-                endpoint_default_hostname=excluded.endpoint_default_hostname,
-                endpoint_default_has_ipv4=excluded.endpoint_default_has_ipv4,
-                endpoint_default_has_ipv6=excluded.endpoint_default_has_ipv6,
-                endpoint_dualstack_hostname=excluded.endpoint_dualstack_hostname,
-                endpoint_dualstack_has_ipv4=excluded.endpoint_dualstack_has_ipv4,
-                endpoint_dualstack_has_ipv6=excluded.endpoint_dualstack_has_ipv6
-        """, (
-            ep['service'],
-            ep['partition'],
-            ep['region'],
-            ep_default.get('hostname'),
-            int(ep_default.get('has_ipv4', False)),
-            int(ep_default.get('has_ipv6', False)),
-            ep_dualstack.get('hostname'),
-            int(ep_dualstack.get('has_ipv4', False)),
-            int(ep_dualstack.get('has_ipv6', False)),
-        ))
+if args.incremental:
+    Incremental.save_state(incremental_state, args.incremental)
 
-print()
+# ----------------------------------------------------------------------
+# timing report
+
+report = METRICS.report(botocore_version=botocore.__version__, workers=args.workers, live=args.live)
+
+print(f"Timing ({report['duration']:.1f}s total):")
+for stage, stage_report in report['stages'].items():
+    total = stage_report['total']
+    print(f"  {stage:<16} {total['sum']:9.2f}s {total['count']:8} x  p50 {total['p50']:.4f}s  p99 {total['p99']:.4f}s  max {total['max']:.4f}s")
+
+slowest = [
+    f"{service_name} {seconds:.1f}s"
+    for service_name, seconds, _count in METRICS.slowest('dns', limit=5)
+    if seconds > 0
+]
+if slowest:
+    print(f"Slowest services (DNS): {', '.join(slowest)}")
+
+if args.metrics_json:
+    METRICS.write_json(args.metrics_json, botocore_version=botocore.__version__, workers=args.workers, live=args.live)
+    print(f"Metrics written to {args.metrics_json}")
+
+if args.metrics_prom:
+    METRICS.write_prometheus(args.metrics_prom)
+    print(f"Metrics written to {args.metrics_prom}")
 
 print(f"Done.")
@@ -0,0 +1,48 @@
+import argparse
+import sys
+
+from Query import CATEGORIES, EndpointQuery, endpoint_category
+
+# ----------------------------------------------------------------------
+# Query endpoints.sqlite: list the endpoints matching the filters, or look
+# up which (service, region) cells use the given hostnames.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("sqlite", help="endpoints.sqlite")
+parser.add_argument("--service", help="only endpoints of this service")
+parser.add_argument("--region", help="only endpoints in this region")
+parser.add_argument("--partition", help="only endpoints in this partition")
+parser.add_argument("--category", choices=CATEGORIES, help="only endpoints in this support category")
+parser.add_argument("--hostnames", metavar="PATH", help="look up the hostnames in PATH (one per line, - for stdin) instead")
+args = parser.parse_args()
+
+query = EndpointQuery(args.sqlite)
+
+
+def endpoint_line(ep):
+    return " ".join([
+        ep.service,
+        ep.region,
+        ep.partition,
+        endpoint_category(ep),
+        ep.endpoint_default.hostname or "-",
+        ep.endpoint_dualstack.hostname or "-",
+    ])
+
+
+if args.hostnames:
+    hostname_file = sys.stdin if args.hostnames == "-" else open(args.hostnames)
+    hostnames = [line.strip() for line in hostname_file if line.strip()]
+
+    matches = query.lookup_hostnames(hostnames)
+    for hostname in hostnames:
+        for match in matches.get(hostname, []):
+            print(f"{hostname} {match.variant.removeprefix('endpoint_')} {endpoint_line(match.record)}")
+
+    unknown_count = sum(1 for hostname in set(hostnames) if hostname not in matches)
+    print(f"{len(set(hostnames)) - unknown_count} of {len(set(hostnames))} hostnames found", file=sys.stderr)
+else:
+    for ep in query.endpoints(args.service, args.region, args.partition, args.category):
+        print(endpoint_line(ep))
+
+query.close()
@@ -0,0 +1,44 @@
+import argparse
+import time
+
+from StubDns import StubDnsServer, load_zone
+
+# ----------------------------------------------------------------------
+# Serve recorded zone data as a local DNS server, e.g. for offline runs of
+# awsipv6-get.py --dns-server 127.0.0.1:5353
+
+parser = argparse.ArgumentParser()
+parser.add_argument("zone", help="endpoints.json, or a DNS cache file (see --dns-cache)")
+parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+parser.add_argument("--port", type=int, default=5353, help="port to listen on, UDP and TCP (default: 5353)")
+parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS", help="delay of each answer")
+parser.add_argument("--jitter", type=float, default=0.0, metavar="SECONDS", help="random extra delay of each answer, up to SECONDS")
+parser.add_argument("--servfail-rate", type=float, default=0.0, metavar="SHARE", help="share of queries answered with SERVFAIL")
+parser.add_argument("--truncate-rate", type=float, default=0.0, metavar="SHARE", help="share of UDP queries answered as truncated")
+args = parser.parse_args()
+
+zone = load_zone(args.zone)
+
+server = StubDnsServer(
+    zone,
+    host=args.host,
+    port=args.port,
+    latency=args.latency,
+    jitter=args.jitter,
+    servfail_rate=args.servfail_rate,
+    truncate_rate=args.truncate_rate,
+)
+host, port = server.start()
+
+print(f"Serving {len(zone)} hostnames on {host}:{port} (UDP, TCP); Ctrl-C to stop")
+
+try:
+    while True:
+        time.sleep(3600)
+except KeyboardInterrupt:
+    pass
+
+server.stop()
+
+print(f"{server.stats['queries']} queries ({server.stats['nxdomain']} NXDOMAIN, "
+      f"{server.stats['servfail']} SERVFAIL, {server.stats['truncated']} truncated)")
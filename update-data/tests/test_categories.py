@@ -0,0 +1,69 @@
+import itertools
+import sqlite3
+
+import pytest
+
+from Endpoints import CATEGORY_ATTRIBUTES, EndpointRecord, EndpointResult, endpoint_category
+from Matrix import EndpointMatrix
+from Query import CATEGORY_SQL, ENDPOINT_TABLE_SCHEMA
+
+
+def _all_records():
+    """One endpoint per combination of CATEGORY_ATTRIBUTES values."""
+    records = []
+    for index, values in enumerate(itertools.product([False, True], repeat=len(CATEGORY_ATTRIBUTES))):
+        attributes = dict(zip(CATEGORY_ATTRIBUTES, values))
+        records.append(EndpointRecord(
+            f"service{index}",
+            "aws",
+            "us-east-1",
+            EndpointResult(
+                "service.us-east-1.amazonaws.com" if attributes['default_hostname'] else None,
+                attributes['default_ipv4'],
+                attributes['default_ipv6'],
+            ),
+            EndpointResult(
+                "service.us-east-1.api.aws" if attributes['dualstack_hostname'] else None,
+                attributes['dualstack_ipv4'],
+                attributes['dualstack_ipv6'],
+            ),
+        ))
+    return records
+
+
+@pytest.mark.parametrize("default, dualstack, category", [
+    (EndpointResult(None, False, False), EndpointResult(None, False, False), 'nx'),
+    (EndpointResult("a", True, True), EndpointResult(None, False, False), 'ipv6_default'),
+    (EndpointResult("a", True, False), EndpointResult("b", True, True), 'ipv6_dualstack'),
+    (EndpointResult("a", True, False), EndpointResult("b", True, False), 'ipv4_only'),
+    (EndpointResult(None, False, False), EndpointResult("b", False, False), 'ipv4_only'),
+])
+def test_endpoint_category(default, dualstack, category):
+    ep = EndpointRecord("service", "aws", "us-east-1", default, dualstack)
+
+    assert endpoint_category(ep) == category
+    assert endpoint_category(ep.to_dict()) == category
+
+
+def test_matrix_classifies_like_endpoint_category():
+    records = _all_records()
+    matrix = EndpointMatrix.from_endpoints(records)
+    categories = matrix.classify()
+
+    for ep in records:
+        cell = matrix.cell(ep.service, ep.region)
+        assert [category for category, cells in categories.items() if cells >> cell & 1] == [endpoint_category(ep)]
+
+
+def test_category_sql_classifies_like_endpoint_category():
+    records = _all_records()
+    conn = sqlite3.connect(":memory:")
+    conn.execute(ENDPOINT_TABLE_SCHEMA.format(table="endpoint"))
+    conn.executemany(
+        "INSERT INTO endpoint VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(ep.service, ep.region, ep.partition, *ep.endpoint_default, *ep.endpoint_dualstack) for ep in records],
+    )
+
+    sql_categories = dict(conn.execute(f"SELECT service_name, {CATEGORY_SQL} FROM endpoint"))
+
+    assert sql_categories == {ep.service: endpoint_category(ep) for ep in records}
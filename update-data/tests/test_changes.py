@@ -0,0 +1,51 @@
+from Changes import ChangesStore, diff_endpoints, IPV6_GAINED, ADDED
+
+
+def endpoint(service, region, has_ipv6=False):
+    return {
+        'service': service,
+        'partition': 'aws',
+        'region': region,
+        'endpoint_default': {
+            'hostname': f"{service}.{region}.amazonaws.com",
+            'has_ipv4': True,
+            'has_ipv6': has_ipv6,
+        },
+        'endpoint_dualstack': {},
+    }
+
+
+def test_two_runs_on_one_day_keep_both_changes(tmp_path):
+    day_start = [endpoint('ec2', 'eu-central-1'), endpoint('sqs', 'eu-central-1')]
+    first_run = [endpoint('ec2', 'eu-central-1', has_ipv6=True), endpoint('sqs', 'eu-central-1')]
+    second_run = first_run + [endpoint('sns', 'eu-central-1')]
+
+    store = ChangesStore(tmp_path / "changes.sqlite")
+    store.add('2026-10-18', diff_endpoints(day_start, first_run))
+    store.add('2026-10-18', diff_endpoints(first_run, second_run))
+
+    events = store.events('2026-10-18')
+    assert [(e.kind, e.service) for e in events] == [(IPV6_GAINED, 'ec2'), (ADDED, 'sns')]
+
+
+def test_run_without_changes_keeps_the_day(tmp_path):
+    # e.g. awsipv6-update.sh --skip-get, which compares a file with itself
+    before = [endpoint('ec2', 'eu-central-1')]
+    after = [endpoint('ec2', 'eu-central-1', has_ipv6=True)]
+
+    store = ChangesStore(tmp_path / "changes.sqlite")
+    store.add('2026-10-18', diff_endpoints(before, after))
+    store.add('2026-10-18', diff_endpoints(after, after))
+
+    assert len(store.events('2026-10-18')) == 1
+
+
+def test_same_changes_again_are_not_duplicated(tmp_path):
+    before = [endpoint('ec2', 'eu-central-1')]
+    after = [endpoint('ec2', 'eu-central-1', has_ipv6=True)]
+
+    store = ChangesStore(tmp_path / "changes.sqlite")
+    store.add('2026-10-18', diff_endpoints(before, after))
+    store.add('2026-10-18', diff_endpoints(before, after))
+
+    assert len(store.events('2026-10-18')) == 1
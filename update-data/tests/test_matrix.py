@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("botocore")
+
+from Endpoints import (
+    calculate_stats,
+    collect_endpoint_records,
+    get_all_regions,
+    get_botocore_session,
+)
+from Matrix import EndpointMatrix
+
+
+class FakeResolver:
+    """
+    Resolver backend without network, giving cells of every category: names
+    in us-east-2 don't exist, sts and api.aws names have IPv6, all others
+    only IPv4.
+    """
+
+    async def lookup(self, hostname):
+        if "us-east-2" in hostname:
+            return (False, False)
+        return (True, hostname.startswith("sts.") or hostname.endswith(".api.aws"))
+
+
+@pytest.fixture(scope="module")
+def records():
+    return list(collect_endpoint_records(
+        get_botocore_session(),
+        use_test_data=True,
+        dns_resolver=FakeResolver(),
+    ))
+
+
+def test_from_endpoints_takes_collected_records(records):
+    matrix = EndpointMatrix.from_endpoints(records, get_all_regions(None, use_test_data=True))
+
+    stats = calculate_stats(records)
+    assert all(stats[f"count_{category}"] for category in ["ipv6_default", "ipv6_dualstack", "ipv4_only", "nx"])
+
+    assert matrix.present.bit_count() == len(records)
+    assert matrix.stats() == stats
+
+
+def test_set_cell_takes_endpoint_results(records):
+    from_records = EndpointMatrix.from_endpoints(records)
+
+    matrix = EndpointMatrix(from_records.services, from_records.regions, from_records.region_partitions)
+    for ep in records:
+        matrix.set_cell(ep.service, ep.region, ep.endpoint_default, ep.endpoint_dualstack)
+
+    assert matrix.classify() == from_records.classify()
+    assert matrix.counters() == from_records.counters()
+
+
+def test_set_cell_takes_dicts(records):
+    from_records = EndpointMatrix.from_endpoints(records)
+
+    matrix = EndpointMatrix(from_records.services, from_records.regions, from_records.region_partitions)
+    for ep in records:
+        ep = ep.to_dict()
+        matrix.set_cell(ep['service'], ep['region'], ep['endpoint_default'], ep['endpoint_dualstack'])
+
+    assert matrix.classify() == from_records.classify()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Endpoint data for the web/build generators
+
+Loads endpoints.sqlite once and computes all per-region, per-service and
+per-partition counts from one EndpointMatrix (see update-data/Matrix.py),
+so the generators don't each have to open the file and run their own GROUP
+BY queries.
+
+Functions:
+- load_endpoints_data: Load endpoints and compute all counts
+- empty_counts: Counts dict with all counters at zero
+"""
+
+import os
+import sqlite3
+import sys
+
+# the counts are computed by update-data/Matrix.py
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(repo_dir, "update-data"))
+
+from Matrix import COUNTERS, EndpointMatrix
+
+
+EPDB_PATH = "web/zola/static/endpoints.sqlite"
+
+
+def empty_counts():
+    """
+    Get a counts dict with all counters at zero.
+
+    Returns:
+        dict mapping counter name (see COUNTERS) -> 0
+    """
+    return dict.fromkeys(COUNTERS, 0)
+
+
+def load_endpoints_data(sqlite_path=EPDB_PATH):
+    """
+    Load endpoints.sqlite and compute all counts.
+
+    Args:
+        sqlite_path: Path of endpoints.sqlite
+
+    Returns:
+        dict: {
+            'regions': {region_name: {'partition_name', 'description'}},
+                ordered by region name
+            'services': list of service names, sorted
+            'endpoints': list of endpoint rows (sqlite3.Row, with the
+                columns of the endpoint table), ordered by service and
+                region name
+            'region_counts': {region_name: counts}
+            'service_counts': {service_name: counts}
+            'partition_service_counts': {partition_name: {service_name: counts}}
+        }
+
+        with counts as returned by empty_counts(), for the regions,
+        services and partitions that have endpoints.
+    """
+    epdb = sqlite3.connect(sqlite_path)
+    epdb.row_factory = sqlite3.Row
+
+    try:
+        regions = {
+            row['region_name']: {
+                'partition_name': row['partition_name'],
+                'description': row['description'],
+            }
+            for row in epdb.execute("""
+                SELECT region_name, partition_name, description
+                FROM region
+                ORDER BY region_name
+            """)
+        }
+
+        endpoints = epdb.execute("""
+            SELECT *
+            FROM endpoint
+            ORDER BY service_name, region_name
+        """).fetchall()
+    finally:
+        epdb.close()
+
+    matrix = EndpointMatrix.from_rows(endpoints, {
+        region_name: region['partition_name'] for region_name, region in regions.items()
+    })
+    counters = matrix.counters()
+    present = matrix.present
+
+    def counts(mask):
+        return matrix.counts(mask, counters)
+
+    services = matrix.services
+    service_counts = {
+        service_name: counts(matrix.service_mask(service_name))
+        for service_name in services
+    }
+
+    # only regions / partitions with endpoints
+    region_counts = {}
+    for region_name in matrix.regions:
+        region_mask = matrix.region_mask(region_name)
+        if present & region_mask:
+            region_counts[region_name] = counts(region_mask)
+
+    partition_service_counts = {}
+    for partition_name in sorted(set(matrix.region_partitions.values())):
+        partition_mask = matrix.partition_mask(partition_name)
+        for service_name in services:
+            mask = partition_mask & matrix.service_mask(service_name)
+            if present & mask:
+                partition_service_counts.setdefault(partition_name, {})[service_name] = counts(mask)
+
+    return {
+        'regions': regions,
+        'services': services,
+        'endpoints': endpoints,
+        'region_counts': region_counts,
+        'service_counts': service_counts,
+        'partition_service_counts': partition_service_counts,
+    }
+
+
+# =============================================================================
+__all__ = [
+    'EPDB_PATH',
+    'COUNTERS',
+    'load_endpoints_data',
+    'empty_counts',
+]
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+# Runs all web/build/generate-*.py generators in a single process, with
+# endpoints.sqlite loaded and aggregated only once (see EndpointsData.py).
+#
+# Each generator provides generate(data, args), and optionally
+# add_arguments(parser) for its own command line options. Generators can
+# still be run on their own, e.g. python3 web/build/generate-endpoints-regions.py
+
+import argparse
+import glob
+import importlib.util
+import os
+
+from EndpointsData import load_endpoints_data
+
+build_dir = os.path.dirname(os.path.abspath(__file__))
+
+generators = []
+for path in sorted(glob.glob(os.path.join(build_dir, "generate*.py"))):
+    module_name = os.path.basename(path).removesuffix(".py").replace("-", "_")
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    generators.append(module)
+
+parser = argparse.ArgumentParser()
+for module in generators:
+    if hasattr(module, "add_arguments"):
+        module.add_arguments(parser)
+args = parser.parse_args()
+
+data = load_endpoints_data()
+
+for module in generators:
+    module.generate(data, args)
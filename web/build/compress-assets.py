@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+# Compresses the generated downloads and tooltips in web/zola/static with
+# gzip and (if the brotli module is installed) brotli, in parallel, writing
+# <file>.gz / <file>.br next to each file.
+#
+# Compressed data is kept in a content-addressed cache (<sha256>.gz / .br,
+# outside the static tree), so a file whose content didn't change isn't
+# compressed again. Outputs are only rewritten if their content changed,
+# which keeps their mtime, so `aws s3 sync` only uploads what changed.
+# The cache directory is not in git; the deploy workflow keeps it between
+# runs with actions/cache.
+#
+# scripts/build.sh passes --no-brotli: the files are deployed with a plain
+# `aws s3 sync`, which doesn't set Content-Encoding.
+#
+# The manifest (assets-manifest.json in the static directory) lists each
+# file with its SHA-256, size and compressed variants.
+
+import argparse
+import concurrent.futures
+import glob
+import gzip
+import hashlib
+import json
+import os
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+static_dir = "web/zola/static"
+manifest_file = "assets-manifest.json"
+
+# Files to compress, relative to static_dir
+default_patterns = [
+    "endpoints.sqlite",
+    "endpoints.json",
+    "endpoints.text",
+    "endpoints-matrix/assets/endpoints-matrix.json",
+    "endpoints-services/*.html",
+]
+
+# Cached files not used by a build for this long are removed
+CACHE_MAX_AGE = 30 * 86400
+
+# gzip output doesn't contain a timestamp, so the same content always
+# compresses to the same bytes
+GZIP_MTIME = 0
+
+
+def compress(encoding, data):
+    if encoding == "gz":
+        return gzip.compress(data, compresslevel=9, mtime=GZIP_MTIME)
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    raise ValueError(f"unknown encoding: {encoding}")
+
+
+def compress_to_cache(encoding, source_path, digest, cache_dir):
+    """Compress a file into the cache (runs in a worker process)."""
+    with open(source_path, "rb") as f:
+        data = f.read()
+
+    cache_path = os.path.join(cache_dir, f"{digest}.{encoding}")
+    tmp_path = f"{cache_path}.tmp.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(compress(encoding, data))
+    os.replace(tmp_path, cache_path)
+
+    return cache_path
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def install(cache_path, output_path):
+    """Copy a cached file to output_path, unless it already has that content."""
+    with open(cache_path, "rb") as f:
+        data = f.read()
+
+    if os.path.exists(output_path):
+        with open(output_path, "rb") as f:
+            if f.read() == data:
+                return False
+
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, output_path)
+    return True
+
+
+def prune_cache(cache_dir, used_files):
+    """Mark used cache files as used now, and remove ones unused for CACHE_MAX_AGE."""
+    now = time.time()
+    for file_name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, file_name)
+        if file_name in used_files:
+            os.utime(path, (now, now))
+        elif os.path.getmtime(path) < now - CACHE_MAX_AGE:
+            os.remove(path)
+
+
+def load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--static-dir", default=static_dir, help=f"directory of the files (default: {static_dir})")
+    parser.add_argument("--cache-dir", default="web/zola/assets-cache", help="content-addressed cache of compressed files (default: web/zola/assets-cache)")
+    parser.add_argument("--pattern", action="append", metavar="GLOB", help="files to compress, relative to the static directory (repeatable; default: downloads and tooltips)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), metavar="N", help="parallel compression processes (default: number of CPUs)")
+    parser.add_argument("--no-brotli", action="store_true", help="only write gzip files")
+    args = parser.parse_args()
+
+    encodings = ["gz"]
+    if brotli is not None and not args.no_brotli:
+        encodings.append("br")
+    elif not args.no_brotli:
+        print("WARNING: brotli module not installed, only writing gzip files")
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    manifest_path = os.path.join(args.static_dir, manifest_file)
+    old_manifest = load_manifest(manifest_path)
+
+    names = sorted({
+        os.path.relpath(path, args.static_dir)
+        for pattern in args.pattern or default_patterns
+        for path in glob.glob(os.path.join(args.static_dir, pattern))
+        if os.path.isfile(path) and os.path.basename(path) != manifest_file
+    })
+
+    digests = {name: file_digest(os.path.join(args.static_dir, name)) for name in names}
+
+    # compress what isn't cached yet; the same content is compressed once
+    jobs = {}
+    for name, digest in digests.items():
+        for encoding in encodings:
+            if not os.path.exists(os.path.join(args.cache_dir, f"{digest}.{encoding}")):
+                jobs.setdefault((encoding, digest), os.path.join(args.static_dir, name))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(compress_to_cache, encoding, source_path, digest, args.cache_dir)
+            for (encoding, digest), source_path in jobs.items()
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            future.result()
+
+    manifest = {}
+    written_count = 0
+    for name, digest in digests.items():
+        source_path = os.path.join(args.static_dir, name)
+        entry = {
+            "sha256": digest,
+            "size": os.path.getsize(source_path),
+        }
+
+        for encoding in encodings:
+            cache_path = os.path.join(args.cache_dir, f"{digest}.{encoding}")
+            written_count += install(cache_path, f"{source_path}.{encoding}")
+            entry[encoding] = {
+                "file": f"{name}.{encoding}",
+                "size": os.path.getsize(cache_path),
+            }
+
+        manifest[name] = entry
+
+    # remove outputs of files that are gone (e.g. tooltips of removed
+    # services), or of an encoding no longer written
+    current_outputs = {
+        entry[encoding]["file"]
+        for entry in manifest.values()
+        for encoding in encodings
+    }
+    for entry in old_manifest.values():
+        for encoding in ["gz", "br"]:
+            if encoding in entry and entry[encoding]["file"] not in current_outputs:
+                output_path = os.path.join(args.static_dir, entry[encoding]["file"])
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+
+    prune_cache(args.cache_dir, {
+        f"{digest}.{encoding}" for digest in digests.values() for encoding in encodings
+    })
+
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+        f.write("\n")
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    print(f"Compressed assets: {len(names)} files, {len(jobs)} compressed, {written_count} outputs updated ({', '.join(encodings)})")
+
+
+if __name__ == "__main__":
+    main()
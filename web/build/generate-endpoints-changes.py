@@ -1,48 +1,120 @@
 #!/usr/bin/env python3
 
+import argparse
 import os
-import re
 import html
+import sys
 
-html_out = f'''
-    <!-- file: {os.path.basename(__file__)} -->
-
-    <h1>Recent changes in public API endpoints</h1>
-
-    <div class="text-xs text-gray-500 dark:text-gray-400 font-light max-w-prose">
-        This list is presented in <code>diff</code>-style output: Every
-        endpoint beginning with a <code>+</code> was added, and every
-        endpoint beginning with a <code>-</code> was removed &ndash; or
-        changed, when paired with a <code>+</code> line.
-    </div>
-
-    <div>
-'''
-
-with open("web/zola/static/changes") as f:
-    data_tags_open = False
-    date_count = 0
-    for line in f.readlines():
-        line = line.strip()
-        if re.match(r'^\d', line):
-            if data_tags_open:
-                html_out += '</ul>'
-                data_tags_open = False
-
-            # new date
-            date_count += 1
-            if date_count > 30:
-                break
-
-            html_out += f'<div id="changes-date-{line}" class="text-sm mt-3">{line}</div>\n'
-            html_out += f'<ul id="changes-data-{line}" class="text-xs ml-3">\n'
-            data_tags_open = True
-
-        else:
-            line = re.sub(r'^(.)', r'\1 ', line) # add space
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(repo_dir, "update-data"))
+
+from Changes import ChangesStore
+
+CHANGES_PATH = "web/zola/static/changes.sqlite"
+
+# Changes in these partitions are left out (China: these used to be filtered
+# by hostname, *.amazonaws.com.cn / *.amazonwebservices.com.cn)
+EXCLUDED_PARTITIONS = ['aws-cn']
+
+# Number of dates shown
+DATE_COUNT = 30
+
+KIND_DESCRIPTIONS = {
+    'added': 'new endpoint',
+    'removed': 'endpoint removed',
+    'dualstack_added': 'new dualstack endpoint',
+    'dualstack_removed': 'dualstack endpoint removed',
+    'ipv6_gained': 'IPv6 added',
+    'ipv6_lost': 'IPv6 removed',
+    'changed': 'endpoint changed',
+}
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--changes-exclude-partition",
+        action="append",
+        metavar="PARTITION",
+        help=f"leave out changes in this partition (default: {', '.join(EXCLUDED_PARTITIONS)})",
+    )
+
+
+def endpoint_str(hostname, has_ipv4, has_ipv6):
+    tags = [tag for tag, has_tag in [('ipv4', has_ipv4), ('ipv6', has_ipv6)] if has_tag]
+    return html.escape(f'{hostname} [{", ".join(tags)}]')
+
+
+def event_html(event):
+    old = endpoint_str(*event.old)
+    new = endpoint_str(*event.new)
+
+    match event.kind:
+        case 'added' | 'dualstack_added':
+            endpoints = new
+        case 'removed' | 'dualstack_removed':
+            endpoints = old
+        case 'ipv6_gained' | 'ipv6_lost' if event.old[0] == event.new[0]:
+            endpoints = new
+        case _:
+            endpoints = f'{old} &rarr; {new}'
+
+    return (
+        f'<li><code>{html.escape(event.service)}</code> @ {html.escape(event.region)}: '
+        f'{KIND_DESCRIPTIONS[event.kind]} ({event.variant}) <code>{endpoints}</code></li>\n'
+    )
+
+
+def generate(data, args):
+    excluded_partitions = args.changes_exclude_partition or EXCLUDED_PARTITIONS
+
+    html_out = f'''
+        <!-- file: {os.path.basename(__file__)} -->
+
+        <h1>Recent changes in public API endpoints</h1>
+
+        <div class="text-xs text-gray-500 dark:text-gray-400 font-light max-w-prose">
+            Each entry is a change of one service endpoint in one region.
+            Older entries are presented in <code>diff</code>-style output: Every
+            endpoint beginning with a <code>+</code> was added, and every
+            endpoint beginning with a <code>-</code> was removed &ndash; or
+            changed, when paired with a <code>+</code> line.
+        </div>
+
+        <div>
+    '''
+
+    if os.path.exists(CHANGES_PATH):
+        changes = ChangesStore(CHANGES_PATH, read_only=True)
+    else:
+        # e.g. a build without update run; the page is generated without changes
+        print(f"WARNING: {CHANGES_PATH} not found, no changes listed")
+        changes = None
+
+    dates = changes.dates(excluded_partitions, limit=DATE_COUNT) if changes is not None else []
+
+    for change_date in dates:
+        html_out += f'<div id="changes-date-{change_date}" class="text-sm mt-3">{change_date}</div>\n'
+        html_out += f'<ul id="changes-data-{change_date}" class="text-xs ml-3">\n'
+
+        for event in changes.events(change_date, excluded_partitions):
+            html_out += event_html(event)
+
+        for line in changes.legacy_lines(change_date):
+            line = line[:1] + ' ' + line[1:] # add space
             html_out += f'<li><code>{html.escape(line)}</code></li>\n'
 
-html_out += '</ul>\n'
-html_out += '</div>\n'
+        html_out += '</ul>\n'
+
+    html_out += '</div>\n'
+
+    if changes is not None:
+        changes.close()
+
+    open("web/zola/generated/endpoints-changes.html", 'w').write(html_out)
+
 
-open("web/zola/generated/endpoints-changes.html", 'w').write(html_out)
+if __name__ == "__main__":
+    # doesn't need endpoint data
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    generate(None, parser.parse_args())
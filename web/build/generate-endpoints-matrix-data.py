@@ -0,0 +1,82 @@
+# Compact data file for the endpoints matrix, so the browser doesn't have to
+# download the whole SQLite file.
+#
+# Format (JSON):
+#
+#   services:  list of service names
+#   regions:   list of [region_name, partition_name, description]
+#   templates: list of hostname templates (see update-data/Hostnames.py),
+#              with "{region}" in place of the region name and "{service}"
+#              in place of a first label that is the service name (e.g.
+#              "{service}.{region}.amazonaws.com"); hostnames that don't
+#              fit a template are listed literally
+#   flags:     string with one hex digit per cell -- bit 0: default has IPv4,
+#              bit 1: default has IPv6, bit 2: dualstack has IPv4, bit 3:
+#              dualstack has IPv6
+#   default:   per cell, 1 + index into templates of the default hostname,
+#              or 0 if there is none
+#   dualstack: same for the dualstack hostname
+#
+# Cells are ordered service-major: cell = service_index * len(regions) + region_index
+
+import argparse
+import json
+import os
+import sys
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.join(repo_dir, "update-data"))
+
+from EndpointsData import load_endpoints_data
+from Hostnames import HostnameTemplates
+
+
+def generate(data, args):
+    regions = [
+        [region_name, region['partition_name'], region['description']]
+        for region_name, region in data['regions'].items()
+    ]
+    region_index = {region_name: i for i, region_name in enumerate(data['regions'])}
+
+    services = data['services']
+    service_index = {service_name: i for i, service_name in enumerate(services)}
+
+    cell_count = len(services) * len(regions)
+    flags = [0] * cell_count
+    hostnames = {
+        'default': [0] * cell_count,
+        'dualstack': [0] * cell_count,
+    }
+
+    # template ids start at 1, so 0 can stand for "no hostname"
+    templates = HostnameTemplates()
+
+    for row in data['endpoints']:
+        cell = service_index[row['service_name']] * len(regions) + region_index[row['region_name']]
+
+        flags[cell] = (
+            (1 if row['endpoint_default_has_ipv4'] else 0)
+            | (2 if row['endpoint_default_has_ipv6'] else 0)
+            | (4 if row['endpoint_dualstack_has_ipv4'] else 0)
+            | (8 if row['endpoint_dualstack_has_ipv6'] else 0)
+        )
+
+        for variant in ['default', 'dualstack']:
+            template_id = templates.id_for(row[f'endpoint_{variant}_hostname'], row['service_name'], row['region_name'])
+            hostnames[variant][cell] = template_id or 0
+
+    matrix_data = {
+        'services': services,
+        'regions': regions,
+        'templates': templates.templates,
+        'flags': ''.join(f'{f:x}' for f in flags),
+        'default': hostnames['default'],
+        'dualstack': hostnames['dualstack'],
+    }
+
+    with open("web/zola/static/endpoints-matrix/assets/endpoints-matrix.json", 'w') as f:
+        json.dump(matrix_data, f, separators=(',', ':'))
+
+
+if __name__ == "__main__":
+    generate(load_endpoints_data(), argparse.ArgumentParser().parse_args())
@@ -1,5 +1,6 @@
 # Yes, this file could have been a static HTML file.
 
+import argparse
 import os
 
 html = f'''
@@ -60,8 +61,13 @@ html = f'''
         </div> <!-- main-content -->
     </div> <!-- everything -->
 
-    <script defer src="assets/sql.js/sql-wasm.js"></script>
     <script defer src="assets/endpoints-matrix.js"></script>
 '''
 
-open("web/zola/generated/endpoints-matrix.html", 'w').write(html)
+def generate(data, args):
+    open("web/zola/generated/endpoints-matrix.html", 'w').write(html)
+
+
+if __name__ == "__main__":
+    # doesn't need endpoint data
+    generate(None, argparse.ArgumentParser().parse_args())
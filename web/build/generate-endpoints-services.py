@@ -1,193 +1,218 @@
 #!/usr/bin/env python3
 
-import os
-import sqlite3
-
-epdb = sqlite3.connect("web/zola/static/endpoints.sqlite")
-epdb.row_factory = sqlite3.Row
-
-region_count = epdb.execute("SELECT count(*) AS c FROM region").fetchone()["c"]
-
-cur = epdb.execute("""
-    WITH s AS (
-        SELECT
-            service_name,
-            sum(endpoint_default_has_ipv6) as ipv6_default_count,
-            sum(endpoint_dualstack_has_ipv6) as ipv6_dualstack_count,
-            sum(endpoint_default_has_ipv4) as count_active
-        FROM endpoint
-        WHERE partition_name = 'aws'
-        GROUP BY service_name
+import argparse
+import itertools
+
+from EndpointsData import load_endpoints_data
+
+tooltip_dir = "web/zola/static/endpoints-services"
+tooltip_bundle_file = "endpoints-services-tooltips.html"
+
+
+def add_arguments(parser):
+    parser.add_argument(
+        "--bundle-tooltips",
+        action="store_true",
+        help="write all service tooltips to a single file instead of one file per service",
     )
 
-    SELECT
-        service_name,
-        CASE
-            WHEN ipv6_default_count > 0 AND ipv6_default_count = count_active THEN 'all_ipv6_default'
-            WHEN ipv6_dualstack_count > 0 AND ipv6_dualstack_count = count_active THEN 'all_ipv6_dualstack'
-            WHEN ipv6_default_count = 0 AND ipv6_dualstack_count = 0 THEN 'all_ipv4_only'
-            ELSE 'mixed'
-        END AS category
-    FROM s
-    WHERE count_active > 0
-""")
-
-service_categories = {'all_ipv6_default': 0, 'all_ipv6_dualstack': 0, 'mixed': 0, 'all_ipv4_only': 0}
-total_services = 0
-
-for row in cur.fetchall():
-    total_services += 1
-    service_categories[row['category']] += 1
-
-# Build pie chart. Note: The angles are given as percentages, not degrees.
-colors = {
-    'all_ipv6_default': 'var(--color-endpoint-ipv6)',
-    'all_ipv6_dualstack': 'var(--color-endpoint-ipv6-dualstack)',
-    'mixed': 'var(--color-endpoint-mixed)',
-    'all_ipv4_only': 'var(--color-endpoint-ipv4)',
-}
-parts = []
-angles = {}
-current_angle = 0
-cat_count_str = {}
-for cat in ['all_ipv6_default', 'all_ipv6_dualstack', 'mixed', 'all_ipv4_only']:
-    cat_percent = (service_categories[cat] / total_services) * 100
-    parts.append(f'{colors[cat]} {current_angle:.1f}% {current_angle + cat_percent:.1f}%')
-
-    cat_count_str[cat] = f'{service_categories[cat]} service{"" if service_categories[cat] == 1 else "s"} ({cat_percent:.0f}%)'
-
-    current_angle += cat_percent
-
-pie_conic_gradient_str = ", ".join(parts)
-
-# -----
-
-html = f'''
-    <h1>Summary</h1>
-    <div class="text-sm max-w-prose">
-        This summary chart shows how many AWS services support IPv6 client applications
-        on their public API endpoints.
-    </div>
-
-    <div class="flex flex-col md:flex-row gap-4">
-        <div class="pie-chart-container">
-            <div class="pie-chart" style="background: conic-gradient({pie_conic_gradient_str});"></div>
+
+def service_category(counts):
+    match counts:
+        case c if c['ipv6_default'] > 0 and c['ipv6_default'] == c['ipv4_default']:
+            return 'all_ipv6_default'
+        case c if c['ipv6_dualstack'] > 0 and c['ipv6_dualstack'] == c['ipv4_default']:
+            return 'all_ipv6_dualstack'
+        case c if c['ipv6_default'] == 0 and c['ipv6_dualstack'] == 0:
+            return 'all_ipv4_only'
+        case _:
+            return 'mixed'
+
+
+def region_class(r):
+    match r:
+        case r if r['endpoint_default_has_ipv6']:
+            return "endpoint-ipv6"
+        case r if r['endpoint_dualstack_has_ipv6']:
+            return "endpoint-ipv6-dualstack"
+        case r if r['endpoint_default_has_ipv4'] or r['endpoint_dualstack_has_ipv4']:
+            return "endpoint-ipv4"
+        case _:
+            return "endpoint-nx"
+
+
+def tooltip_hx_get(service_name, bundle_tooltips):
+    if bundle_tooltips:
+        # the browser fetches the bundle once, htmx picks the service's part
+        return f'hx-get="{tooltip_bundle_file}" hx-select="#service-tooltip-content-{service_name}"'
+
+    return f'hx-get="endpoints-services-tooltip-{service_name}.html"'
+
+
+def generate(data, args):
+    service_categories = {'all_ipv6_default': 0, 'all_ipv6_dualstack': 0, 'mixed': 0, 'all_ipv4_only': 0}
+    total_services = 0
+
+    for counts in data['partition_service_counts'].get('aws', {}).values():
+        if counts['ipv4_default'] == 0:
+            continue
+
+        total_services += 1
+        service_categories[service_category(counts)] += 1
+
+    # Build pie chart. Note: The angles are given as percentages, not degrees.
+    colors = {
+        'all_ipv6_default': 'var(--color-endpoint-ipv6)',
+        'all_ipv6_dualstack': 'var(--color-endpoint-ipv6-dualstack)',
+        'mixed': 'var(--color-endpoint-mixed)',
+        'all_ipv4_only': 'var(--color-endpoint-ipv4)',
+    }
+    parts = []
+    angles = {}
+    current_angle = 0
+    cat_count_str = {}
+    for cat in ['all_ipv6_default', 'all_ipv6_dualstack', 'mixed', 'all_ipv4_only']:
+        cat_percent = (service_categories[cat] / total_services) * 100
+        parts.append(f'{colors[cat]} {current_angle:.1f}% {current_angle + cat_percent:.1f}%')
+
+        cat_count_str[cat] = f'{service_categories[cat]} service{"" if service_categories[cat] == 1 else "s"} ({cat_percent:.0f}%)'
+
+        current_angle += cat_percent
+
+    pie_conic_gradient_str = ", ".join(parts)
+
+    # -----
+
+    html = f'''
+        <h1>Summary</h1>
+        <div class="text-sm max-w-prose">
+            This summary chart shows how many AWS services support IPv6 client applications
+            on their public API endpoints.
         </div>
-        <div class="pie-legend self-center">
-            <div class="pie-legend-item">
-                <span class="pie-legend-color endpoint-ipv6"></span>
-                IPv6 by default: {cat_count_str["all_ipv6_default"]}
-            </div>
-            <div class="pie-legend-item">
-                <span class="pie-legend-color endpoint-ipv6-dualstack"></span>
-                IPv6 with SDK opt-in: {cat_count_str["all_ipv6_dualstack"]}
-            </div>
-            <div class="pie-legend-item">
-                <span class="pie-legend-color endpoint-mixed"></span>
-                Inconsistent across regions: {cat_count_str["mixed"]}
-            </div>
-            <div class="pie-legend-item">
-                <span class="pie-legend-color endpoint-ipv4"></span>
-                IPv4 only: {cat_count_str["all_ipv4_only"]}
+
+        <div class="flex flex-col md:flex-row gap-4">
+            <div class="pie-chart-container">
+                <div class="pie-chart" style="background: conic-gradient({pie_conic_gradient_str});"></div>
             </div>
-            <div class="text-xs text-gray-400 dark:text-gray-500 max-w-prose">
-                Services total: {total_services}. Data for AWS commercial regions only, as
-                there are significant differences for the other AWS partitions (China /
-                GovCloud / "Secret Cloud" / EU Sovereign Cloud).
+            <div class="pie-legend self-center">
+                <div class="pie-legend-item">
+                    <span class="pie-legend-color endpoint-ipv6"></span>
+                    IPv6 by default: {cat_count_str["all_ipv6_default"]}
+                </div>
+                <div class="pie-legend-item">
+                    <span class="pie-legend-color endpoint-ipv6-dualstack"></span>
+                    IPv6 with SDK opt-in: {cat_count_str["all_ipv6_dualstack"]}
+                </div>
+                <div class="pie-legend-item">
+                    <span class="pie-legend-color endpoint-mixed"></span>
+                    Inconsistent across regions: {cat_count_str["mixed"]}
+                </div>
+                <div class="pie-legend-item">
+                    <span class="pie-legend-color endpoint-ipv4"></span>
+                    IPv4 only: {cat_count_str["all_ipv4_only"]}
+                </div>
+                <div class="text-xs text-gray-400 dark:text-gray-500 max-w-prose">
+                    Services total: {total_services}. Data for AWS commercial regions only, as
+                    there are significant differences for the other AWS partitions (China /
+                    GovCloud / "Secret Cloud" / EU Sovereign Cloud).
+                </div>
             </div>
         </div>
-    </div>
-'''
-
-cur = epdb.execute("""
-    SELECT
-        service_name,
-        sum(endpoint_default_has_ipv6) as ipv6_default_count,
-        sum(case when endpoint_dualstack_has_ipv6 and not endpoint_default_has_ipv6 then 1 else 0 end) as ipv6_dualstack_count,
-        sum(case when endpoint_default_has_ipv4 and not endpoint_default_has_ipv6 and not endpoint_dualstack_has_ipv6 then 1 else 0 end) as ipv4_count,
-        sum(case when endpoint_default_has_ipv4 or endpoint_dualstack_has_ipv4 then 1 else 0 end) as count_active
-    FROM endpoint
-    GROUP BY service_name
-    HAVING count_active > 0
-    ORDER BY
-        service_name
-""")
-
-html += f'''
-    <h1>IPv6 Progress by Service</h1>
-    <div class="text-xs text-gray-400 dark:text-gray-500 max-w-prose">
-        This shows, for each service and IPv6 support level, the number of regions (including other AWS partitions). Hover for details.
-    </div>
-    <div class="mt-2"> <table class="progress-table font-light">
-        <thead>
-            <tr class="text-left">
-                <th>Service</th>
-                <th>IPv6 support &mdash; by default / opt-in / ipv4-only</th>
-            </tr>
-        </thead>
+    '''
 
-        <tbody>
-'''
+    # ----- tooltips -----
+    # data['endpoints'] is ordered by service, so group it by service
 
-for row in cur.fetchall():
-    percentages = {}
-    for cat in ['ipv6_default', 'ipv6_dualstack', 'ipv4']:
-        percentages[cat] = row[f'{cat}_count'] * 100 / region_count
+    tooltips = {}
+    for service_name, service_regions in itertools.groupby(data['endpoints'], key=lambda r: r['service_name']):
+        # a class, not an id: bundled (and loaded) tooltips share one page
+        html_tooltip  = f'<div class="status-bar-content p-2 grid grid-cols-1">'
+        html_tooltip += f'<div class="font-semibold">{service_name}</div>'
+        html_tooltip += f'<div class="flex flex-wrap text-xs font-light">'
 
-    html += f'''
-        <tr class="progress-table-row">
-            <td>{row['service_name']}</td>
-            <td class="progress-table-cell">
-                <div
-                    class="progress-bar tooltip-container"
-                    hx-get="endpoints-services-tooltip-{row['service_name']}.html"
-                    hx-target="#service-tooltip-{row['service_name']}"
-                    hx-trigger="mouseover once"
-                    hx-swap="innerHTML"
-                >
-                    <div class="progress-bar-segment endpoint-ipv6" style="width: {percentages['ipv6_default']:.1f}%" title="service count ipv6-default: {row['ipv6_default_count']} ({percentages['ipv6_default']:.1f}%)"></div>
-                    <div class="progress-bar-segment endpoint-ipv6-dualstack" style="width: {percentages['ipv6_dualstack']:.1f}%" title="service count ipv6-opt-in: {row['ipv6_dualstack_count']} ({percentages['ipv6_dualstack']:.1f}%)"></div>
-                    <div class="progress-bar-segment endpoint-ipv4" style="width: {percentages['ipv4']:.1f}%" title="service count ipv4-only: {row['ipv4_count']} ({percentages['ipv4']:.1f}%)"></div>
-                    <div id="service-tooltip-{row['service_name']}" class="tooltip">Loading ...</div>
-                </div>
-            </td>
-        </tr>
-    '''
+        for region in service_regions:
+            html_tooltip += f'<span class="border px-3 text-nowrap border-gray-500 rounded-sm {region_class(region)}">{region["region_name"]}</span>\n'
 
-    # ----- write tooltip -----
+        html_tooltip += f'</div>' # service details / regions
+        html_tooltip += f'</div>' # stauts-bar-content
 
-    service_regions = epdb.execute("""
-        SELECT *
-        FROM endpoint
-        WHERE service_name = ?
-        ORDER BY region_name
-    """, (row['service_name'],)).fetchall()
+        tooltips[service_name] = html_tooltip
 
-    region_class = {}
-    for region in service_regions:
-        match region:
-            case r if r['endpoint_default_has_ipv6']:
-                region_class[region['region_name']] = "endpoint-ipv6"
-            case r if r['endpoint_dualstack_has_ipv6']:
-                region_class[region['region_name']] = "endpoint-ipv6-dualstack"
-            case r if r['endpoint_default_has_ipv4'] or r['endpoint_dualstack_has_ipv4']:
-                region_class[region['region_name']] = "endpoint-ipv4"
-            case _:
-                region_class[region['region_name']] = "endpoint-nx"
+    # -----
+
+    html += f'''
+        <h1>IPv6 Progress by Service</h1>
+        <div class="text-xs text-gray-400 dark:text-gray-500 max-w-prose">
+            This shows, for each service and IPv6 support level, the number of regions (including other AWS partitions). Hover for details.
+        </div>
+        <div class="mt-2"> <table class="progress-table font-light">
+            <thead>
+                <tr class="text-left">
+                    <th>Service</th>
+                    <th>IPv6 support &mdash; by default / opt-in / ipv4-only</th>
+                </tr>
+            </thead>
+
+            <tbody>
+    '''
+
+    table_services = []
+    for service_name, counts in data['service_counts'].items():
+        if counts['active'] == 0:
+            continue
+
+        table_services.append(service_name)
+        row = {
+            'service_name': service_name,
+            'ipv6_default_count': counts['ipv6_default'],
+            'ipv6_dualstack_count': counts['ipv6_opt_in'],
+            'ipv4_count': counts['ipv4_only'],
+        }
+
+        percentages = {}
+        for cat in ['ipv6_default', 'ipv6_dualstack', 'ipv4']:
+            percentages[cat] = row[f'{cat}_count'] * 100 / len(data['regions'])
+
+        html += f'''
+            <tr class="progress-table-row">
+                <td>{row['service_name']}</td>
+                <td class="progress-table-cell">
+                    <div
+                        class="progress-bar tooltip-container"
+                        {tooltip_hx_get(row['service_name'], args.bundle_tooltips)}
+                        hx-target="#service-tooltip-{row['service_name']}"
+                        hx-trigger="mouseover once"
+                        hx-swap="innerHTML"
+                    >
+                        <div class="progress-bar-segment endpoint-ipv6" style="width: {percentages['ipv6_default']:.1f}%" title="service count ipv6-default: {row['ipv6_default_count']} ({percentages['ipv6_default']:.1f}%)"></div>
+                        <div class="progress-bar-segment endpoint-ipv6-dualstack" style="width: {percentages['ipv6_dualstack']:.1f}%" title="service count ipv6-opt-in: {row['ipv6_dualstack_count']} ({percentages['ipv6_dualstack']:.1f}%)"></div>
+                        <div class="progress-bar-segment endpoint-ipv4" style="width: {percentages['ipv4']:.1f}%" title="service count ipv4-only: {row['ipv4_count']} ({percentages['ipv4']:.1f}%)"></div>
+                        <div id="service-tooltip-{row['service_name']}" class="tooltip">Loading ...</div>
+                    </div>
+                </td>
+            </tr>
+        '''
 
-    html_tooltip  = f'<div id="status-bar-content" class="p-2 grid grid-cols-1">'
-    html_tooltip += f'<div class="font-semibold">{row['service_name']}</div>'
-    html_tooltip += f'<div class="flex flex-wrap text-xs font-light">'
+    html += '</tbody>\n'
+    html += '</table> </div>\n'
 
-    for region in service_regions:
-        html_tooltip += f'<span class="border px-3 text-nowrap border-gray-500 rounded-sm {region_class[region["region_name"]]}">{region["region_name"]}</span>\n'
+    open("web/zola/generated/endpoints-services.html", 'w').write(html)
 
-    html_tooltip += f'</div>' # service details / regions
-    html_tooltip += f'</div>' # stauts-bar-content
+    # ----- write tooltips -----
 
-    open(f"web/zola/static/endpoints-services/endpoints-services-tooltip-{row['service_name']}.html", 'w').write(html_tooltip)
+    if args.bundle_tooltips:
+        with open(f"{tooltip_dir}/{tooltip_bundle_file}", 'w') as f:
+            f.writelines(
+                f'<div id="service-tooltip-content-{service_name}">{tooltips[service_name]}</div>\n'
+                for service_name in table_services
+            )
+    else:
+        for service_name in table_services:
+            with open(f"{tooltip_dir}/endpoints-services-tooltip-{service_name}.html", 'w') as f:
+                f.write(tooltips[service_name])
 
-html += '</tbody>\n'
-html += '</table> </div>\n'
 
-open("web/zola/generated/endpoints-services.html", 'w').write(html)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    generate(load_endpoints_data(), parser.parse_args())
@@ -1,24 +1,48 @@
-async function initSqliteFile() {
-    if (this.endpointsSqliteDatabase) return; // already loaded
+async function initEndpointsData() {
+    if (this.endpointsData) return; // already loaded
 
-    document.getElementById('matrix-table-caption').textContent = 'Fetching EPDB ...';
+    document.getElementById('matrix-table-caption').textContent = 'Fetching endpoints data ...';
 
-    const [fetchResponse, SQL] = await Promise.all([
-        fetch('assets/endpoints.sqlite--but.cloudfront.does.not.want.to.compress.binary.data.so.lets.just.call.it.xml'),
-        initSqlJs({ locateFile: file => `assets/sql.js/${file}` }),
-    ]);
+    const fetchResponse = await fetch('assets/endpoints-matrix.json');
 
     if (!fetchResponse.ok) {
-        document.getElementById('matrix-table-caption').textContent = 'Could not load SQLite file.';
+        document.getElementById('matrix-table-caption').textContent = 'Could not load endpoints data.';
         return;
     }
 
-    const dbFileContents = new Uint8Array(await fetchResponse.arrayBuffer());
-    this.endpointsSqliteDatabase = new SQL.Database(dbFileContents);
+    // see web/build/generate-endpoints-matrix-data.py for the format
+    this.endpointsData = await fetchResponse.json();
+    this.serviceIndex = Object.fromEntries(this.endpointsData.services.map((s, i) => [s, i]));
+    this.regionIndex = Object.fromEntries(this.endpointsData.regions.map((r, i) => [r[0], i]));
 
     initRegions();
 }
 
+// Expands a hostname template like update-data/Hostnames.py expand_hostname()
+function endpointHostname(templateRef, serviceName, regionName) {
+    if (!templateRef) return null;
+    return this.endpointsData.templates[templateRef - 1]
+        .replaceAll('{service}', serviceName)
+        .replaceAll('{region}', regionName);
+}
+
+function getEndpointRow(serviceName, regionName) {
+    const data = this.endpointsData;
+    const cell = this.serviceIndex[serviceName] * data.regions.length + this.regionIndex[regionName];
+    const flags = parseInt(data.flags[cell], 16);
+
+    return {
+        service_name: serviceName,
+        region_name: regionName,
+        endpoint_default_hostname: endpointHostname(data.default[cell], serviceName, regionName),
+        endpoint_default_has_ipv4: flags & 1 ? 1 : 0,
+        endpoint_default_has_ipv6: flags & 2 ? 1 : 0,
+        endpoint_dualstack_hostname: endpointHostname(data.dualstack[cell], serviceName, regionName),
+        endpoint_dualstack_has_ipv4: flags & 4 ? 1 : 0,
+        endpoint_dualstack_has_ipv6: flags & 8 ? 1 : 0,
+    };
+}
+
 function copyToClipboard(text, element) {
     navigator.clipboard.writeText(text).then(() => {
         if (element) {
@@ -75,14 +99,8 @@ function setSelectedRegions(regionList) {
 }
 
 function initRegions() {
-    const res = this.endpointsSqliteDatabase.exec(`
-        SELECT region_name, partition_name, description
-        FROM region
-        ORDER BY region_name
-    `);
-
     this.allRegions = {};
-    for (const row of res[0].values) {
+    for (const row of this.endpointsData.regions) {
         const [regionName, partitionName, description] = row;
         const geoMatch = description.match(/\((.*)\)\s*$/);
         const shortDescription = geoMatch ? geoMatch[1] : description;
@@ -97,30 +115,11 @@ function initRegions() {
 }
 
 function loadEndpointsTable() {
-    document.getElementById('matrix-table-caption').textContent = 'Loading EPDB ...';
+    document.getElementById('matrix-table-caption').textContent = 'Building endpoints table ...';
 
     const regionNamesOrdered = this.selectedRegions.toSorted();
 
-    const serviceNamesOrdered = this.endpointsSqliteDatabase.exec(`
-        SELECT DISTINCT service_name
-        FROM endpoint
-        ORDER BY service_name
-    `)[0].values.map(r => r[0]);
-
-    const stmt = this.endpointsSqliteDatabase.prepare(`
-        SELECT
-            service_name,
-            region_name,
-            endpoint_default_hostname,
-            endpoint_default_has_ipv6,
-            endpoint_default_has_ipv4,
-            endpoint_dualstack_hostname,
-            endpoint_dualstack_has_ipv6,
-            endpoint_dualstack_has_ipv4
-        FROM endpoint e
-        WHERE e.service_name = ?
-        AND e.region_name = ?
-    `);
+    const serviceNamesOrdered = this.endpointsData.services;
 
     // -----
 
@@ -145,7 +144,7 @@ function loadEndpointsTable() {
         tr.appendChild(document.createElement('th')).textContent = serviceName;
 
         for (const regionName of regionNamesOrdered) {
-            const row = stmt.getAsObject([serviceName, regionName]);
+            const row = getEndpointRow(serviceName, regionName);
             const td = tr.insertCell(-1);
 
             // Add click-to-copy handler
@@ -180,8 +179,6 @@ function loadEndpointsTable() {
         }
     }
 
-    stmt.free();
-
     document.getElementById('matrix-table-head').replaceChildren(headTr);
     document.getElementById('matrix-table-body').replaceChildren(fragment);
     document.getElementById('matrix-table-caption').textContent = 'AWS Service APIs Public Endpoints';
@@ -383,7 +380,7 @@ document.addEventListener('keydown', function(event) {
     });
 });
 
-initSqliteFile().then(() => {
+initEndpointsData().then(() => {
     loadEndpointsTable();
     populateRegionDropdown();
 });